@@ -1,7 +1,8 @@
 from . import inosmi_ru
 from .exceptions import ArticleNotFound
+from .html_tools import make_soup
 
-__all__ = ['SANITIZERS', 'ArticleNotFound']
+__all__ = ['SANITIZERS', 'ArticleNotFound', 'make_soup']
 
 SANITIZERS = {
     'inosmi_ru': inosmi_ru.sanitize,
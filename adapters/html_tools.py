@@ -1,3 +1,13 @@
+import soupsieve
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    HTML_PARSER = 'html.parser'
+else:
+    HTML_PARSER = 'lxml'
+
 DEFAULT_BLACKLIST_TAGS = [
     'script',
     'time'
@@ -13,6 +23,18 @@ DEFAULT_UNWRAPLIST_TAGS = [
     'footer'
 ]
 
+DEFAULT_KEEP_ATTRS = {
+    'a': ['href'],
+    'img': ['src'],
+}
+
+
+def make_soup(html):
+    """Parse html with the fastest available backend, already parsed soup is returned as is."""
+    if isinstance(html, BeautifulSoup):
+        return html
+    return BeautifulSoup(html, HTML_PARSER)
+
 
 def remove_buzz_attrs(soup):
     """Remove all attributes except some special tags."""
@@ -44,3 +66,44 @@ def remove_all_tags(soup):
     """Unwrap all tags."""
     for tag in soup.find_all(True):
         tag.unwrap()
+
+
+class CleaningPlan:
+    """Compiled cleaning rules, applied to a subtree in a single walk.
+
+    remove_selectors are matched against each tag on its own, so they should
+    not rely on ancestors' classes or attributes, which may be already stripped.
+    """
+
+    def __init__(self, remove_selectors=(), blacklist=DEFAULT_BLACKLIST_TAGS,
+                 unwraplist=DEFAULT_UNWRAPLIST_TAGS, keep_attrs=DEFAULT_KEEP_ATTRS):
+        self.remove_selector = soupsieve.compile(', '.join(remove_selectors)) if remove_selectors else None
+        self.blacklist = frozenset(blacklist)
+        self.unwraplist = frozenset(unwraplist)
+        self.keep_attrs = {name: tuple(attrs) for name, attrs in keep_attrs.items()}
+
+    def _is_buzz(self, tag):
+        if tag.name in self.blacklist:
+            return True
+        return self.remove_selector is not None and self.remove_selector.match(tag)
+
+    def apply(self, root, plaintext=False):
+        """Clean root in place and return it.
+
+        With plaintext=True only buzz tags are removed: attributes and unwrapping
+        do not affect get_text(), so that work is skipped.
+        """
+        root.attrs = {}
+        for tag in root.find_all(True):
+            if tag.decomposed:
+                continue
+            if self._is_buzz(tag):
+                tag.decompose()
+                continue
+            if plaintext:
+                continue
+
+            tag.attrs = {name: tag.attrs.get(name) for name in self.keep_attrs.get(tag.name, ())}
+            if tag.name in self.unwraplist:
+                tag.unwrap()
+        return root
@@ -1,9 +1,23 @@
 from bs4 import BeautifulSoup
-import requests
-import pytest
 
 from .exceptions import ArticleNotFound
-from .html_tools import remove_buzz_attrs, remove_buzz_tags, remove_all_tags
+from .html_tools import CleaningPlan, make_soup, remove_buzz_attrs, remove_buzz_tags, remove_all_tags
+
+
+CLEANING_PLAN = CleaningPlan(remove_selectors=[
+    ".article__notice",
+    ".article__aggr",
+    "aside",
+    ".media__copyright",
+    ".article__meta",
+    ".article__info",
+    ".article__tags",
+    ".share",
+    ".social",
+    ".banner",
+    ".ads",
+    ".subscribe",
+])
 
 
 def _find_article_container(soup: BeautifulSoup):
@@ -37,34 +51,18 @@ def _pick_article_container(soup: BeautifulSoup):
 
 
 def sanitize(html, plaintext=False):
-    soup = BeautifulSoup(html, "html.parser")
+    """Принимает HTML-строку или уже разобранный BeautifulSoup (дерево будет изменено)."""
+    soup = make_soup(html)
 
     article = _pick_article_container(soup)
     if not article:
         raise ArticleNotFound()
 
-    article.attrs = {}
-
-    buzz_blocks = [
-        *article.select(".article__notice"),
-        *article.select(".article__aggr"),
-        *article.select("aside"),
-        *article.select(".media__copyright"),
-        *article.select(".article__meta"),
-        *article.select(".article__info"),
-        *article.select(".article__tags"),
-        *article.select(".share, .social, .banner, .ads, .subscribe"),
-    ]
-    for el in buzz_blocks:
-        el.decompose()
-
-    remove_buzz_attrs(article)
-    remove_buzz_tags(article)
+    CLEANING_PLAN.apply(article, plaintext=plaintext)
 
     if not plaintext:
         return article.prettify().strip()
     else:
-        remove_all_tags(article)
         return article.get_text(" ", strip=True)
 # def sanitize(html, plaintext=False):
 #     soup = BeautifulSoup(html, 'html.parser')
@@ -99,6 +97,8 @@ def sanitize(html, plaintext=False):
 
 
 def test_sanitize():
+    import requests
+
     resp = requests.get('https://inosmi.ru/economic/20190629/245384784.html')
     resp.raise_for_status()
     clean_text = sanitize(resp.text)
@@ -121,7 +121,57 @@ def test_sanitize():
     assert '<h1>' not in clean_plaintext
 
 
+def test_sanitize_parsed_soup():
+    html = (
+        '<html><head><title>Заголовок</title></head><body>'
+        '<article class="article"><h1>Заголовок</h1><div class="article__meta">мета</div>'
+        '<p>Текст <a href="/x" class="link">статьи</a>.</p><script>var x;</script></article>'
+        '</body></html>'
+    )
+    soup = make_soup(html)
+    assert sanitize(soup, plaintext=True) == 'Заголовок Текст статьи .'
+
+
+def _legacy_sanitize(html, plaintext=False):
+    soup = BeautifulSoup(html, "html.parser")
+    article = _pick_article_container(soup)
+    article.attrs = {}
+    buzz_blocks = [
+        *article.select(".article__notice, .article__aggr, aside, .media__copyright"),
+        *article.select(".article__meta, .article__info, .article__tags"),
+        *article.select(".share, .social, .banner, .ads, .subscribe"),
+    ]
+    for el in buzz_blocks:
+        el.decompose()
+    remove_buzz_attrs(article)
+    remove_buzz_tags(article)
+    if not plaintext:
+        return article.prettify().strip()
+    remove_all_tags(article)
+    return article.get_text(" ", strip=True)
+
+
+def test_cleaning_plan_matches_legacy_passes():
+    html = (
+        '<html><body><div class="layout-article" id="main">'
+        '<h1 class="title">Заголовок</h1><time>29.06</time>'
+        '<div class="article__meta"><span>мета</span></div>'
+        '<div class="article__text"><p style="x">Первый <b>абзац</b> '
+        '<a href="/a" rel="nofollow">ссылка</a></p>'
+        '<aside><p>реклама</p></aside><img src="/i.png" alt="картинка">'
+        '<div class="share"><div class="social">share</div></div>'
+        '<p>Второй<span class="ads">ads</span> абзац</p><script>var x;</script></div>'
+        '<footer class="article__tags"><a href="/t">тег</a></footer>'
+        '</div></body></html>'
+    )
+    for plaintext in (False, True):
+        assert sanitize(html, plaintext=plaintext) == _legacy_sanitize(html, plaintext=plaintext)
+
+
 def test_sanitize_wrong_url():
+    import pytest
+    import requests
+
     resp = requests.get('http://example.com')
     resp.raise_for_status()
     with pytest.raises(ArticleNotFound):
@@ -0,0 +1,95 @@
+"""Пул процессов для лемматизации и подсчёта рейтинга вне event loop.
+
+Каждый воркер при старте создаёт свой MorphAnalyzer и держит свою копию
+словаря «заряженных» слов, поэтому в задачу передаётся только текст статьи
+и версия словаря, с которой работает запрос.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from text_tools import ChargedWords, count_lemmas_sync, get_morph, score_hits
+
+
+# 0 — анализ выполняется прямо в event loop, без пула.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+
+logger = logging.getLogger(__name__)
+
+_morph = None
+_charged_words = None
+
+
+class DictionaryMismatch(Exception):
+    """Словарь воркера другой версии, чем у запроса (пул уже перезапущен с новым словарём)."""
+
+
+def _init_worker(charged_words):
+    global _morph, _charged_words
+    _morph = get_morph()
+    _charged_words = ChargedWords.compile(charged_words)
+
+
+def _analyze(text: str, deadline: float, version):
+    """Выполняется в воркере: возвращает (lemma_counts, score, hits)."""
+    if version != _charged_words.version:
+        raise DictionaryMismatch(f"worker dictionary {_charged_words.version}, request {version}")
+    scan = _charged_words.scan()
+    lemma_counts = count_lemmas_sync(_morph, text, deadline=deadline, scan=scan)
+    return lemma_counts, score_hits(scan.hits, sum(lemma_counts.values())), scan.hits
+
+
+class AnalysisPool:
+    """Обёртка над ProcessPoolExecutor с таймаутом на анализ одной статьи.
+
+    По таймауту задача снимается из очереди, а если уже выполняется —
+    воркер сам прерывает её, дойдя до того же дедлайна.
+    Если воркер умер (BrokenProcessPool), пул пересоздаётся с тем же словарём:
+    упавшие задачи получают исключение, а следующие статьи снова идут в пул.
+    """
+
+    def __init__(self, charged_words, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.restarts = 0
+        self._charged_words = charged_words
+        self._executor = self._make_executor(charged_words)
+
+    def _make_executor(self, charged_words):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(charged_words,),
+        )
+
+    def reload(self, charged_words):
+        """Новые статьи уходят в новый пул с новым словарём; старый доделывает начатые и закрывается."""
+        self._charged_words = charged_words
+        old_executor, self._executor = self._executor, self._make_executor(charged_words)
+        old_executor.shutdown(wait=False)
+
+    def _restart(self, broken_executor):
+        """Заменяет сломанный пул новым; задачи, упавшие вместе с ним, пересоздают его один раз."""
+        if self._executor is not broken_executor:
+            return
+        logger.warning("Пул анализа сломан, пересоздаём")
+        self.restarts += 1
+        self._executor = self._make_executor(self._charged_words)
+        broken_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def analyze(self, text: str, timeout: float, version=None):
+        """(lemma_counts, score, hits) по словарю версии version; у воркеров другая — DictionaryMismatch."""
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + timeout
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(executor, _analyze, text, deadline, version)
+            return await asyncio.wait_for(future, timeout=timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+"""Генерирует детерминированный корпус HTML-страниц в разметке ИНОСМИ.РУ для бенчмарков.
+
+Корпус уже лежит в benchmarks/corpus; скрипт нужен, только чтобы его пересобрать:
+
+    python -m benchmarks.make_corpus
+"""
+import random
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+WORDS = (
+    "президент правительство заявил россия сша европа встреча переговоры санкции экономика "
+    "война конфликт кризис скандал шок катастрофа угроза провал победа успех рост падение "
+    "министр депутат эксперт аналитик издание газета журналист мнение вопрос ответ решение "
+    "страна город регион граница армия оборона безопасность договор соглашение союз партнёр "
+    "рынок нефть газ цена доллар рубль евро бюджет налог пенсия зарплата инфляция банк "
+    "хотел считает говорят отметил подчеркнул сообщил пишет напомнил добавил признал "
+    "новый старый большой главный важный сложный опасный громкий неожиданный серьёзный "
+    "очень также однако поэтому впрочем кроме того более менее всегда никогда уже ещё не"
+).split()
+
+SIZES = {
+    "short": 300,
+    "medium": 1500,
+    "long": 6000,
+    "huge": 12000,
+}
+
+
+def _paragraphs(rng: random.Random, words_count: int):
+    produced = 0
+    while produced < words_count:
+        sentence_count = rng.randint(2, 6)
+        sentences = []
+        for _ in range(sentence_count):
+            length = rng.randint(6, 18)
+            words = [rng.choice(WORDS) for _ in range(length)]
+            words[0] = words[0].capitalize()
+            if rng.random() < 0.2:
+                words[rng.randrange(length)] = f"«{rng.choice(WORDS)}»"
+            sentences.append(" ".join(words) + rng.choice([".", ".", "!", "?", "…"]))
+            produced += length
+        yield " ".join(sentences)
+
+
+def _comments(rng: random.Random, count: int) -> str:
+    items = "".join(
+        f'<div class="comment"><span class="comment__author">user{i}</span>'
+        f'<p>{" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))}</p></div>'
+        for i in range(count)
+    )
+    return f'<aside class="comments">{items}</aside>'
+
+
+def make_page(rng: random.Random, title: str, words_count: int) -> str:
+    paragraphs = "".join(
+        f'<div class="article__text"><p>{p} <a href="https://inosmi.ru/x{rng.randint(1, 10**6)}.html" '
+        f'class="link">{rng.choice(WORDS)}</a></p></div>'
+        for p in _paragraphs(rng, words_count)
+    )
+    related = "".join(
+        f'<div class="list-item"><a href="/r{i}.html">{" ".join(rng.choice(WORDS) for _ in range(8))}</a></div>'
+        for i in range(40)
+    )
+    return (
+        '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">'
+        f"<title>{title} - ИноСМИ</title>"
+        '<script>window.dataLayer = [];</script></head><body>'
+        '<header class="header"><nav>' + "".join(f'<a href="/s{i}">раздел</a>' for i in range(30)) + "</nav></header>"
+        '<div class="layout-article"><article class="article">'
+        f'<div class="article__meta"><time>29.06.2019</time><span class="article__info">ИноСМИ</span></div>'
+        f'<h1 class="article__title">{title}</h1>'
+        '<div class="article__announce"><div class="media__copyright">© AP Photo</div>'
+        '<img src="https://inosmi.ru/img.jpg" alt="фото" width="600"></div>'
+        f"{paragraphs}"
+        '<div class="article__notice">Материалы ИноСМИ содержат оценки исключительно зарубежных СМИ</div>'
+        '<div class="article__tags"><a href="/tags/1">политика</a><a href="/tags/2">экономика</a></div>'
+        '<div class="share social">Поделиться</div>'
+        f"{_comments(rng, words_count // 100)}"
+        "</article></div>"
+        f'<div class="article__aggr">{related}</div>'
+        '<footer class="footer"><script>var counter = 1;</script>© ИноСМИ</footer>'
+        "</body></html>"
+    )
+
+
+def main():
+    rng = random.Random(20190629)
+    CORPUS_DIR.mkdir(exist_ok=True)
+    for name, words_count in SIZES.items():
+        for variant in range(2):
+            title = " ".join(rng.choice(WORDS) for _ in range(6)).capitalize()
+            path = CORPUS_DIR / f"{name}-{variant}.html"
+            path.write_text(make_page(rng, title, words_count), encoding="utf-8")
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Офлайн-бенчмарки: пропускная способность стадий анализа и нагрузочный тест server.py.
+
+Всё работает на сохранённом корпусе benchmarks/corpus, без доступа в сеть:
+
+    python -m benchmarks.run                      # стадии и нагрузочный тест
+    python -m benchmarks.run --no-e2e --repeat 5  # только стадии
+    python -m benchmarks.run --check              # + сравнение с benchmarks/thresholds.json
+
+Результаты пишутся в JSON (по умолчанию bench_output.json). С --check скрипт
+завершается с кодом 1, если хоть одна метрика хуже порога.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+import main
+import server
+from adapters import SANITIZERS, inosmi_ru
+from dedup import text_sketch
+from scheduler import Scheduler
+from text_tools import (
+    ChargedForms,
+    ChargedWords,
+    LemmaCache,
+    calculate_jaundice_rate,
+    count_lemmas,
+    count_lemmas_sync,
+    get_morph,
+    score_hits,
+    score_text_fast,
+    split_by_words,
+)
+
+BENCH_DIR = Path(__file__).resolve().parent
+CORPUS_DIR = BENCH_DIR / "corpus"
+# настоящие тексты со словоформами во всех падежах: синтетический корпус почти целиком
+# в словарной форме, и расхождение быстрого режима на нём ничего не говорит
+PROSE_DIR = BENCH_DIR / "prose"
+THRESHOLDS_PATH = BENCH_DIR / "thresholds.json"
+DEFAULT_OUTPUT = Path("bench_output.json")
+
+
+def load_corpus(corpus_dir: Path = CORPUS_DIR) -> dict[str, str]:
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(corpus_dir.glob("*.html"))}
+
+
+def load_prose(prose_dir: Path = PROSE_DIR) -> list[str]:
+    return [path.read_text(encoding="utf-8") for path in sorted(prose_dir.glob("*.txt"))]
+
+
+def _stage_result(seconds: float, pages: int, words: int) -> dict:
+    return {
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+        "words_per_sec": round(words / seconds, 1) if seconds else None,
+    }
+
+
+def bench_stages(corpus: dict[str, str], repeat: int = 3) -> dict:
+    """Время каждой стадии на всём корпусе, лучшее из repeat прогонов."""
+    morph = get_morph()
+    charged_words = main.load_charged_words(main.DICT_DIR, morph)
+    texts = {name: inosmi_ru.sanitize(html, plaintext=True) for name, html in corpus.items()}
+    words = {name: asyncio.run(split_by_words(morph, text, cache=LemmaCache())) for name, text in texts.items()}
+    words_total = sum(len(article_words) for article_words in words.values())
+    warm_cache = LemmaCache()
+
+    stages = {
+        "extract_title": lambda: [main.extract_title(html) for html in corpus.values()],
+        "sanitize": lambda: [inosmi_ru.sanitize(html, plaintext=True) for html in corpus.values()],
+        # холодный кэш лемм — худший случай, тёплый — типичный для сервера
+        "split_by_words": lambda: [
+            asyncio.run(split_by_words(morph, text, cache=LemmaCache())) for text in texts.values()
+        ],
+        "split_by_words_warm": lambda: [
+            asyncio.run(split_by_words(morph, text, cache=warm_cache)) for text in texts.values()
+        ],
+        # путь сервера: частоты лемм без списка слов
+        "count_lemmas": lambda: [
+            asyncio.run(count_lemmas(morph, text, cache=LemmaCache())) for text in texts.values()
+        ],
+        "calculate_jaundice_rate": lambda: [
+            calculate_jaundice_rate(article_words, charged_words) for article_words in words.values()
+        ],
+        # отпечаток для поиска перепечаток должен стоить заметно меньше лемматизации
+        "fingerprint": lambda: [text_sketch(text) for text in texts.values()],
+    }
+
+    results = {}
+    for name, run_stage in stages.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_stage()
+            timings.append(time.perf_counter() - start)
+        results[name] = _stage_result(min(timings), len(corpus), words_total)
+    return results
+
+
+def compare_scoring(texts: list[str], repeat: int = 3) -> dict:
+    """Быстрый режим (ChargedForms) против полной лемматизации на очищенных текстах: скорость и расхождение оценок."""
+    morph = get_morph()
+    charged_words = main.load_charged_words(main.DICT_DIR, morph)
+    start = time.perf_counter()
+    charged_forms = ChargedForms.expand(morph, charged_words)
+    expand_seconds = time.perf_counter() - start
+
+    def full(cache):
+        results = []
+        for text in texts:
+            scan = charged_words.scan()
+            lemma_counts = count_lemmas_sync(morph, text, cache=cache, scan=scan)
+            words_count = sum(lemma_counts.values())
+            results.append((words_count, score_hits(scan.hits, words_count), scan.hits))
+        return results
+
+    def best_of(run):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    warm_cache = LemmaCache()
+    full_results = full(warm_cache)
+    fast_results = [score_text_fast(text, charged_forms) for text in texts]
+    full_cold = best_of(lambda: full(LemmaCache()))
+    full_warm = best_of(lambda: full(warm_cache))
+    fast = best_of(lambda: [score_text_fast(text, charged_forms) for text in texts])
+
+    score_diffs = [abs(a[1] - b[1]) for a, b in zip(full_results, fast_results)]
+    count_errors = [abs(a[0] - b[0]) / a[0] for a, b in zip(full_results, fast_results) if a[0]]
+    return {
+        "charged_forms": len(charged_forms),
+        "expand_seconds": round(expand_seconds, 4),
+        "full_cold_seconds": round(full_cold, 4),
+        "full_warm_seconds": round(full_warm, 4),
+        "fast_seconds": round(fast, 4),
+        "speedup_cold": round(full_cold / fast, 1),
+        "speedup_warm": round(full_warm / fast, 1),
+        "mean_abs_score_diff": round(statistics.mean(score_diffs), 3),
+        "max_abs_score_diff": round(max(score_diffs), 3),
+        "mean_words_count_error": round(statistics.mean(count_errors), 4) if count_errors else 0.0,
+        "max_words_count_error": round(max(count_errors), 4) if count_errors else 0.0,
+        "same_hits_pages": sum(a[2] == b[2] for a, b in zip(full_results, fast_results)),
+        "pages": len(texts),
+    }
+
+
+def bench_dictionary_scaling(corpus: dict[str, str], sizes=(1_000, 10_000, 30_000), repeat: int = 3) -> dict:
+    """Скорость поиска записей словаря в потоке лемм при росте словаря (треть записей — фразы)."""
+    morph = get_morph()
+    cache = LemmaCache()
+    texts = [inosmi_ru.sanitize(html, plaintext=True) for html in corpus.values()]
+    streams = [asyncio.run(split_by_words(morph, text, cache=cache)) for text in texts]
+    words_total = sum(len(stream) for stream in streams)
+    vocabulary = sorted({lemma for stream in streams for lemma in stream})
+    # синтетические леммы, которых нет в текстах, — чтобы словарь мог вырасти до любых размеров
+    rng = random.Random(0)
+
+    results = {}
+    for size in sizes:
+        entries = set(rng.sample(vocabulary, min(len(vocabulary), size // 10)))
+        while len(entries) < size:
+            lemmas = [rng.choice(vocabulary) if rng.random() < 0.5 else f"лемма{rng.randrange(size)}"
+                      for _ in range(rng.choice((1, 1, 2, 3)))]
+            entries.add(" ".join(lemmas))
+        start = time.perf_counter()
+        charged_words = ChargedWords(entries)
+        build_seconds = time.perf_counter() - start
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for stream in streams:
+                charged_words.match(stream)
+            timings.append(time.perf_counter() - start)
+        results[str(size)] = {
+            "build_seconds": round(build_seconds, 4),
+            "words_per_sec": round(words_total / min(timings), 1),
+        }
+    return results
+
+
+async def _start_site(app: web.Application) -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def make_corpus_app(corpus: dict[str, str], latency: float) -> web.Application:
+    """Локальная замена новостного сайта: отдаёт страницы корпуса с заданной задержкой."""
+    async def page(request: web.Request):
+        html = corpus.get(request.match_info["name"])
+        if html is None:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        return web.Response(text=html, content_type="text/html")
+
+    app = web.Application()
+    app.add_routes([web.get("/{name}", page)])
+    return app
+
+
+async def bench_e2e(corpus: dict[str, str], requests: int = 50, concurrency: int = 10,
+                    urls_per_request: int = 5, latency: float = 0.05) -> dict:
+    """Нагрузочный тест GET /analyze против локального сервера с корпусом."""
+    SANITIZERS["127_0_0_1"] = inosmi_ru.sanitize
+    corpus_runner, corpus_port = await _start_site(make_corpus_app(corpus, latency))
+
+    app = server.create_app()
+    app[server.SCHEDULER] = Scheduler(host_concurrency=server.HTTP_LIMIT_PER_HOST, host_rate=0)
+    server_runner, server_port = await _start_site(app)
+
+    names = list(corpus)
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(session, n):
+        # уникальный query-параметр, чтобы каждый запрос проходил мимо кэша результатов
+        urls = ",".join(
+            f"http://127.0.0.1:{corpus_port}/{names[(n + i) % len(names)]}?n={n}"
+            for i in range(urls_per_request)
+        )
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{server_port}/analyze", params={"urls": urls}) as resp:
+                records = await resp.json()
+            latencies.append(time.perf_counter() - start)
+        for rec in records:
+            statuses[rec["status"]] = statuses.get(rec["status"], 0) + 1
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(one_request(session, n) for n in range(requests)))
+            elapsed = time.perf_counter() - start
+    finally:
+        await server_runner.cleanup()
+        await corpus_runner.cleanup()
+        SANITIZERS.pop("127_0_0_1", None)
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "urls_per_request": urls_per_request,
+        "latency": latency,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(requests / elapsed, 2),
+        "articles_per_sec": round(requests * urls_per_request / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+        "statuses": statuses,
+    }
+
+
+async def bench_e2e_cached(corpus: dict[str, str], requests: int = 200, concurrency: int = 20) -> dict:
+    """GET /analyze одной и той же уже посчитанной статьи с лимитами планировщика по умолчанию.
+
+    Ответы из кэша не идут в сеть и не должны ждать слота хоста (HOST_RATE запросов в секунду).
+    """
+    SANITIZERS["127_0_0_1"] = inosmi_ru.sanitize
+    corpus_runner, corpus_port = await _start_site(make_corpus_app(corpus, 0))
+    server_runner, server_port = await _start_site(server.create_app())
+    params = {"urls": f"http://127.0.0.1:{corpus_port}/{next(iter(corpus))}"}
+    endpoint = f"http://127.0.0.1:{server_port}/analyze"
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(session):
+        async with semaphore:
+            async with session.get(endpoint, params=params) as resp:
+                for rec in await resp.json():
+                    statuses[rec["status"]] = statuses.get(rec["status"], 0) + 1
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            await one_request(session)
+            statuses.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(one_request(session) for _ in range(requests)))
+            elapsed = time.perf_counter() - start
+    finally:
+        await server_runner.cleanup()
+        await corpus_runner.cleanup()
+        SANITIZERS.pop("127_0_0_1", None)
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(requests / elapsed, 2),
+        "statuses": statuses,
+    }
+
+
+def check_thresholds(results: dict, thresholds: dict) -> list[str]:
+    """Список нарушенных порогов: min_* — не меньше, max_* — не больше."""
+    failures = []
+    for section, metrics in thresholds.items():
+        for name, limits in metrics.items():
+            actual = results.get(section, {}).get(name)
+            if actual is None:
+                continue
+            for key, limit in limits.items():
+                metric = key[4:]
+                value = actual.get(metric)
+                if value is None:
+                    continue
+                if key.startswith("min_") and value < limit or key.startswith("max_") and value > limit:
+                    failures.append(f"{section}.{name}.{metric} = {value}, limit {key} = {limit}")
+    return failures
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-e2e", action="store_true", help="не запускать нагрузочный тест сервера")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--urls-per-request", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа сайта-заглушки, сек")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--check", action="store_true", help="сравнить с порогами и упасть при регрессии")
+    parser.add_argument("--thresholds", type=Path, default=THRESHOLDS_PATH)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()
+    results = {
+        "corpus_pages": len(corpus),
+        "stages": bench_stages(corpus, args.repeat),
+        "scoring": {
+            "fast_vs_full": compare_scoring(
+                [inosmi_ru.sanitize(html, plaintext=True) for html in corpus.values()], args.repeat,
+            ),
+            "fast_vs_full_prose": compare_scoring(load_prose(), args.repeat),
+        },
+        "dictionary_scaling": bench_dictionary_scaling(corpus, repeat=args.repeat),
+    }
+    if not args.no_e2e:
+        results["e2e"] = {
+            "analyze": asyncio.run(bench_e2e(
+                corpus, args.requests, args.concurrency, args.urls_per_request, args.latency,
+            )),
+            "analyze_cached": asyncio.run(bench_e2e_cached(corpus)),
+        }
+
+    failures = []
+    if args.check:
+        thresholds = json.loads(args.thresholds.read_text(encoding="utf-8"))
+        failures = check_thresholds(results, thresholds)
+        results["failures"] = failures
+
+    args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if failures:
+        print("Регрессия производительности:", *failures, sep="\n  ", file=sys.stderr)
+        return 1
+    return 0
+
+
+def test_check_thresholds():
+    results = {
+        "stages": {"sanitize": {"pages_per_sec": 10.0}},
+        "e2e": {"analyze": {"p95_ms": 600.0}},
+    }
+    thresholds = {
+        "stages": {"sanitize": {"min_pages_per_sec": 20}},
+        "e2e": {"analyze": {"max_p95_ms": 500}},
+    }
+    assert check_thresholds(results, thresholds) == [
+        "stages.sanitize.pages_per_sec = 10.0, limit min_pages_per_sec = 20",
+        "e2e.analyze.p95_ms = 600.0, limit max_p95_ms = 500",
+    ]
+
+
+def test_bench_smoke():
+    corpus = {name: html for name, html in load_corpus().items() if name.startswith("short")}
+    stages = bench_stages(corpus, repeat=1)
+    assert set(stages) >= {"extract_title", "sanitize", "split_by_words", "count_lemmas", "calculate_jaundice_rate"}
+
+    scoring = compare_scoring([inosmi_ru.sanitize(html, plaintext=True) for html in corpus.values()], repeat=1)
+    assert scoring["pages"] == len(corpus) and scoring["fast_seconds"] > 0
+    prose = compare_scoring(load_prose(), repeat=1)
+    assert prose["pages"] == len(load_prose()) > 0 and prose["mean_words_count_error"] < 0.02
+    assert set(bench_dictionary_scaling(corpus, sizes=(100, 1000), repeat=1)) == {"100", "1000"}
+
+    e2e = asyncio.run(bench_e2e(corpus, requests=2, concurrency=2, urls_per_request=2, latency=0))
+    assert e2e["statuses"] == {"OK": 4}
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,407 @@
+"""Пакетная обработка архива: ссылки и сохранённые страницы → JSONL.
+
+Источники читаются из файлов или stdin, по одному на строку: ссылка, путь
+к сохранённой HTML-странице или каталог (берутся все *.html и *.htm в нём).
+Источники делятся на пачки, пачки обрабатываются в пуле процессов. У каждого
+воркера свой event loop, aiohttp-сессия и планировщик, поэтому ссылки пачки
+скачиваются параллельно, а очистка и лемматизация идут на всех ядрах.
+Лимиты HOST_CONCURRENCY и HOST_RATE делятся между воркерами, чтобы пул целиком
+не нагружал сайт сильнее, чем один сервер.
+Каждая статья проходит через тот же process_article, что и в сервере.
+
+Результаты дописываются в JSONL по мере готовности пачек, и выходной файл
+служит контрольной точкой: с --resume уже записанные источники пропускаются.
+Если пачка упала целиком, её источники записываются со статусом ERROR
+и при --resume обрабатываются заново.
+
+    python bulk.py urls.txt -o results.jsonl --workers 8
+    find archive -name '*.html' | python bulk.py --site inosmi.ru -o results.jsonl --resume
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from multiprocessing.util import Finalize
+from operator import itemgetter
+from pathlib import Path
+
+import aiohttp
+from anyio import create_task_group
+
+from dedup import DEDUP_SIZE, NearDuplicateIndex
+from main import (
+    DICT_DIR,
+    SCORING_MODE,
+    decode_html,
+    is_valid_url,
+    load_charged_words,
+    pick_sanitizer,
+    process_article,
+    setup_logging,
+)
+from scheduler import HOST_CONCURRENCY, HOST_RATE, Scheduler
+from text_tools import ChargedForms, ChargedWords, get_morph
+
+# статей в одной пачке: столько ссылок воркер скачивает одновременно (в пределах планировщика)
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "64"))
+# общий дедлайн статьи: ожидание хоста, скачивание, очистка и анализ
+BULK_ARTICLE_TIMEOUT = float(os.getenv("BULK_ARTICLE_TIMEOUT", "60"))
+# как часто писать в лог промежуточную скорость, секунды
+PROGRESS_INTERVAL = 10.0
+# статус источников пачки, в которой случилось непредвиденное исключение
+ERROR_STATUS = "ERROR"
+
+HTML_SUFFIXES = {".html", ".htm"}
+LINK_TAG_RE = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+CANONICAL_REL_RE = re.compile(r"""\brel\s*=\s*["']?canonical\b""", re.IGNORECASE)
+HREF_RE = re.compile(r"""\bhref\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+logger = logging.getLogger("jaundice-rate.bulk")
+
+
+def iter_sources(lines):
+    """Раскрывает строки входа в источники: ссылки как есть, каталоги — в их HTML-файлы."""
+    for line in lines:
+        source = line.strip()
+        if not source or source.startswith("#"):
+            continue
+        path = Path(source)
+        if not is_valid_url(source) and path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if child.suffix.lower() in HTML_SUFFIXES and child.is_file():
+                    yield str(child)
+        else:
+            yield source
+
+
+def read_input_lines(inputs):
+    for name in inputs:
+        if name == "-":
+            yield from sys.stdin
+            continue
+        with open(name, encoding="utf-8") as f:
+            yield from f
+
+
+def canonical_url(html: str) -> str | None:
+    """Адрес статьи из <link rel="canonical"> сохранённой страницы."""
+    head_end = html.find("</head>")
+    for tag in LINK_TAG_RE.finditer(html, 0, head_end if head_end != -1 else len(html)):
+        if CANONICAL_REL_RE.search(tag.group()):
+            href = HREF_RE.search(tag.group())
+            if href and is_valid_url(href.group(1)):
+                return href.group(1)
+    return None
+
+
+def load_done(path: Path) -> set[str]:
+    """Источники, уже записанные в JSONL. Недописанная последняя строка
+    (процесс прервали посреди записи) обрезается, чтобы дописывать с чистой строки."""
+    done = set()
+    if not path.exists():
+        return done
+    with path.open("rb+") as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                f.truncate(offset)
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+                if record["status"] != ERROR_STATUS:
+                    done.add(record["source"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+def worker_host_limits(workers: int) -> tuple[int, float]:
+    """(host_concurrency, host_rate) планировщика одного воркера: общие лимиты на хост делятся на всех.
+
+    Меньше одного одновременного запроса к хосту воркеру не дать, поэтому при workers > HOST_CONCURRENCY
+    параллельность к хосту может дойти до workers, но частота запросов по-прежнему не выше HOST_RATE.
+    """
+    return max(1, HOST_CONCURRENCY // workers), HOST_RATE / workers
+
+
+def error_records(batch, err: Exception) -> list[dict]:
+    # задачи пачки выполняются в группе anyio: из группы с одной ошибкой берётся сама ошибка
+    while isinstance(err, BaseExceptionGroup) and len(err.exceptions) == 1:
+        err = err.exceptions[0]
+    return [
+        {"idx": idx, "url": source, "status": ERROR_STATUS, "words_count": None,
+         "error": f"{type(err).__name__}: {err}", "source": source}
+        for idx, source in batch
+    ]
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class _Worker:
+    """Состояние процесса пула: event loop, сессия, планировщик и индекс перепечаток живут между пачками."""
+
+    def __init__(self, charged_words, forms, site, timeout, workers=1):
+        self.host_limits = worker_host_limits(workers)
+        self.morph = get_morph()
+        self.charged_words = ChargedWords.compile(charged_words)
+        self.forms = forms
+        self.site_sanitizer = pick_sanitizer(f"https://{site}/") if site else None
+        self.timeout = timeout
+        # перепечатки ищутся среди текстов, уже прошедших через этот воркер
+        self.dedup = NearDuplicateIndex() if DEDUP_SIZE > 0 else None
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.scheduler = None
+
+    def run(self, batch):
+        return self.loop.run_until_complete(self._run(batch))
+
+    def close(self):
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+        self.loop.close()
+
+    async def _run(self, batch):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+            host_concurrency, host_rate = self.host_limits
+            self.scheduler = Scheduler(host_concurrency=host_concurrency, host_rate=host_rate)
+        results: list[dict] = []
+        async with create_task_group() as tg:
+            for idx, source in batch:
+                tg.start_soon(self._process, idx, source, results)
+        sources = dict(batch)
+        for record in results:
+            record["source"] = sources[record["idx"]]
+        return sorted(results, key=itemgetter("idx"))
+
+    async def _process(self, idx, source, results):
+        if is_valid_url(source):
+            await self.scheduler.run(source, lambda: self._analyze(source, idx, results))
+            return
+        path = Path(source)
+        try:
+            html = decode_html(await asyncio.to_thread(path.read_bytes))
+        except OSError:
+            # без html и с file:// адресом process_article вернёт FETCH_ERROR
+            await self._analyze(path.absolute().as_uri(), idx, results)
+            return
+        url = canonical_url(html) or path.absolute().as_uri()
+        await self._analyze(url, idx, results, html=html, sanitizer=self.site_sanitizer)
+
+    async def _analyze(self, url, idx, results, **options):
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        # у архива своё время на статью (--timeout), поэтому длинные тексты считаются точно, без выборки
+        await process_article(
+            self.session, self.morph, self.charged_words, url, idx, results,
+            forms=self.forms, dedup=self.dedup, deadline=deadline, approx_words=0, **options,
+        )
+
+
+_worker: _Worker | None = None
+
+
+def _init_worker(charged_words, forms, site, timeout, workers):
+    global _worker
+    _worker = _Worker(charged_words, forms, site, timeout, workers)
+    Finalize(None, _worker.close, exitpriority=10)
+
+
+def _run_batch(batch):
+    return _worker.run(batch)
+
+
+class BulkStats:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.started_at = clock()
+        self.reported_at = self.started_at
+        self.processed = 0
+        self.skipped = 0
+        self.words = 0
+        self.statuses = Counter()
+
+    def add(self, record: dict):
+        self.processed += 1
+        self.words += record["words_count"] or 0
+        self.statuses[record["status"]] += 1
+
+    def summary(self) -> dict:
+        seconds = self._clock() - self.started_at
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "statuses": dict(self.statuses),
+            "words": self.words,
+            "seconds": round(seconds, 3),
+            "articles_per_sec": round(self.processed / seconds, 2) if seconds else 0.0,
+            "words_per_sec": round(self.words / seconds) if seconds else 0,
+        }
+
+    def maybe_report(self):
+        now = self._clock()
+        if now - self.reported_at >= PROGRESS_INTERVAL:
+            self.reported_at = now
+            summary = self.summary()
+            logger.info("Обработано %s статей: %s статей/с, %s слов/с",
+                        summary["processed"], summary["articles_per_sec"], summary["words_per_sec"])
+
+
+def run_bulk(sources, out, charged_words, *, workers: int | None = None, batch_size: int = BULK_BATCH_SIZE,
+             forms=None, site: str | None = None, timeout: float = BULK_ARTICLE_TIMEOUT,
+             done=frozenset()) -> dict:
+    """Обрабатывает источники и пишет записи JSONL в out; возвращает итоговую статистику.
+
+    Записи пачки выводятся вместе, после чего out сбрасывается на диск, поэтому
+    прерванный прогон можно продолжить, передав в done источники из load_done.
+    Одновременно в пуле не больше двух пачек на воркер, так что вход любого размера
+    читается потоком. Исключение в пачке не прерывает прогон: её источники пишутся со статусом ERROR.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = BulkStats()
+
+    def pending_sources():
+        for idx, source in enumerate(sources):
+            if source in done:
+                stats.skipped += 1
+                continue
+            yield idx, source
+
+    def write(future):
+        batch = pending.pop(future)
+        try:
+            records = future.result()
+        except Exception as err:
+            logger.exception("Пачка из %s источников не обработана", len(batch))
+            records = error_records(batch, err)
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stats.add(record)
+        out.flush()
+        stats.maybe_report()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(charged_words, forms, site, timeout, workers)) as executor:
+        pending = {}
+        for batch in batched(pending_sources(), batch_size):
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future)
+            pending[executor.submit(_run_batch, batch)] = batch
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                write(future)
+
+    return stats.summary()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", default=["-"],
+                        help="файлы со списком источников (по умолчанию и для «-» — stdin)")
+    parser.add_argument("-o", "--output", default="-", help="файл JSONL (по умолчанию stdout)")
+    parser.add_argument("--resume", action="store_true",
+                        help="пропустить источники, уже записанные в --output, и дописать остальные")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="число процессов")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--timeout", type=float, default=BULK_ARTICLE_TIMEOUT,
+                        help="дедлайн одной статьи, секунды")
+    parser.add_argument("--site", help="хост, по адаптеру которого очищаются сохранённые страницы, например inosmi.ru")
+    args = parser.parse_args(argv)
+
+    if args.resume and args.output == "-":
+        parser.error("--resume требует --output")
+    if args.site:
+        try:
+            pick_sanitizer(f"https://{args.site}/")
+        except ValueError as err:
+            parser.error(str(err))
+
+    setup_logging()
+    charged_words = load_charged_words(DICT_DIR)
+    if not charged_words:
+        raise SystemExit(f"Словарь пуст. Положи .txt файлы в {DICT_DIR}")
+    forms = ChargedForms.expand(get_morph(), charged_words) if SCORING_MODE == "fast" else None
+
+    done = set()
+    if args.output == "-":
+        out = sys.stdout
+    else:
+        output = Path(args.output)
+        if args.resume:
+            done = load_done(output)
+            logger.info("Уже обработано %s источников, продолжаем", len(done))
+        out = output.open("a" if args.resume else "w", encoding="utf-8")
+
+    try:
+        summary = run_bulk(
+            iter_sources(read_input_lines(args.inputs)), out, charged_words,
+            workers=args.workers, batch_size=args.batch_size, forms=forms,
+            site=args.site, timeout=args.timeout, done=done,
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    logger.info("Готово: %s статей (пропущено %s) за %s с — %s статей/с, %s слов/с; статусы: %s",
+                summary["processed"], summary["skipped"], summary["seconds"],
+                summary["articles_per_sec"], summary["words_per_sec"], summary["statuses"])
+    return summary
+
+
+
+def test_iter_sources_expands_directories(tmp_path):
+    (tmp_path / "b.html").write_text("<html></html>")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.HTM").write_text("<html></html>")
+    (tmp_path / "notes.txt").write_text("")
+    lines = ["https://inosmi.ru/a.html\n", "\n", "# комментарий\n", f"{tmp_path}\n", "missing.html"]
+
+    assert list(iter_sources(lines)) == [
+        "https://inosmi.ru/a.html", str(tmp_path / "b.html"), str(tmp_path / "sub" / "a.HTM"), "missing.html",
+    ]
+
+
+def test_canonical_url():
+    html = '<html><head><link href="https://inosmi.ru/a.html" rel="canonical"><link rel="icon" href="x"></head>'
+    assert canonical_url(html) == "https://inosmi.ru/a.html"
+    assert canonical_url("<html><head></head><body><link rel=canonical href='/a'></body>") is None
+
+
+def test_load_done_truncates_partial_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(
+        '{"source": "a", "status": "OK"}\nnot json\n{"source": "e", "status": "ERROR"}\n'
+        '{"source": "b", "status": "FETCH_ERROR"}\n{"source": "c',
+        encoding="utf-8",
+    )
+
+    # упавшие пачки при --resume обрабатываются заново
+    assert load_done(path) == {"a", "b"}
+    assert path.read_text(encoding="utf-8").endswith('{"source": "b", "status": "FETCH_ERROR"}\n')
+    assert load_done(tmp_path / "missing.jsonl") == set()
+
+
+def test_worker_host_limits_split_across_workers():
+    concurrency, rate = worker_host_limits(1)
+    assert (concurrency, rate) == (HOST_CONCURRENCY, HOST_RATE)
+    concurrency, rate = worker_host_limits(16)
+    assert concurrency == max(1, HOST_CONCURRENCY // 16) and rate * 16 == HOST_RATE
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,200 @@
+"""Поиск почти одинаковых текстов, чтобы не лемматизировать перепечатки заново.
+
+Отпечаток текста — MinHash-скетч (bottom-k): SKETCH_SIZE наименьших хэшей
+шинглов из трёх слов подряд. Хэш шингла — XOR хэшей его слов из трёх таблиц,
+по одной на позицию в шингле (простое табулирование), поэтому на слово
+приходится три поиска в словаре и два XOR, выполняемых map на стороне C.
+Слова — просто куски текста между пробелами: лемматизация отпечатку не нужна.
+Схожесть двух текстов — оценка коэффициента Жаккара их множеств шинглов.
+
+Индекс хранит отпечатки последних DEDUP_SIZE текстов и инвертированные списки
+по значениям скетча: кандидаты — тексты с общими значениями, а сравниваются
+с запросом только несколько лучших из них.
+"""
+import hashlib
+import heapq
+import os
+from collections import Counter, OrderedDict
+from operator import xor
+
+
+# схожесть (оценка Жаккара по шинглам), начиная с которой текст считается перепечаткой
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.85"))
+# сколько отпечатков помнит индекс; 0 — поиск перепечаток выключен
+DEDUP_SIZE = int(os.getenv("DEDUP_SIZE", "10000"))
+SKETCH_SIZE = 64
+# со скольким числом лучших кандидатов сравнивается запрос
+MAX_CANDIDATES = 8
+WORD_HASHES_SIZE = 200_000
+
+_SECOND_HASHES: dict[str, int] = {}
+_THIRD_HASHES: dict[str, int] = {}
+
+
+class _WordHashes(dict):
+    """Слово → 64-битный хэш для первой позиции шингла; заодно заполняет таблицы второй и третьей.
+
+    Хэши одинаковы во всех процессах (в отличие от hash()).
+    """
+
+    def __missing__(self, word):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=24).digest()
+        value = self[word] = int.from_bytes(digest[:8], "little")
+        _SECOND_HASHES[word] = int.from_bytes(digest[8:16], "little")
+        _THIRD_HASHES[word] = int.from_bytes(digest[16:], "little")
+        return value
+
+
+_WORD_HASHES = _WordHashes()
+
+
+def _trim_word_hashes():
+    """Таблицы очищаются только между текстами: посреди текста слова уже прочитаны из первой таблицы."""
+    if len(_WORD_HASHES) >= WORD_HASHES_SIZE:
+        _WORD_HASHES.clear()
+        _SECOND_HASHES.clear()
+        _THIRD_HASHES.clear()
+
+
+def shingle_hashes(text: str) -> set[int]:
+    _trim_word_hashes()
+    words = text.lower().split()
+    # первая таблица читается целиком до остальных: так все слова уже есть и во второй, и в третьей
+    first = list(map(_WORD_HASHES.__getitem__, words))
+    second = map(_SECOND_HASHES.__getitem__, words[1:])
+    third = map(_THIRD_HASHES.__getitem__, words[2:])
+    return set(map(xor, map(xor, first, second), third))
+
+
+def text_sketch(text: str, size: int = SKETCH_SIZE) -> tuple[int, ...]:
+    """Отпечаток текста: size наименьших хэшей шинглов по возрастанию."""
+    return tuple(heapq.nsmallest(size, shingle_hashes(text)))
+
+
+def sketch_similarity(first, second, size: int = SKETCH_SIZE) -> float:
+    """Оценка Жаккара: доля общих значений среди size наименьших хэшей объединения."""
+    if not first or not second:
+        return 0.0
+    common = set(first) & set(second)
+    union = heapq.nsmallest(size, set(first) | set(second))
+    return sum(1 for value in union if value in common) / len(union)
+
+
+class NearDuplicateIndex:
+    """LRU-индекс отпечатков: ключ (хэш текста) → отпечаток и данные о проанализированном тексте."""
+
+    def __init__(self, similarity: float = DEDUP_SIMILARITY, maxsize: int = DEDUP_SIZE,
+                 sketch_size: int = SKETCH_SIZE):
+        self.similarity = similarity
+        self.maxsize = maxsize
+        self.sketch_size = sketch_size
+        self._entries: OrderedDict[str, tuple[tuple[int, ...], dict]] = OrderedDict()
+        self._postings: dict[int, set[str]] = {}
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sketch(self, text: str) -> tuple[int, ...]:
+        return text_sketch(text, self.sketch_size)
+
+    def add(self, key: str, sketch, value: dict):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = (sketch, value)
+        for hash_ in sketch:
+            self._postings.setdefault(hash_, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def find(self, key: str, sketch) -> tuple[dict, float] | None:
+        """(value, similarity) для того же текста (по key) или самого похожего не ниже порога."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[1], 1.0
+
+        shared = Counter()
+        for hash_ in sketch:
+            shared.update(self._postings.get(hash_, ()))
+        best = None
+        for candidate, _count in shared.most_common(MAX_CANDIDATES):
+            candidate_sketch, value = self._entries[candidate]
+            similarity = sketch_similarity(sketch, candidate_sketch, self.sketch_size)
+            if similarity >= self.similarity and (best is None or similarity > best[2]):
+                best = (candidate, value, similarity)
+        if best is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best[0])
+        self.near_hits += 1
+        return best[1], best[2]
+
+    def clear(self):
+        self._entries.clear()
+        self._postings.clear()
+
+    def _remove(self, key: str):
+        sketch, _value = self._entries.pop(key)
+        for hash_ in sketch:
+            keys = self._postings.get(hash_)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[hash_]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "similarity": self.similarity,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def test_sketch_similarity_tracks_shared_text():
+    base = " ".join(f"слово{i}" for i in range(400))
+    edited = base.replace("слово10 ", "правка ").replace("слово300 ", "правка ")
+    other = " ".join(f"другое{i}" for i in range(400))
+
+    assert text_sketch(base) == text_sketch(base.upper())
+    assert sketch_similarity(text_sketch(base), text_sketch(base)) == 1.0
+    assert sketch_similarity(text_sketch(base), text_sketch(edited)) > 0.9
+    assert sketch_similarity(text_sketch(base), text_sketch(other)) == 0.0
+    assert text_sketch("") == ()
+
+
+def test_word_hashes_trimmed_between_texts(monkeypatch):
+    base = " ".join(f"слово{i}" for i in range(400))
+    expected = text_sketch(base)
+    monkeypatch.setattr("dedup.WORD_HASHES_SIZE", 5)
+    assert text_sketch("a b c d e f g h i j")
+    # таблица переполнилась прошлым текстом и очищается до следующего, а не посреди него
+    assert text_sketch(base) == expected
+    assert len(_WORD_HASHES) == 400
+
+
+def test_near_duplicate_index():
+    index = NearDuplicateIndex(similarity=0.85, maxsize=2)
+    base = " ".join(f"слово{i}" for i in range(400))
+    index.add("a", text_sketch(base), {"url": "https://inosmi.ru/a.html"})
+
+    value, similarity = index.find("b", text_sketch(base + " Подписывайтесь на наш канал"))
+    assert value["url"] == "https://inosmi.ru/a.html" and similarity >= 0.85
+    assert index.find("a", ()) == ({"url": "https://inosmi.ru/a.html"}, 1.0)
+    assert index.find("c", text_sketch(" ".join(f"другое{i}" for i in range(400)))) is None
+
+    index.add("c", text_sketch("третий текст"), {})
+    index.add("d", text_sketch("четвёртый текст"), {})
+    assert len(index) == 2 and index.evictions == 1
+    assert index.find("x", text_sketch(base)) is None
+    assert all(keys <= {"c", "d"} for keys in index._postings.values())
@@ -0,0 +1,282 @@
+"""Политика скачивания: таймауты, повторы с экспоненциальной паузой и «хеджирование».
+
+Попытка — корутина, которая скачивает страницу целиком; политика решает,
+повторить ли её после ошибки и не пора ли запустить вторую копию. Повторяются
+только временные сбои: таймауты соединения и чтения, обрывы соединения
+и статусы из RETRY_STATUSES. Пауза перед повтором — случайная в пределах
+экспоненциально растущего окна (full jitter), Retry-After сервера учитывается.
+
+Хеджирование: если попытка идёт дольше, чем HEDGE_QUANTILE последних
+успешных скачиваний с этого хоста, параллельно запускается вторая; берётся
+ответ той, что успела первой. Повторы и вторые копии тратят бюджет хоста:
+каждый запрос пополняет его на RETRY_BUDGET, каждый повтор или вторая копия
+списывает единицу. Поэтому даже при массовых сбоях хоста лишних запросов
+не больше RETRY_BUDGET от обычных (плюс запас RETRY_BURST).
+"""
+import asyncio
+import os
+import random
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import HEDGED_FETCHES, RETRIED_FETCHES
+
+
+# установка TCP-соединения и пауза между кусками ответа: зависшее соединение не ждёт весь REQUEST_TIMEOUT
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "10"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "0.25"))
+FETCH_BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "4"))
+# доля лишних запросов (повторы и вторые копии) к хосту и их запас на старте
+RETRY_BUDGET = float(os.getenv("FETCH_RETRY_BUDGET", "0.2"))
+RETRY_BURST = float(os.getenv("FETCH_RETRY_BURST", "10"))
+# квантиль времени скачивания, после которого запускается вторая копия; 0 — без хеджирования
+HEDGE_QUANTILE = float(os.getenv("FETCH_HEDGE_QUANTILE", "0"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+LATENCY_WINDOW = 200
+MAX_HOSTS = 1000
+
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Retry-After в секундах: число или HTTP-дата."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_reason(err: Exception) -> str | None:
+    """Почему ошибку стоит повторить (метка для метрик) или None, если не стоит."""
+    if isinstance(err, aiohttp.ClientResponseError):
+        return f"status_{err.status}" if err.status in RETRY_STATUSES else None
+    if isinstance(err, aiohttp.ServerTimeoutError):
+        return "timeout"
+    if isinstance(err, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return "connection"
+    return None
+
+
+class _HostState:
+    __slots__ = ("tokens", "latencies")
+
+    def __init__(self):
+        self.tokens = RETRY_BURST
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def deposit(self, amount: float):
+        self.tokens = min(RETRY_BURST, self.tokens + amount)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class FetchPolicy:
+    def __init__(self, retries: int = FETCH_RETRIES, backoff_base: float = FETCH_BACKOFF_BASE,
+                 backoff_max: float = FETCH_BACKOFF_MAX, retry_budget: float = RETRY_BUDGET,
+                 hedge_quantile: float = HEDGE_QUANTILE):
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget
+        self.hedge_quantile = hedge_quantile
+        self._hosts: OrderedDict[str, _HostState] = OrderedDict()
+        self.attempts = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def _host(self, url: str) -> _HostState:
+        host = urlsplit(url).hostname or ""
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+            if len(self._hosts) > MAX_HOSTS:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(host)
+        return state
+
+    def backoff(self, retry: int, err: Exception) -> float | None:
+        """Пауза перед повтором номер retry (с нуля); None — сервер просит ждать дольше, чем имеет смысл."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        if isinstance(err, aiohttp.ClientResponseError) and err.headers:
+            retry_after = retry_after_seconds(err.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > self.backoff_max:
+                    return None
+                delay = max(delay, retry_after)
+        return delay
+
+    def hedge_delay(self, state: _HostState) -> float | None:
+        if not self.hedge_quantile or len(state.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(state.latencies)
+        return max(HEDGE_MIN_DELAY, ordered[int(self.hedge_quantile * (len(ordered) - 1))])
+
+    async def run(self, url: str, attempt):
+        """Выполняет attempt() по политике; attempt — фабрика корутин одной попытки."""
+        state = self._host(url)
+        loop = asyncio.get_running_loop()
+        state.deposit(self.retry_budget)
+        retry = 0
+        while True:
+            self.attempts += 1
+            started_at = loop.time()
+            try:
+                result = await self._hedged(state, attempt)
+            except Exception as err:
+                reason = retry_reason(err)
+                if reason is None or retry >= self.retries:
+                    raise
+                delay = self.backoff(retry, err)
+                if delay is None:
+                    raise
+                if not state.withdraw():
+                    self.budget_exhausted += 1
+                    raise
+                self.retried += 1
+                RETRIED_FETCHES.inc(reason=reason)
+                retry += 1
+                await asyncio.sleep(delay)
+                continue
+            state.latencies.append(loop.time() - started_at)
+            return result
+
+    async def _hedged(self, state: _HostState, attempt):
+        delay = self.hedge_delay(state)
+        if delay is None:
+            return await attempt()
+
+        first = asyncio.ensure_future(attempt())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            if not state.withdraw():
+                self.budget_exhausted += 1
+                return await first
+            self.hedged += 1
+            HEDGED_FETCHES.inc(outcome="sent")
+            second = asyncio.ensure_future(attempt())
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                            HEDGED_FETCHES.inc(outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "hedge_quantile": self.hedge_quantile,
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_exhausted": self.budget_exhausted,
+            "hosts": len(self._hosts),
+        }
+
+
+FETCH_POLICY = FetchPolicy()
+
+
+def _response_error(status: int, headers=None) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(None, (), status=status, headers=headers)
+
+
+def test_policy_retries_transient_errors():
+    policy = FetchPolicy(retries=2, backoff_base=0.001)
+    outcomes = [_response_error(503), aiohttp.ServerDisconnectedError(), "page"]
+
+    async def attempt():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert asyncio.run(policy.run("https://inosmi.ru/a.html", attempt)) == "page"
+    assert policy.stats()["retried"] == 2
+
+    async def not_found():
+        raise _response_error(404)
+
+    try:
+        asyncio.run(policy.run("https://inosmi.ru/b.html", not_found))
+    except aiohttp.ClientResponseError as err:
+        assert err.status == 404
+    assert policy.attempts == 4
+
+
+def test_policy_respects_retry_after_and_budget():
+    policy = FetchPolicy(retries=1, backoff_base=0.001, backoff_max=1)
+    assert policy.backoff(0, _response_error(429, {"Retry-After": "120"})) is None
+    assert policy.backoff(0, _response_error(429, {"Retry-After": "0.5"})) == 0.5
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+    async def failing():
+        raise _response_error(502)
+
+    async def storm():
+        for _ in range(30):
+            try:
+                await policy.run("https://flaky.example.com/", failing)
+            except aiohttp.ClientResponseError:
+                pass
+
+    asyncio.run(storm())
+    # запас RETRY_BURST и по RETRY_BUDGET с каждого запроса, а не по повтору на каждый запрос
+    assert policy.retried < 30 * RETRY_BUDGET + RETRY_BURST + 1
+    assert policy.budget_exhausted > 0
+
+
+def test_policy_hedges_slow_attempt():
+    policy = FetchPolicy(hedge_quantile=0.9)
+    state = policy._host("https://slow.example.com/")
+    state.latencies.extend([0.01] * HEDGE_MIN_SAMPLES)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        await asyncio.sleep(10 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    async def scenario():
+        started_at = asyncio.get_running_loop().time()
+        result = await policy.run("https://slow.example.com/a.html", attempt)
+        return result, asyncio.get_running_loop().time() - started_at
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == 2 and elapsed < 1
+    assert policy.stats()["hedged"] == 1 and policy.stats()["hedge_wins"] == 1
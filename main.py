@@ -1,20 +1,40 @@
 import asyncio
+import hashlib
+import json
 import logging
+import os
+import re
 import string
+import sys
 import time
-from contextlib import contextmanager
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
 from enum import Enum
+from functools import partial
 from pathlib import Path
 from urllib.parse import urlparse
 
 import aiohttp
-import pymorphy3
 from anyio import create_task_group, run as anyio_run
 from async_timeout import timeout as async_timeout
-from bs4 import BeautifulSoup
-
-from adapters import SANITIZERS, ArticleNotFound
-from text_tools import split_by_words, calculate_jaundice_rate
+from adapters import SANITIZERS, ArticleNotFound, make_soup
+from analysis_pool import ANALYSIS_WORKERS, AnalysisPool, DictionaryMismatch
+from fetch_policy import FETCH_CONNECT_TIMEOUT, FETCH_POLICY, FETCH_READ_TIMEOUT
+from metrics import ARTICLES, ARTICLES_IN_FLIGHT, HOST_ARTICLES, STAGE_SECONDS, host_label
+from result_cache import normalize_url
+from sampling import APPROX_WORDS, longer_than, ratio_estimate, stratified_chunks
+from store import content_hash
+from text_tools import (
+    ChargedForms,
+    ChargedWords,
+    count_lemmas,
+    get_morph,
+    phrase_hits,
+    score_hits,
+    score_lemma_counts,
+    score_text_fast,
+)
 
 
 class ProcessingStatus(Enum):
@@ -27,6 +47,11 @@ class ProcessingStatus(Enum):
 REQUEST_TIMEOUT = 30.05
 
 DICT_DIR = Path(__file__).resolve().parent / "charged_dict"
+# нормализованный словарь; пересобирается, когда меняется содержимое charged_dict/*.txt
+DICT_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "charged_words.json"
+DICT_CACHE_VERSION = 2
+# пояснения в скобках («измена (супруга)») уточняют смысл записи и в неё не входят
+DICT_NOTE_RE = re.compile(r"\([^)]*\)")
 # LARGE_TEXT = Path("samples/war_and_peace.txt").read_text(encoding="utf-8")
 
 TEST_ARTICLES = [
@@ -41,14 +66,31 @@ TEST_ARTICLES = [
 ]
 
 ANALYSIS_TIMEOUT = 3.0
+# full — каждое слово статьи лемматизируется; fast — «заряженные» слова ищутся
+# по заранее раскрытым словоформам (ChargedForms), без разбора статьи
+SCORING_MODE = os.getenv("SCORING_MODE", "full")
+# после приблизительной оценки длинного текста досчитать его полностью в фоне и положить в кэш и store
+APPROX_BACKGROUND = os.getenv("APPROX_BACKGROUND", "0") == "1"
+APPROX_FULL_TIMEOUT = float(os.getenv("APPROX_FULL_TIMEOUT", "120"))
+
+# при общем дедлайне статьи (deadline) эти таймауты не используются:
+# скачивание, очистка и анализ укладываются в оставшееся до дедлайна время
+
+# тело ответа читается кусками и обрывается, если страница больше лимита
+MAX_BODY_SIZE = int(os.getenv("MAX_BODY_SIZE", str(5 * 1024 * 1024)))
+FETCH_CHUNK_SIZE = 64 * 1024
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
 
-logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message)s")
 logger = logging.getLogger("jaundice-rate")
 
-logging.getLogger().setLevel(logging.INFO)
-logging.getLogger("pymorphy3").setLevel(logging.WARNING)
-logging.getLogger("pymorphy3.opencorpora_dict").setLevel(logging.WARNING)
-logging.getLogger("pymorphy3.opencorpora_dict.wrapper").setLevel(logging.WARNING)
+
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message)s")
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger("pymorphy3").setLevel(logging.WARNING)
+    logging.getLogger("pymorphy3.opencorpora_dict").setLevel(logging.WARNING)
+    logging.getLogger("pymorphy3.opencorpora_dict.wrapper").setLevel(logging.WARNING)
 
 
 def is_valid_url(url: str) -> bool:
@@ -60,7 +102,7 @@ def is_valid_url(url: str) -> bool:
     
 
 def pick_sanitizer(url: str):
-    host = urlparse(url).netloc
+    host = urlparse(url).hostname or ""
     key = host.replace(".", "_").replace("-", "_")
     sanitizer = SANITIZERS.get(key)
     if not sanitizer:
@@ -68,45 +110,271 @@ def pick_sanitizer(url: str):
     return sanitizer
 
 
-async def fetch(session, url):
-    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
-    async with session.get(url, timeout=timeout) as response:
-        response.raise_for_status()
-        return await response.text()
+class FetchRejected(aiohttp.ClientError):
+    """Ответ не похож на HTML-страницу или больше MAX_BODY_SIZE."""
+
+
+def decode_html(body: bytes, declared_charset: str | None = None) -> str:
+    """Декодирует страницу: BOM, заявленная кодировка, <meta charset>, utf-8 и только потом автоопределение."""
+    if body.startswith(b"\xef\xbb\xbf"):
+        return body[3:].decode("utf-8", errors="replace")
+
+    match = META_CHARSET_RE.search(body, 0, 4096)
+    meta_charset = match.group(1).decode("ascii", errors="ignore") if match else None
+    for charset in (declared_charset, meta_charset, "utf-8"):
+        if not charset:
+            continue
+        try:
+            return body.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            continue
+
+    from charset_normalizer import from_bytes
+
+    best = from_bytes(body).best()
+    return str(best) if best is not None else body.decode("utf-8", errors="replace")
+
+
+async def read_html(response, max_size: int = MAX_BODY_SIZE) -> str:
+    """Читает тело потоком, заранее отбрасывая не-HTML и слишком большие ответы."""
+    content_type = response.headers.get("Content-Type")
+    if content_type:
+        mimetype = content_type.split(";", 1)[0].strip().lower()
+        if mimetype not in HTML_CONTENT_TYPES:
+            raise FetchRejected(f"not an HTML page: {mimetype}")
+
+    if response.content_length is not None and response.content_length > max_size:
+        raise FetchRejected(f"page is too large: {response.content_length} bytes")
+
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+        body += chunk
+        if len(body) > max_size:
+            raise FetchRejected(f"page is larger than {max_size} bytes")
+
+    return decode_html(bytes(body), response.charset)
+
+
+def fetch_timeout() -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(
+        total=REQUEST_TIMEOUT, sock_connect=FETCH_CONNECT_TIMEOUT, sock_read=FETCH_READ_TIMEOUT,
+    )
+
+
+async def fetch(session, url, policy=None):
+    """Скачивает страницу; временные сбои повторяются по политике (см. fetch_policy)."""
+    async def attempt():
+        async with session.get(url, timeout=fetch_timeout()) as response:
+            response.raise_for_status()
+            return await read_html(response)
+
+    return await (policy or FETCH_POLICY).run(url, attempt)
+
+
+async def fetch_conditional(session, url, validators: dict | None = None, policy=None):
+    """Условный запрос по ETag/Last-Modified из кэша.
+
+    Возвращает (html, validators); на 304 html равен None.
+    """
+    validators = validators or {}
+    headers = {}
+    if validators.get("ETag"):
+        headers["If-None-Match"] = validators["ETag"]
+    if validators.get("Last-Modified"):
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+
+    async def attempt():
+        async with session.get(url, timeout=fetch_timeout(), headers=headers) as response:
+            if response.status == 304 and headers:
+                return None, validators
+            response.raise_for_status()
+            new_validators = {
+                name: response.headers[name]
+                for name in ("ETag", "Last-Modified")
+                if name in response.headers
+            }
+            return await read_html(response), new_validators
+
+    return await (policy or FETCH_POLICY).run(url, attempt)
+
+
+def _dict_sources_hash(paths) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.name.encode("utf-8") + b"\0")
+        digest.update(path.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+def _read_dict_cache(cache_path: Path | None, sources_hash: str) -> dict[str, list[str]] | None:
+    if cache_path is None:
+        return None
+    try:
+        data = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != DICT_CACHE_VERSION or data.get("sources_hash") != sources_hash:
+        return None
+    return data["dictionaries"]
+
+
+def _write_dict_cache(cache_path: Path | None, sources_hash: str, dictionaries):
+    if cache_path is None:
+        return
+    data = {
+        "version": DICT_CACHE_VERSION,
+        "sources_hash": sources_hash,
+        "dictionaries": {name: sorted(entries) for name, entries in dictionaries.items()},
+    }
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.warning("Не удалось сохранить кэш словаря %s: %s", cache_path, err)
 
 
-def load_charged_words(dict_dir: Path, morph) -> list[str]:
+def load_charged_words(dict_dir: Path, morph=None, cache_path: Path | None = DICT_CACHE_PATH) -> ChargedWords:
     """
     Читает все *.txt в папке, убирает шум, нормализует леммы
-    и возвращает уникальный список «заряженных» слов.
+    и возвращает скомпилированные словари «заряженных» слов и фраз.
+
+    Каждый файл — отдельный словарь (имя — имя файла без расширения), каждая
+    строка — запись: слово или фраза; несколько записей в строке разделяются запятыми.
+
+    Результат кэшируется в cache_path и пересобирается через morph
+    (по умолчанию общий get_morph()), только если изменились исходные файлы.
+    Версия словаря (ChargedWords.version) — хэш содержимого этих файлов.
     """
-    words: set[str] = set()
     if not dict_dir.exists():
-        return []
+        return ChargedWords()
+
+    paths = sorted(dict_dir.glob("*.txt"))
+    sources_hash = _dict_sources_hash(paths)
+    cached = _read_dict_cache(cache_path, sources_hash)
+    if cached is not None:
+        return ChargedWords(dictionaries=cached, version=sources_hash)
+
+    if morph is None:
+        morph = get_morph()
 
     def clean_token(tok: str) -> str:
         tok = tok.replace("«", "").replace("»", "").replace("…", "")
         tok = tok.strip(string.punctuation + "—–- «»\t ")
         return tok
 
-    for path in sorted(dict_dir.glob("*.txt")):
+    def normalize_entry(raw_entry: str) -> str:
+        lemmas = []
+        for raw in raw_entry.split():
+            tok = clean_token(raw.lower())
+            if not tok:
+                continue
+            norm = morph.parse(tok)[0].normal_form
+            # незначимые слова выпадают и из потока лемм статьи, поэтому и из фраз
+            if len(norm) > 2 or norm == "не":
+                lemmas.append(norm)
+        return " ".join(lemmas)
+
+    dictionaries: dict[str, set[str]] = {}
+    for path in paths:
+        entries = dictionaries.setdefault(path.stem, set())
         with path.open(encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
                 if not line or line.startswith("#"):
                     continue
-                for raw in line.replace(",", " ").split():
-                    tok = clean_token(raw.lower())
-                    if not tok:
-                        continue
-                    norm = morph.parse(tok)[0].normal_form
-                    if len(norm) > 2 or norm == "не":
-                        words.add(norm)
-    return sorted(words)
-
-
-def extract_title(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
+                for raw_entry in DICT_NOTE_RE.sub(" ", line).split(","):
+                    entry = normalize_entry(raw_entry)
+                    if entry:
+                        entries.add(entry)
+
+    _write_dict_cache(cache_path, sources_hash, dictionaries)
+    return ChargedWords(dictionaries=dictionaries, version=sources_hash)
+
+
+def dict_signature(dict_dir: Path) -> tuple:
+    """Дешёвый признак изменения словарей для периодической проверки: имена, размеры и mtime файлов."""
+    signature = []
+    for path in sorted(dict_dir.glob("*.txt")):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+class DictionaryHolder:
+    """Текущий словарь с горячей перезагрузкой.
+
+    build() собирает словарь (и, если fast, словоформы для быстрого режима) из файлов,
+    не трогая текущий; swap() подменяет пару одним присваиванием. Запрос берёт snapshot()
+    в начале и до конца работает с одной версией словаря.
+    """
+
+    def __init__(self, dict_dir: Path, charged_words: ChargedWords | None = None, forms=None,
+                 fast: bool = False, cache_path: Path | None = DICT_CACHE_PATH):
+        self.dict_dir = dict_dir
+        self.fast = fast
+        self.cache_path = cache_path
+        if charged_words is None:
+            charged_words = load_charged_words(dict_dir, cache_path=cache_path)
+        self._current = (charged_words, forms)
+        self.signature = dict_signature(dict_dir)
+        self.reloads = 0
+        self.loaded_at = time.time()
+
+    @property
+    def charged_words(self) -> ChargedWords:
+        return self._current[0]
+
+    @property
+    def forms(self):
+        return self._current[1]
+
+    def snapshot(self):
+        """(charged_words, forms) одной версии."""
+        return self._current
+
+    def changed(self) -> bool:
+        return dict_signature(self.dict_dir) != self.signature
+
+    def build(self):
+        """Синхронно (вызывать в executor) собирает (charged_words, forms, signature) из файлов."""
+        signature = dict_signature(self.dict_dir)
+        charged_words = load_charged_words(self.dict_dir, cache_path=self.cache_path)
+        forms = self.forms
+        if self.fast and (forms is None or charged_words.version != self.charged_words.version):
+            forms = ChargedForms.expand(get_morph(), charged_words)
+        return charged_words, forms, signature
+
+    def swap(self, charged_words, forms, signature=None) -> bool:
+        """Подменяет словарь; False, если версия та же (файлы тронули, но не изменили)."""
+        if signature is not None:
+            self.signature = signature
+        reloaded = charged_words.version != self.charged_words.version
+        if reloaded or forms is not self.forms:
+            self._current = (charged_words, forms)
+        if reloaded:
+            self.reloads += 1
+            self.loaded_at = time.time()
+        return reloaded
+
+    def stats(self) -> dict:
+        charged_words = self.charged_words
+        return {
+            "version": charged_words.version,
+            "entries": len(charged_words),
+            "dictionaries": {name: len(entries) for name, entries in charged_words.dictionaries.items()},
+            "reloads": self.reloads,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def extract_title(html) -> str:
+    """Принимает HTML-строку или уже разобранный BeautifulSoup."""
+    soup = make_soup(html)
     h1 = soup.select_one("h1")
     if h1 and h1.get_text(strip=True):
         return h1.get_text(strip=True)
@@ -114,81 +382,473 @@ def extract_title(html: str) -> str:
     return (title or "").strip() or "Без заголовка"
 
 
-async def process_article(session, morph, charged_words, url: str, idx: int, results: list):
-    """Добавляет в results словарь: url, status, title, score, words_count, elapsed."""
-    record = {
+def budget_deadline(deadline: float | None, budget: float | None) -> float | None:
+    """Дедлайн статьи, у которой с этого момента есть budget секунд, но не позже deadline."""
+    if budget is None:
+        return deadline
+    started = asyncio.get_running_loop().time() + budget
+    return started if deadline is None else min(deadline, started)
+
+
+def time_left(deadline: float | None, default: float) -> float:
+    """Секунды до deadline (по часам event loop); без дедлайна — default."""
+    if deadline is None:
+        return default
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+async def analyze_text(morph, charged_words, text: str, pool=None, timeout: float = ANALYSIS_TIMEOUT):
+    """Возвращает (lemma_counts, score, hits).
+
+    Записи словарей, в том числе фразы, ищутся в том же проходе по леммам.
+    С пулом анализ уходит в отдельный процесс; если пул сломан,
+    статья считается по-старому, прямо в event loop, а пул пересоздаётся для следующих.
+    Так же, в event loop, считается статья, чей снимок словаря старше словаря пула (после
+    горячей перезагрузки): hits, scores и версия в кэше всегда от одного словаря.
+    Без morph используется общий get_morph().
+    Время в пуле целиком учитывается как стадия lemmatize.
+    """
+    charged_words = ChargedWords.compile(charged_words)
+    if pool is not None:
+        try:
+            with STAGE_SECONDS.time(stage="lemmatize"):
+                return await pool.analyze(text, timeout, version=charged_words.version)
+        except BrokenProcessPool:
+            logger.warning("Пул анализа недоступен, считаем в event loop")
+        except DictionaryMismatch:
+            logger.info("Словарь пула новее словаря запроса, считаем в event loop")
+
+    scan = charged_words.scan()
+    with STAGE_SECONDS.time(stage="lemmatize"):
+        lemma_counts = await asyncio.wait_for(
+            count_lemmas(morph or get_morph(), text, scan=scan),
+            timeout=timeout,
+        )
+    with STAGE_SECONDS.time(stage="score"):
+        score = score_hits(scan.hits, sum(lemma_counts.values()))
+    return lemma_counts, score, scan.hits
+
+
+async def analyze_sample(morph, charged_words, words: list[str], seed, pool=None,
+                         timeout: float = ANALYSIS_TIMEOUT):
+    """Приблизительный анализ длинного текста по стратифицированной выборке кусков.
+
+    Возвращает (words_count, score, score_ci, hits, sampled_words): words_count — оценка
+    числа значимых слов всего текста, hits — вхождения, найденные в выборке, sampled_words —
+    значимые слова выборки. Куски анализируются независимо (с пулом — параллельно).
+    """
+    chunks, population = stratified_chunks(words, seed)
+    charged_words = ChargedWords.compile(charged_words)
+    results = await asyncio.wait_for(asyncio.gather(*(
+        analyze_text(morph, charged_words, chunk, pool, timeout) for chunk in chunks
+    )), timeout=timeout)
+
+    hits = Counter()
+    samples = []
+    for lemma_counts, _score, chunk_hits in results:
+        hits.update(chunk_hits)
+        samples.append((sum(chunk_hits.values()), sum(lemma_counts.values())))
+    score, low, high = ratio_estimate(samples, population)
+    sampled_words = sum(chunk_words for _hits, chunk_words in samples)
+    raw_words = sum(len(chunk.split()) for chunk in chunks)
+    words_count = round(sampled_words / raw_words * len(words)) if raw_words else 0
+    return words_count, score, [low, high], hits, sampled_words
+
+
+def _fill_record(record: dict, title, words_count, score, hits, charged_words) -> dict:
+    record.update({
+        "status": ProcessingStatus.OK.value,
+        "title": title,
+        "score": score,
+        "words_count": words_count,
+        "hits": dict(hits),
+        "scores": ChargedWords.compile(charged_words).dictionary_scores(hits, words_count),
+    })
+    return record
+
+
+def _approximate_record(record: dict, title, estimate, charged_words) -> dict:
+    """Как _fill_record, но words_count и hits — оценки для всего текста: вхождения выборки умножены на долю выборки."""
+    words_count, score, score_ci, sample_hits, sampled_words = estimate
+    scale = words_count / sampled_words if sampled_words else 0
+    hits = {entry: round(count * scale) for entry, count in sample_hits.items()}
+    _fill_record(record, title, words_count, score, hits, charged_words)
+    record["scores"] = ChargedWords.compile(charged_words).dictionary_scores(sample_hits, sampled_words)
+    record["approximate"] = True
+    record["score_ci"] = score_ci
+    return record
+
+
+def _counts_table(lemma_counts, hits) -> tuple[dict, dict]:
+    """Компактная таблица частот для кэша: леммы интернированы и общие для всех статей."""
+    return {sys.intern(lemma): count for lemma, count in lemma_counts.items()}, dict(phrase_hits(hits))
+
+
+def _rescore_entry(entry, charged_words) -> bool:
+    """Приводит запись кэша к текущей версии словаря по её частотам лемм, без сети и морфологии.
+
+    False — частот нет (быстрый режим, перепечатка), и статью нужно анализировать заново.
+    """
+    if entry.version == charged_words.version:
+        return True
+    if entry.counts is None:
+        return False
+    lemma_counts, phrase_counts = entry.counts
+    score, hits = score_lemma_counts(lemma_counts, charged_words, phrase_counts)
+    record = entry.record
+    _fill_record(record, record["title"], sum(lemma_counts.values()), score, hits, charged_words)
+    entry.version = charged_words.version
+    return True
+
+
+def _stored_counts(stored: dict) -> tuple[dict, dict]:
+    return _counts_table(stored["lemma_counts"], stored["phrase_counts"])
+
+
+def _stored_record(record: dict, stored: dict, charged_words) -> dict:
+    """Результат из постоянного хранилища: пересчитывается по частотам лемм и фраз, без морфологии."""
+    score, hits = score_lemma_counts(stored["lemma_counts"], charged_words, stored["phrase_counts"])
+    record["cached"] = True
+    words_count = sum(stored["lemma_counts"].values())
+    return _fill_record(record, stored["title"], words_count, score, hits, charged_words)
+
+
+def _duplicate_score(source: dict, charged_words):
+    """(words_count, score, hits) перепечатки по результатам исходного текста.
+
+    Из его вхождений учитываются только записи, которые есть в словарях сейчас.
+    """
+    words_count = source["words_count"]
+    charged_words = ChargedWords.compile(charged_words)
+    # вхождения слов в source["hits"] уже без лемм, покрытых фразами, поэтому не через score_lemma_counts
+    hits = Counter({
+        entry: count for entry, count in source["hits"].items()
+        if entry in charged_words or entry in charged_words.phrases
+    })
+    return words_count, score_hits(hits, words_count), hits
+
+
+async def analyze_article(session, morph, charged_words, url: str, idx: int,
+                          *, pool=None, cache=None, store=None, flights=None, forms=None,
+                          deadline=None, html=None, sanitizer=None, dedup=None,
+                          approx_words: int | None = None, fetch_slot=None, budget: float | None = None) -> dict:
+    """Возвращает словарь: url, status, title, score, words_count, hits, scores, duplicate_of,
+    approximate, score_ci, cached, elapsed.
+
+    scores — рейтинг по каждому словарю отдельно (например, negative_words и positive_words).
+    duplicate_of — {url, similarity} текста, результаты которого взяты для этой статьи.
+    Текст длиннее approx_words слов (по умолчанию APPROX_WORDS, 0 — без ограничения) оценивается
+    по выборке (analyze_sample): approximate равен True, score_ci — 95% доверительный интервал
+    рейтинга, words_count — оценка.
+
+    deadline — момент по часам event loop, к которому статья должна быть обработана целиком
+    (скачивание, очистка и анализ); без него действуют REQUEST_TIMEOUT и ANALYSIS_TIMEOUT.
+    fetch_slot(url) — асинхронный контекстный менеджер (слот планировщика), который держится
+    только на время скачивания: ответы из кэша и хранилища его не ждут. budget — секунды
+    на статью с момента, когда она получила слот (или, без скачивания, с начала обработки).
+
+    С cache свежий результат отдаётся без сети, а просроченный
+    перепроверяется условным запросом. С store (AnalysisStore) свежая запись
+    из хранилища избавляет от скачивания, а уже встречавшийся текст — от анализа.
+    С flights (SingleFlight) одновременные запросы одного URL с тем же словарём и режимом оценки
+    разделяют одну обработку; дедлайн первого из них на неё не влияет, каждый ждёт её до своего.
+    С forms (ChargedForms) статья оценивается быстрым способом, без лемматизации.
+    С html (уже скачанная или сохранённая страница) статья не скачивается и кэш не проверяется;
+    sanitizer заменяет адаптер, выбранный по хосту url.
+    С dedup (NearDuplicateIndex) перепечатка уже проанализированного текста не лемматизируется.
+    С APPROX_BACKGROUND приблизительно оценённый текст досчитывается полностью в фоне,
+    и следующий запрос получает точный результат из cache или store.
+    """
+    if approx_words is None:
+        approx_words = APPROX_WORDS
+    if flights is not None:
+        # общая обработка не зависит от того, кто пришёл первым: запросы с другим словарём,
+        # режимом оценки или очередью планировщика её не разделяют, а её саму ограничивают
+        # только budget и таймауты стадий — каждый ожидающий ждёт её до своего дедлайна
+        charged_words = ChargedWords.compile(charged_words)
+        version = charged_words.version if charged_words.version is not None else id(charged_words)
+        key = (normalize_url(url), version, forms is not None, fetch_slot, budget)
+        try:
+            async with asyncio.timeout_at(deadline):
+                record = await flights.run(key, partial(
+                    analyze_article, session, morph, charged_words, url, idx,
+                    pool=pool, cache=cache, store=store, forms=forms,
+                    html=html, sanitizer=sanitizer, dedup=dedup, approx_words=approx_words,
+                    fetch_slot=fetch_slot, budget=budget,
+                ))
+        except TimeoutError:
+            record = _new_record(idx, url)
+            record["status"] = ProcessingStatus.TIMEOUT.value
+            _count_article(url, record)
+            return record
+        return {**record, "idx": idx, "url": url}
+
+    ARTICLES_IN_FLIGHT.inc()
+    try:
+        record = await _analyze_article(
+            session, morph, charged_words, url, idx,
+            pool=pool, cache=cache, store=store, forms=forms, deadline=deadline,
+            html=html, sanitizer=sanitizer, dedup=dedup, approx_words=approx_words,
+            fetch_slot=fetch_slot, budget=budget,
+        )
+    finally:
+        ARTICLES_IN_FLIGHT.dec()
+
+    _count_article(url, record)
+    return record
+
+
+def _count_article(url: str, record: dict):
+    ARTICLES.inc(status=record["status"])
+    HOST_ARTICLES.inc(host=host_label(urlparse(url).hostname or ""), status=record["status"])
+
+
+def _new_record(idx: int, url: str) -> dict:
+    return {
         "idx": idx, "url": url, "status": None,
         "title": None, "score": None, "words_count": None,
-        "elapsed": None,
+        "hits": None, "scores": None, "duplicate_of": None, "approximate": False, "score_ci": None,
+        "cached": False, "elapsed": None,
     }
 
-    if not is_valid_url(url):
-        record["status"] = ProcessingStatus.FETCH_ERROR.value
-        results.append(record)
-        return
 
+async def _analyze_article(session, morph, charged_words, url: str, idx: int,
+                           *, pool, cache, store, forms, deadline, html, sanitizer, dedup,
+                           approx_words, fetch_slot, budget) -> dict:
+    charged_words = ChargedWords.compile(charged_words)
+    record = _new_record(idx, url)
+
+    validators = {}
+    if html is not None:
+        # сохранённая страница не скачивается и не сверяется с кэшем, поэтому budget идёт сразу
+        deadline = budget_deadline(deadline, budget)
+    else:
+        if not is_valid_url(url):
+            record["status"] = ProcessingStatus.FETCH_ERROR.value
+            return record
+
+        entry = cache.get(url) if cache is not None else None
+        if entry is not None and not _rescore_entry(entry, charged_words):
+            entry = None
+        if entry is not None and cache.is_fresh(entry):
+            return cache.hit(entry, idx, url)
+
+        stored = None
+        if entry is None and store is not None:
+            stored = await asyncio.to_thread(store.get, url)
+            if stored is not None and store.is_fresh(stored):
+                record = _stored_record(record, stored, charged_words)
+                if cache is not None:
+                    cache.put(url, record, stored["validators"], _stored_counts(stored), charged_words.version)
+                return record
+
+        if entry is not None:
+            validators = entry.validators
+        elif stored is not None:
+            validators = stored["validators"]
+
+        try:
+            # лимиты хоста нужны только запросам в сеть, а время статьи идёт с момента, когда дошла её очередь
+            async with fetch_slot(url) if fetch_slot is not None else nullcontext():
+                deadline = budget_deadline(deadline, budget)
+                async with async_timeout(time_left(deadline, REQUEST_TIMEOUT)):
+                    with STAGE_SECONDS.time(stage="fetch"):
+                        if cache is None and store is None:
+                            html = await fetch(session, url)
+                        else:
+                            html, validators = await fetch_conditional(session, url, validators)
+        except asyncio.TimeoutError:
+            record["status"] = ProcessingStatus.TIMEOUT.value
+            return record
+        except aiohttp.ClientError:
+            record["status"] = ProcessingStatus.FETCH_ERROR.value
+            return record
+
+        if html is None:
+            if store is not None:
+                await asyncio.to_thread(store.refresh, url)
+            if entry is not None:
+                return cache.revalidate(entry, idx, url)
+            record = _stored_record(record, stored, charged_words)
+            if cache is not None:
+                cache.put(url, record, validators, _stored_counts(stored), charged_words.version)
+            return record
+
+    # 2) санитизация: документ разбирается один раз, заголовок берётся до очистки дерева
     try:
-        async with async_timeout(REQUEST_TIMEOUT):
-            html = await fetch(session, url)
-    except asyncio.TimeoutError:
-        record["status"] = ProcessingStatus.TIMEOUT.value
-        results.append(record)
-        return
-    except (aiohttp.ClientError, asyncio.CancelledError):
-        record["status"] = ProcessingStatus.FETCH_ERROR.value
-        results.append(record)
-        return
-
-    # 2) санитизация
-    try:
-        title = extract_title(html)
-        sanitize = pick_sanitizer(url)
-        text = sanitize(html, plaintext=True)
+        with STAGE_SECONDS.time(stage="sanitize"):
+            soup = make_soup(html)
+            title = extract_title(soup)
+            sanitize = sanitizer or pick_sanitizer(url)
+            text = sanitize(soup, plaintext=True)
     except (ValueError, ArticleNotFound):
         record["status"] = ProcessingStatus.PARSING_ERROR.value
-        results.append(record)
-        return
+        return record
     except Exception:
         record["status"] = ProcessingStatus.PARSING_ERROR.value
-        results.append(record)
-        return
+        return record
+
+    # очистка синхронная и прервать её нельзя, поэтому дедлайн проверяется после неё
+    if deadline is not None and not time_left(deadline, 0):
+        record["status"] = ProcessingStatus.TIMEOUT.value
+        return record
 
-    # 3) анализ с таймаутом (split_by_words — async)
+    # 3) анализ с таймаутом (в пуле процессов или в event loop);
+    # текст, который уже есть в хранилище, не анализируется повторно,
+    # а для перепечатки уже проанализированного текста берутся его результаты
     start = time.monotonic()
     try:
-        article_words = await asyncio.wait_for(
-            split_by_words(morph, text),
-            timeout=ANALYSIS_TIMEOUT,
-        )
-        score = calculate_jaundice_rate(article_words, charged_words)
-        record.update({
-            "status": ProcessingStatus.OK.value,
-            "title": title,
-            "score": score,
-            "words_count": len(article_words),
-        })
+        lemma_counts = content = sketch = duplicate = estimate = None
+        key = content_hash(text)
+        if store is not None:
+            content = await asyncio.to_thread(store.get_content, key)
+        if content is None and dedup is not None and forms is None:
+            with STAGE_SECONDS.time(stage="fingerprint"):
+                sketch = dedup.sketch(text)
+                duplicate = dedup.find(key, sketch)
+        if content is not None:
+            lemma_counts, phrase_counts = content
+            with STAGE_SECONDS.time(stage="score"):
+                score, hits = score_lemma_counts(lemma_counts, charged_words, phrase_counts)
+            words_count = sum(lemma_counts.values())
+        elif duplicate is not None:
+            source, similarity = duplicate
+            with STAGE_SECONDS.time(stage="score"):
+                words_count, score, hits = _duplicate_score(source, charged_words)
+            record["duplicate_of"] = {"url": source["url"], "similarity": similarity}
+        elif forms is not None:
+            # частоты лемм в быстром режиме не считаются, поэтому текст не попадёт в store
+            with STAGE_SECONDS.time(stage="score"):
+                words_count, score, hits = score_text_fast(text, forms)
+        else:
+            # длина проверяется без списка слов: он нужен только для выборки
+            if approx_words and longer_than(text, approx_words):
+                estimate = await analyze_sample(
+                    morph, charged_words, text.split(), key, pool, time_left(deadline, ANALYSIS_TIMEOUT),
+                )
+            else:
+                lemma_counts, score, hits = await analyze_text(
+                    morph, charged_words, text, pool, time_left(deadline, ANALYSIS_TIMEOUT),
+                )
+                words_count = sum(lemma_counts.values())
+        if estimate is not None:
+            _approximate_record(record, title, estimate, charged_words)
+        else:
+            _fill_record(record, title, words_count, score, hits, charged_words)
     except asyncio.TimeoutError:
         record["status"] = ProcessingStatus.TIMEOUT.value
     finally:
         record["elapsed"] = time.monotonic() - start
 
-    results.append(record)
+    if record["status"] == ProcessingStatus.OK.value:
+        # частоты лемм выборки не годятся ни для пересчёта, ни для хранилища, ни для перепечаток
+        await _save_result(
+            url, record, text, key, validators, lemma_counts, None if record["approximate"] else sketch,
+            charged_words, cache=cache, store=store, dedup=dedup if duplicate is None else None,
+        )
+        if record["approximate"] and APPROX_BACKGROUND and (cache is not None or store is not None):
+            _run_in_background(_complete_in_background(
+                morph, charged_words, url, dict(record), text, key, validators, sketch,
+                pool=pool, cache=cache, store=store, dedup=dedup,
+            ))
+    return record
+
+
+async def _save_result(url: str, record: dict, text: str, key: str, validators, lemma_counts, sketch,
+                       charged_words, *, cache, store, dedup):
+    """Кладёт готовый результат в кэш, индекс перепечаток и постоянное хранилище."""
+    hits = record["hits"]
+    if cache is not None:
+        counts = _counts_table(lemma_counts, hits) if lemma_counts is not None else None
+        cache.put(url, record, validators, counts, charged_words.version)
+    if sketch is not None and dedup is not None:
+        dedup.add(key, sketch, {"url": url, "words_count": record["words_count"], "hits": dict(hits)})
+    if store is not None and lemma_counts is not None:
+        await asyncio.to_thread(
+            store.save, url, record["title"], text, lemma_counts, validators, phrase_hits(hits),
+        )
+
+
+# фоновые задачи держатся здесь, иначе event loop может собрать их сборщиком мусора
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+def _run_in_background(coro) -> asyncio.Task:
+    task = asyncio.ensure_future(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+async def _complete_in_background(morph, charged_words, url: str, record: dict, text: str, key: str,
+                                  validators, sketch, *, pool, cache, store, dedup):
+    """Полный анализ приблизительно оценённого текста; точный результат заменяет оценку в cache и store."""
+    start = time.monotonic()
+    try:
+        lemma_counts, score, hits = await analyze_text(morph, charged_words, text, pool, APPROX_FULL_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Полный анализ %s не уложился в %s сек", url, APPROX_FULL_TIMEOUT)
+        return
+    except Exception:
+        logger.exception("Полный анализ %s в фоне упал", url)
+        return
+    record.update({"approximate": False, "score_ci": None, "elapsed": time.monotonic() - start})
+    _fill_record(record, record["title"], sum(lemma_counts.values()), score, hits, charged_words)
+    await _save_result(
+        url, record, text, key, validators, lemma_counts, sketch, charged_words,
+        cache=cache, store=store, dedup=dedup,
+    )
+
 
+def warm_cache(cache, store, charged_words, limit: int, dedup=None) -> int:
+    """Заполняет in-memory кэш свежими записями из store; возвращает их число.
+
+    С dedup в индекс перепечаток попадают отпечатки всех последних текстов, в том числе просроченных.
+    """
+    entries = store.recent(limit)
+    fresh = [stored for stored in entries if store.is_fresh(stored)]
+    for stored in reversed(entries):
+        record = _stored_record(
+            {"idx": 0, "url": stored["url"], "duplicate_of": None, "approximate": False, "score_ci": None,
+             "elapsed": None}, stored, charged_words,
+        )
+        if dedup is not None:
+            dedup.add(stored["hash"], dedup.sketch(stored["text"]), {
+                "url": stored["url"], "words_count": record["words_count"], "hits": record["hits"],
+            })
+        if store.is_fresh(stored):
+            cache.put(stored["url"], record, stored["validators"], _stored_counts(stored), charged_words.version)
+    return len(fresh)
+
+
+async def process_article(session, morph, charged_words, url: str, idx: int, results: list,
+                          **options):
+    """Добавляет в results словарь из analyze_article; options передаются туда же."""
+    results.append(await analyze_article(session, morph, charged_words, url, idx, **options))
 
 
 async def main():
 
-    morph = pymorphy3.MorphAnalyzer()
+    morph = get_morph()
     charged_words = load_charged_words(DICT_DIR, morph)
     if not charged_words:
         raise SystemExit(f"Словарь пуст. Положи .txt файлы в {DICT_DIR}")
 
     results: list[dict] = []
+    pool = AnalysisPool(charged_words, ANALYSIS_WORKERS) if ANALYSIS_WORKERS > 0 else None
+    forms = ChargedForms.expand(morph, charged_words) if SCORING_MODE == "fast" else None
 
-    async with aiohttp.ClientSession() as session:
-        async with create_task_group() as tg:
-            for idx, url in enumerate(TEST_ARTICLES):
-                tg.start_soon(process_article, session, morph, charged_words, url, idx, results)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with create_task_group() as tg:
+                for idx, url in enumerate(TEST_ARTICLES):
+                    tg.start_soon(partial(
+                        process_article, session, morph, charged_words, url, idx, results,
+                        pool=pool, forms=forms,
+                    ))
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     for rec in sorted(results, key=lambda r: r["idx"]):
         print(f"URL: {rec['url']}")
@@ -200,4 +860,6 @@ async def main():
         print()
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+"""Метрики в текстовом формате Prometheus, без внешних зависимостей.
+
+Инструментированные метрики регистрируются в REGISTRY при импорте; значения,
+которые удобнее снять в момент запроса (статистика кэшей, очереди), добавляются
+через render_samples.
+"""
+import math
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# хосты берутся из пользовательских URL, поэтому число значений метки ограничено
+MAX_HOST_LABELS = 100
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render_samples(name: str, kind: str, help_text: str, samples) -> str:
+    """samples — пары (labels: dict, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> str:
+        return render_samples(self.name, self.kind, self.help,
+                              [(self._labels(key), value) for key, value in sorted(self._values.items())])
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets) if math.inf in buckets else (*buckets, math.inf)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        bucket_counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                bucket_counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (bucket_counts, total, count) in sorted(self._series.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "jaundice_stage_seconds", "Time spent in each article processing stage.", ["stage"],
+))
+ARTICLES = REGISTRY.register(Counter(
+    "jaundice_articles_total", "Processed articles by status.", ["status"],
+))
+HOST_ARTICLES = REGISTRY.register(Counter(
+    "jaundice_host_articles_total", "Processed articles by host and status.", ["host", "status"],
+))
+ARTICLES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "jaundice_articles_in_flight", "Articles being processed right now.",
+))
+ARTICLES_IN_FLIGHT.set(0)
+RETRIED_FETCHES = REGISTRY.register(Counter(
+    "jaundice_fetch_retries_total", "Repeated page downloads by reason.", ["reason"],
+))
+HEDGED_FETCHES = REGISTRY.register(Counter(
+    "jaundice_fetch_hedges_total", "Hedged page downloads sent and won by the second copy.", ["outcome"],
+))
+
+_known_hosts: set[str] = set()
+
+
+def host_label(host: str) -> str:
+    if host in _known_hosts:
+        return host
+    if len(_known_hosts) < MAX_HOST_LABELS:
+        _known_hosts.add(host)
+        return host
+    return "other"
+
+
+def test_render_formats():
+    registry = Registry()
+    hist = registry.register(Histogram("t_seconds", "Test.", ["stage"], buckets=(0.1, 1.0, math.inf)))
+    counter = registry.register(Counter("t_total", "Test.", ["status"]))
+    hist.observe(0.05, stage="fetch")
+    hist.observe(0.5, stage="fetch")
+    counter.inc(status="OK")
+    counter.inc(2, status="OK")
+
+    text = registry.render()
+    assert 't_seconds_bucket{stage="fetch",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="fetch",le="+Inf"} 2' in text
+    assert 't_seconds_count{stage="fetch"} 2' in text
+    assert 't_total{status="OK"} 3' in text
+    assert "# TYPE t_seconds histogram" in text
+    assert render_samples("g", "gauge", "G.", [({"a": 'x"y'}, 1.5)]).endswith('g{a="x\\"y"} 1.5\n')
@@ -0,0 +1,236 @@
+"""Pre-fork режим сервера: мастер-процесс и N воркеров на одном порту.
+
+Мастер открывает слушающий сокет (или, с reuse_port, воркеры открывают свои
+сокеты с SO_REUSEPORT и соединения распределяет ядро) и следит за воркерами:
+упавший воркер перезапускается, по SIGHUP preload выполняется заново и воркеры
+по очереди плавно заменяются новыми: старый получает SIGTERM только после того, как
+новый сообщил через pipe, что принимает соединения. По SIGTERM/SIGINT все останавливаются.
+
+Тяжёлые общие данные (MorphAnalyzer, словарь) загружаются в мастере до fork:
+воркеры получают их копией страниц при записи и не строят заново. То, что вернул
+preload, передаётся в app_factory каждого воркера.
+"""
+import asyncio
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import time
+from contextlib import suppress
+
+from aiohttp import web
+
+logger = logging.getLogger("jaundice-rate.prefork")
+
+# воркер, проживший меньше, считается упавшим при старте: перезапуск с паузой
+MIN_WORKER_UPTIME = 1.0
+RESTART_DELAY = 1.0
+SHUTDOWN_TIMEOUT = 10.0
+# сколько остановленный воркер ещё ждёт запросов в уже принятых соединениях
+DRAIN_DELAY = 0.5
+# сколько мастер ждёт готовности нового воркера при SIGHUP, прежде чем оставить старый
+READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", "60"))
+
+
+def make_listening_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    def __init__(self, app_factory, host: str, port: int, workers: int, reuse_port: bool = False):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.sock = None
+        self._children: dict[int, float] = {}
+        # воркеры, остановленные мастером (SIGHUP), — их выход не считается падением
+        self._retiring: set[int] = set()
+        self._stopping = False
+        self._reload = False
+        self._preload = None
+        self._preloaded = None
+        self.restarts = 0
+
+    def _run_worker(self, ready_fd: int):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+        sock = self.sock
+        if self.reuse_port:
+            sock = make_listening_socket(self.host, self.port, reuse_port=True)
+        app = self.app_factory() if self._preloaded is None else self.app_factory(self._preloaded)
+        asyncio.run(self._serve(app, sock, ready_fd))
+
+    async def _serve(self, app: web.Application, sock: socket.socket, ready_fd: int):
+        """Обслуживает сокет до SIGTERM/SIGINT, затем плавно останавливается.
+
+        Готовность сообщается мастеру, когда сайт уже принимает соединения. При остановке
+        воркер сначала перестаёт принимать новые соединения и даёт уже принятым DRAIN_DELAY
+        прислать запрос: иначе aiohttp закрыл бы их как простаивающие без ответа.
+        """
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        runner = web.AppRunner(app, shutdown_timeout=SHUTDOWN_TIMEOUT, handler_cancellation=True)
+        await runner.setup()
+        try:
+            site = web.SockSite(runner, sock)
+            await site.start()
+            with suppress(BrokenPipeError):
+                os.write(ready_fd, b"1")
+            os.close(ready_fd)
+            await stop.wait()
+            await site.stop()
+            await asyncio.sleep(DRAIN_DELAY)
+        finally:
+            await runner.cleanup()
+
+    def _spawn(self, wait_ready: bool = False) -> int | None:
+        """Запускает воркер и возвращает его pid.
+
+        С wait_ready ждёт, пока воркер начнёт принимать соединения; не успевший за READY_TIMEOUT
+        воркер останавливается, и возвращается None.
+        """
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 0
+            try:
+                self._run_worker(ready_w)
+            except BaseException:
+                logger.exception("Воркер %s упал", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        self._children[pid] = time.monotonic()
+        logger.info("Запущен воркер %s", pid)
+        try:
+            if wait_ready and not self._wait_ready(ready_r):
+                logger.error("Воркер %s не поднялся за %s с", pid, READY_TIMEOUT)
+                self._terminate(pid)
+                return None
+        finally:
+            os.close(ready_r)
+        return pid
+
+    @staticmethod
+    def _wait_ready(ready_fd: int) -> bool:
+        readable, _, _ = select.select([ready_fd], [], [], READY_TIMEOUT)
+        # упавший при старте воркер закрывает pipe, не записав ничего
+        return bool(readable) and os.read(ready_fd, 1) == b"1"
+
+    def _reap(self) -> list[tuple[int, float]]:
+        """Собирает завершившихся воркеров: [(pid, сколько прожил)]."""
+        finished = []
+        while self._children:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started_at = self._children.pop(pid, None)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+            elif started_at is not None:
+                finished.append((pid, time.monotonic() - started_at))
+        return finished
+
+    def _handle_signal(self, signum, _frame):
+        if signum == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stopping = True
+
+    def _rolling_restart(self):
+        """Плавная замена: заново preload, затем по одному — новый воркер и, когда он готов, SIGTERM старому.
+
+        Если preload упал или новый воркер не поднялся, остальные старые воркеры продолжают работать.
+        """
+        if self._preload is not None:
+            try:
+                self._preloaded = self._preload()
+            except Exception:
+                logger.exception("SIGHUP: preload не удался, воркеры не перезапускаются")
+                return
+            gc.freeze()
+        for old_pid in list(self._children):
+            if old_pid not in self._children:
+                continue
+            if self._spawn(wait_ready=True) is None:
+                logger.error("SIGHUP: плавный перезапуск остановлен")
+                return
+            self._terminate(old_pid)
+
+    def _terminate(self, pid: int):
+        self._retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self._children.pop(pid, None)
+            self._retiring.discard(pid)
+
+    def _shutdown(self):
+        for pid in list(self._children):
+            self._terminate(pid)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                self._children.pop(pid, None)
+        while self._children:
+            self._children.pop(os.waitpid(-1, 0)[0], None)
+
+    def run(self, preload=None):
+        if not self.reuse_port:
+            self.sock = make_listening_socket(self.host, self.port)
+        self._preload = preload
+        if preload is not None:
+            self._preloaded = preload()
+        # объекты, созданные до fork, не трогаются сборщиком мусора в воркерах — меньше копирования страниц
+        gc.freeze()
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._handle_signal)
+
+        logger.info("Мастер %s: %s воркеров на %s:%s", os.getpid(), self.workers, self.host, self.port)
+        for _ in range(self.workers):
+            self._spawn()
+
+        try:
+            while not self._stopping:
+                for pid, uptime in self._reap():
+                    if self._stopping:
+                        break
+                    logger.warning("Воркер %s завершился, перезапускаем", pid)
+                    if uptime < MIN_WORKER_UPTIME:
+                        time.sleep(RESTART_DELAY)
+                    self.restarts += 1
+                if self._reload:
+                    self._reload = False
+                    logger.info("SIGHUP: плавный перезапуск воркеров")
+                    self._rolling_restart()
+                while not self._stopping and len(self._children) < self.workers:
+                    self._spawn()
+                time.sleep(0.1)
+        finally:
+            self._shutdown()
+            if self.sock is not None:
+                self.sock.close()
@@ -0,0 +1,133 @@
+"""In-memory кэш результатов анализа по нормализованному URL.
+
+Свежая запись отдаётся сразу. Просроченная запись с ETag/Last-Modified
+перепроверяется условным запросом: на 304 статья не скачивается и не
+анализируется заново. Вместе с записью хранятся частоты лемм статьи, чтобы
+после смены словаря пересчитать рейтинг без сети и морфологии.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Приводит URL к каноническому виду: регистр схемы и хоста, порт по умолчанию,
+    порядок query-параметров, без фрагмента."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+@dataclass
+class CacheEntry:
+    record: dict
+    validators: dict = field(default_factory=dict)
+    expires_at: float = 0.0
+    # (lemma_counts, phrase_counts) статьи: по ним запись пересчитывается под новый словарь
+    counts: tuple | None = None
+    # версия словаря, с которой посчитана запись
+    version: str | None = None
+
+
+class ResultCache:
+    """LRU-кэш результатов process_article с TTL."""
+
+    def __init__(self, ttl: float = RESULT_CACHE_TTL, maxsize: int = RESULT_CACHE_SIZE,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, url: str) -> CacheEntry | None:
+        key = normalize_url(url)
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self._clock() < entry.expires_at
+
+    def put(self, url: str, record: dict, validators: dict | None = None,
+            counts: tuple | None = None, version: str | None = None):
+        key = normalize_url(url)
+        self._data[key] = CacheEntry(
+            record=dict(record),
+            validators=dict(validators or {}),
+            expires_at=self._clock() + self.ttl,
+            counts=counts,
+            version=version,
+        )
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def hit(self, entry: CacheEntry, idx: int, url: str) -> dict:
+        """Запись из кэша без сети."""
+        self.hits += 1
+        return {**entry.record, "idx": idx, "url": url, "cached": True}
+
+    def revalidate(self, entry: CacheEntry, idx: int, url: str) -> dict:
+        """Сервер ответил 304: продлеваем запись и отдаём её."""
+        self.revalidated += 1
+        entry.expires_at = self._clock() + self.ttl
+        return {**entry.record, "idx": idx, "url": url, "cached": True}
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://InoSMI.ru:443/a.html?b=2&a=1#comments") == "https://inosmi.ru/a.html?a=1&b=2"
+    assert normalize_url("http://inosmi.ru:8080") == "http://inosmi.ru:8080/"
+
+
+def test_result_cache_ttl_and_eviction():
+    now = [0.0]
+    cache = ResultCache(ttl=10, maxsize=2, clock=lambda: now[0])
+    cache.put("https://inosmi.ru/a.html", {"score": 1.0}, {"ETag": '"v1"'})
+    cache.put("https://inosmi.ru/b.html", {"score": 2.0})
+
+    entry = cache.get("https://INOSMI.ru/a.html#top")
+    assert cache.is_fresh(entry)
+    assert cache.hit(entry, 3, "https://INOSMI.ru/a.html#top")["cached"] is True
+
+    now[0] = 11.0
+    assert not cache.is_fresh(entry)
+    assert cache.revalidate(entry, 0, "https://inosmi.ru/a.html")["score"] == 1.0
+    assert cache.is_fresh(entry)
+
+    cache.put("https://inosmi.ru/c.html", {"score": 3.0})
+    assert cache.get("https://inosmi.ru/b.html") is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,99 @@
+"""Приблизительная оценка очень длинных текстов по выборке кусков.
+
+Время лемматизации растёт линейно с длиной текста, и книга целиком не укладывается
+в ANALYSIS_TIMEOUT. Текст длиннее APPROX_WORDS слов режется на куски по
+APPROX_CHUNK_WORDS слов, куски делятся на равные подряд идущие группы (страты),
+и из каждой группы случайно берётся один кусок — всего около APPROX_SAMPLE_WORDS
+слов. Так выборка покрывает весь текст от начала до конца, а не только его часть.
+
+Рейтинг — оценка отношения: попадания в выбранных кусках на значимые слова в них.
+Доверительный интервал — по дисперсии этого отношения между кусками (с поправкой
+на конечную совокупность). Выборка зависит только от seed, поэтому один и тот же
+текст всегда получает одну и ту же оценку.
+"""
+import math
+import os
+import random
+import re
+from itertools import islice
+
+
+# тексты длиннее стольких слов оцениваются по выборке; 0 — всегда полный анализ
+APPROX_WORDS = int(os.getenv("APPROX_WORDS", "20000"))
+# сколько слов в сумме лемматизируется для оценки
+APPROX_SAMPLE_WORDS = int(os.getenv("APPROX_SAMPLE_WORDS", "6000"))
+APPROX_CHUNK_WORDS = 150
+# z-квантиль нормального распределения для 95% доверительного интервала
+APPROX_CONFIDENCE_Z = 1.96
+
+TOKEN_RE = re.compile(r"\S+")
+
+
+def longer_than(text: str, words: int) -> bool:
+    """Больше ли в тексте words слов; просматривает не больше words + 1 слова и не строит их список."""
+    return next(islice(TOKEN_RE.finditer(text), words, None), None) is not None
+
+
+def stratified_chunks(words: list[str], seed, chunk_words: int = APPROX_CHUNK_WORDS,
+                      sample_words: int = APPROX_SAMPLE_WORDS) -> tuple[list[str], int]:
+    """(выбранные куски текстом, число кусков во всём тексте); по одному куску из каждой страты."""
+    population = math.ceil(len(words) / chunk_words)
+    size = min(population, max(2, sample_words // chunk_words))
+    rng = random.Random(seed)
+    chunks = []
+    for stratum in range(size):
+        index = rng.randrange(stratum * population // size, (stratum + 1) * population // size)
+        chunks.append(" ".join(words[index * chunk_words:(index + 1) * chunk_words]))
+    return chunks, population
+
+
+def ratio_estimate(samples, population: int, z: float = APPROX_CONFIDENCE_Z) -> tuple[float, float, float]:
+    """(рейтинг, нижняя и верхняя граница интервала) по парам (попадания, значимые слова) кусков выборки."""
+    size = len(samples)
+    hits = sum(chunk_hits for chunk_hits, _words in samples)
+    words = sum(chunk_words for _hits, chunk_words in samples)
+    if not words:
+        return 0.0, 0.0, 0.0
+    ratio = hits / words
+    if size < 2:
+        return round(ratio * 100, 2), round(ratio * 100, 2), round(ratio * 100, 2)
+    residuals = sum((chunk_hits - ratio * chunk_words) ** 2 for chunk_hits, chunk_words in samples)
+    variance = (1 - size / population) * residuals / (size - 1) / (size * (words / size) ** 2)
+    half_width = z * math.sqrt(max(0.0, variance)) * 100
+    score = ratio * 100
+    return round(score, 2), round(max(0.0, score - half_width), 2), round(score + half_width, 2)
+
+
+def test_stratified_chunks_cover_whole_text():
+    words = [f"слово{i}" for i in range(10_000)]
+    chunks, population = stratified_chunks(words, "seed", chunk_words=100, sample_words=1000)
+    assert population == 100 and len(chunks) == 10
+    # по куску из каждой десятой части текста
+    firsts = [int(chunk.split()[0].removeprefix("слово")) for chunk in chunks]
+    assert [first // 1000 for first in firsts] == list(range(10))
+    assert chunks == stratified_chunks(words, "seed", chunk_words=100, sample_words=1000)[0]
+
+    short, population = stratified_chunks(words[:150], "seed", chunk_words=100, sample_words=1000)
+    assert population == 2 and " ".join(short).split() == words[:150]
+
+
+def test_longer_than():
+    assert longer_than("раз два три", 2)
+    assert not longer_than("раз два три", 3)
+    assert not longer_than("", 0) and longer_than(" раз ", 0)
+
+
+def test_ratio_estimate_interval():
+    uniform = [(2, 100)] * 20
+    assert ratio_estimate(uniform, 200) == (2.0, 2.0, 2.0)
+
+    rng = random.Random(1)
+    population = [(rng.choice((0, 1, 2, 3, 4)), 100) for _ in range(1000)]
+    true_score = sum(hits for hits, _words in population) / (100 * len(population)) * 100
+    score, low, high = ratio_estimate(rng.sample(population, 50), len(population))
+    assert low < score < high
+    assert low <= true_score <= high
+
+    assert ratio_estimate([], 10) == (0.0, 0.0, 0.0)
+    # выборка из всей совокупности — интервал схлопывается в точку
+    assert ratio_estimate(population[:10], 10)[1:] == (ratio_estimate(population[:10], 10)[0],) * 2
@@ -0,0 +1,315 @@
+"""Планировщик обработки URL: общий лимит параллельности и «вежливость» к каждому хосту.
+
+На хост ограничено число одновременных запросов и их частота (запросов в секунду),
+поэтому большая пачка ссылок не открывает тысячи соединений к одному сайту.
+Очередь ожидания ограничена: запрос, которому не хватает места, сразу получает отказ
+(QueueFull), а не ждёт вместе со всеми, пока не истечёт таймаут.
+Освободившееся место достаётся сначала интерактивным запросам, а пакетные (bulk) ждут,
+пока интерактивных в очереди не останется: GET не стоит за тысячами ссылок выгрузки архива.
+"""
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "50"))
+HOST_CONCURRENCY = int(os.getenv("HOST_CONCURRENCY", "4"))
+HOST_RATE = float(os.getenv("HOST_RATE", "5"))
+# сколько статей может ждать слота сверх SCHEDULER_CONCURRENCY выполняемых
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "5000"))
+# отдельное место для статей пакетных запросов: выгрузка архива не занимает очередь обычных
+SCHEDULER_MAX_BULK_QUEUE = int(os.getenv("SCHEDULER_MAX_BULK_QUEUE", "10000"))
+
+
+class QueueFull(Exception):
+    """Очередь планировщика заполнена, запрос не принят."""
+
+
+class _PrioritySemaphore:
+    """Семафор с двумя очередями: место отдаётся ждущему интерактивному запросу раньше пакетного."""
+
+    __slots__ = ("_value", "_waiters")
+
+    def __init__(self, value: int):
+        self._value = value
+        # (интерактивные, пакетные)
+        self._waiters = (deque(), deque())
+
+    async def acquire(self, bulk: bool = False):
+        if self._value > 0 and not any(self._waiters):
+            self._value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._waiters[bulk]
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                queue.remove(waiter)
+            else:
+                # место уже передали, но задачу отменили раньше, чем она его заняла
+                self.release()
+            raise
+
+    def release(self):
+        for queue in self._waiters:
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._value += 1
+
+    @asynccontextmanager
+    async def hold(self, bulk: bool = False):
+        await self.acquire(bulk)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class _HostLimiter:
+    __slots__ = ("semaphore", "interval", "next_at", "queued", "in_flight")
+
+    def __init__(self, concurrency: int, rate: float):
+        self.semaphore = _PrioritySemaphore(concurrency)
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+        self.queued = 0
+        self.in_flight = 0
+
+    async def wait_turn(self):
+        """Выдерживает интервал между стартами запросов к хосту."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start_at = max(now, self.next_at)
+        self.next_at = start_at + self.interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    def is_idle(self, now: float) -> bool:
+        return not self.queued and not self.in_flight and self.next_at <= now
+
+
+class Scheduler:
+    def __init__(self, concurrency: int = SCHEDULER_CONCURRENCY,
+                 host_concurrency: int = HOST_CONCURRENCY, host_rate: float = HOST_RATE,
+                 max_queue: int = SCHEDULER_MAX_QUEUE, max_bulk_queue: int = SCHEDULER_MAX_BULK_QUEUE):
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.host_rate = host_rate
+        self.max_queue = max_queue
+        self.max_bulk_queue = max_bulk_queue
+        # статьи принятых запросов, которые ещё не обработаны (ждут или выполняются)
+        self.admitted = 0
+        self.admitted_bulk = 0
+        self.rejected = 0
+        self._global = _PrioritySemaphore(concurrency)
+        self._hosts: dict[str, _HostLimiter] = {}
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.concurrency + self.max_queue
+
+    @contextmanager
+    def admission(self, count: int, bulk: bool = False):
+        """Резервирует место под count статей на всё время запроса или бросает QueueFull.
+
+        Пакетные (bulk) запросы принимаются в пределах своего max_bulk_queue и не отнимают
+        место у обычных.
+        """
+        admitted, capacity = (self.admitted_bulk, self.max_bulk_queue) if bulk else (self.admitted, self.capacity)
+        if admitted + count > capacity:
+            self.rejected += 1
+            raise QueueFull(f"{admitted} articles admitted, capacity {capacity}")
+        self._admit(count, bulk)
+        try:
+            yield
+        finally:
+            self._admit(-count, bulk)
+
+    def _admit(self, count: int, bulk: bool):
+        if bulk:
+            self.admitted_bulk += count
+        else:
+            self.admitted += count
+
+    @asynccontextmanager
+    async def slot(self, url: str, bulk: bool = False):
+        """Место для запроса к хосту url; пакетный (bulk) получает его после всех ждущих интерактивных."""
+        host = urlsplit(url).hostname or ""
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            self._sweep()
+            limiter = self._hosts[host] = _HostLimiter(self.host_concurrency, self.host_rate)
+
+        self.queued += 1
+        limiter.queued += 1
+        dequeued = False
+        try:
+            async with limiter.semaphore.hold(bulk):
+                await limiter.wait_turn()
+                async with self._global.hold(bulk):
+                    self.queued -= 1
+                    limiter.queued -= 1
+                    dequeued = True
+                    self.in_flight += 1
+                    limiter.in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self.in_flight -= 1
+                        limiter.in_flight -= 1
+                        self.completed += 1
+        finally:
+            if not dequeued:
+                self.queued -= 1
+                limiter.queued -= 1
+            if limiter.is_idle(asyncio.get_running_loop().time()):
+                self._hosts.pop(host, None)
+
+    def bulk_slot(self, url: str):
+        return self.slot(url, bulk=True)
+
+    def _sweep(self):
+        """Забывает хосты без работы, у которых уже прошёл интервал частоты."""
+        now = asyncio.get_running_loop().time()
+        for host in [host for host, limiter in self._hosts.items() if limiter.is_idle(now)]:
+            del self._hosts[host]
+
+    async def run(self, url: str, coro_factory, bulk: bool = False):
+        async with self.slot(url, bulk):
+            return await coro_factory()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "host_concurrency": self.host_concurrency,
+            "host_rate": self.host_rate,
+            "max_queue": self.max_queue,
+            "max_bulk_queue": self.max_bulk_queue,
+            "admitted": self.admitted,
+            "admitted_bulk": self.admitted_bulk,
+            "rejected": self.rejected,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "hosts": {
+                host: {"queued": limiter.queued, "in_flight": limiter.in_flight}
+                for host, limiter in self._hosts.items()
+                if limiter.queued or limiter.in_flight
+            },
+        }
+
+
+def _peak_concurrency(scheduler, urls):
+    active = {}
+    peak = {}
+
+    async def work(host):
+        for key in ("global", host):
+            active[key] = active.get(key, 0) + 1
+            peak[key] = max(peak.get(key, 0), active[key])
+        await asyncio.sleep(0.01)
+        for key in ("global", host):
+            active[key] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(
+            scheduler.run(url, lambda url=url: work(urlsplit(url).hostname)) for url in urls
+        ))
+
+    asyncio.run(scenario())
+    return peak
+
+
+def test_scheduler_limits():
+    scheduler = Scheduler(concurrency=3, host_concurrency=2, host_rate=0)
+    peak = _peak_concurrency(scheduler, [f"https://a.ru/{i}" for i in range(6)])
+    assert peak == {"global": 2, "a.ru": 2}
+
+    scheduler = Scheduler(concurrency=3, host_concurrency=2, host_rate=0)
+    peak = _peak_concurrency(scheduler, [f"https://{host}.ru/{i}" for i in range(4) for host in "abcd"])
+    assert peak["global"] == 3
+    assert max(peak[f"{host}.ru"] for host in "abcd") <= 2
+
+    stats = scheduler.stats()
+    assert stats["completed"] == 16
+    assert stats["queued"] == 0 and stats["in_flight"] == 0 and stats["hosts"] == {}
+
+
+def test_scheduler_host_rate():
+    async def scenario():
+        scheduler = Scheduler(concurrency=10, host_concurrency=10, host_rate=50)
+        loop = asyncio.get_running_loop()
+        started = []
+
+        async def work():
+            started.append(loop.time())
+
+        await asyncio.gather(*(scheduler.run("https://inosmi.ru/x", work) for _ in range(5)))
+        return started
+
+    started = asyncio.run(scenario())
+    assert started[-1] - started[0] >= 4 * 0.02 - 0.005
+
+
+def test_scheduler_admission():
+    scheduler = Scheduler(concurrency=2, max_queue=3)
+    with scheduler.admission(4):
+        try:
+            with scheduler.admission(2):
+                raise AssertionError("сверх capacity запрос не должен приниматься")
+        except QueueFull:
+            pass
+        with scheduler.admission(1):
+            assert scheduler.admitted == 5
+    assert scheduler.admitted == 0
+    assert scheduler.stats()["rejected"] == 1
+
+    # пакетный запрос считается отдельно и не занимает место обычных
+    scheduler = Scheduler(concurrency=2, max_queue=3, max_bulk_queue=100)
+    with scheduler.admission(100, bulk=True):
+        with scheduler.admission(5):
+            assert scheduler.admitted == 5 and scheduler.admitted_bulk == 100
+        try:
+            with scheduler.admission(1, bulk=True):
+                raise AssertionError("сверх max_bulk_queue пакетный запрос не должен приниматься")
+        except QueueFull:
+            pass
+    assert scheduler.admitted_bulk == 0
+
+
+def test_scheduler_serves_interactive_before_bulk():
+    async def scenario():
+        scheduler = Scheduler(concurrency=10, host_concurrency=1, host_rate=0)
+        order = []
+
+        async def work(name):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+        tasks = [
+            asyncio.ensure_future(scheduler.run("https://inosmi.ru/x", lambda i=i: work(f"bulk{i}"), bulk=True))
+            for i in range(20)
+        ]
+        await asyncio.sleep(0.005)
+        started = len(order)
+        await scheduler.run("https://inosmi.ru/x", lambda: work("get"))
+        # отменённый пакетный ожидающий не теряет место семафора
+        tasks[-1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return order, started, scheduler.stats()
+
+    order, started, stats = asyncio.run(scenario())
+    # GET ждёт только статью, уже получившую слот хоста, а не всю очередь пакетных
+    assert order.index("get") <= started + 1
+    assert len(order) == 20 and "bulk19" not in order
+    assert stats["queued"] == 0 and stats["in_flight"] == 0
@@ -1,22 +1,87 @@
 # server.py
+import argparse
 import asyncio
+import json
+import logging
+import os
+from contextlib import suppress
 from functools import partial
-from pathlib import Path
 from typing import List
 
 import aiohttp
 from aiohttp import web
 from anyio import create_task_group
-import pymorphy3
 
+from analysis_pool import ANALYSIS_WORKERS, AnalysisPool
+from dedup import DEDUP_SIZE, NearDuplicateIndex
+from fetch_policy import FETCH_POLICY
+from metrics import REGISTRY, render_samples
 from main import (
+    DICT_DIR,
+    SCORING_MODE,
+    DictionaryHolder,
     process_article,
-    load_charged_words,
+    setup_logging,
+    warm_cache,
     # HEADERS,
 )
+from result_cache import ResultCache
+from scheduler import QueueFull, Scheduler
+from singleflight import SingleFlight
+from store import STORE_PATH, STORE_WARM, STORE_WARM_LIMIT, AnalysisStore
+from text_tools import LEMMA_CACHE, get_morph
 
 
 MAX_URLS = 10
+# в потоковом режиме результаты не копятся в памяти, поэтому лимит выше
+MAX_STREAM_URLS = int(os.getenv("MAX_STREAM_URLS", "100"))
+# POST /analyze: пачка ссылок в теле запроса, выполняется через планировщик
+MAX_BULK_URLS = int(os.getenv("MAX_BULK_URLS", "5000"))
+
+# общий дедлайн запроса: ожидание в очереди, скачивание, очистка и анализ каждой статьи
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "20"))
+# POST /analyze: тысячи ссылок на один хост ждут в очереди дольше REQUEST_DEADLINE (HOST_RATE),
+# поэтому у пачки общего дедлайна нет, а время каждой статьи отсчитывается с момента, когда она получила слот
+BULK_ARTICLE_DEADLINE = float(os.getenv("BULK_ARTICLE_DEADLINE", str(REQUEST_DEADLINE)))
+# через сколько секунд клиенту стоит повторить запрос, получив 503
+RETRY_AFTER = int(os.getenv("RETRY_AFTER", "1"))
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# число воркеров pre-fork режима (prefork.py); 1 — обычный однопроцессный сервер
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", "100"))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "10"))
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))
+KEEPALIVE_TIMEOUT = float(os.getenv("KEEPALIVE_TIMEOUT", "30"))
+
+# как часто (секунды) проверять, не изменились ли charged_dict/*.txt; 0 — только через POST /admin/reload-dictionary
+DICT_RELOAD_INTERVAL = float(os.getenv("DICT_RELOAD_INTERVAL", "5"))
+
+HTTP_SESSION = web.AppKey("http_session", aiohttp.ClientSession)
+SCHEDULER = web.AppKey("scheduler", Scheduler)
+DICTIONARY = web.AppKey("dictionary", DictionaryHolder)
+DICTIONARY_LOCK = web.AppKey("dictionary_lock", asyncio.Lock)
+
+logger = logging.getLogger("jaundice-rate.server")
+
+
+async def http_session_ctx(app: web.Application):
+    """Одна ClientSession на всё время жизни приложения: keep-alive и DNS-кэш переживают запросы."""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        app[HTTP_SESSION] = session
+        yield
 
 
 def parse_urls_param(request: web.Request) -> List[str]:
@@ -24,13 +89,21 @@ def parse_urls_param(request: web.Request) -> List[str]:
     return [u.strip() for u in raw.split(",") if u.strip()]
 
 
-async def call_process(url: str, session: aiohttp.ClientSession, morph, charged_words):
+def empty_result(url: str, status: str) -> dict:
+    return {"status": status, "url": url, "score": None, "words_count": None,
+            "hits": None, "scores": None, "duplicate_of": None, "approximate": False, "score_ci": None,
+            "cached": False}
+
+
+async def call_process(url: str, session: aiohttp.ClientSession, morph, charged_words, **options):
+    """options — общие для приложения pool, cache, store, flights, forms, dedup, а также deadline, budget
+    и fetch_slot запроса для process_article."""
 
     results: list[dict] = []
-    await process_article(session, morph, charged_words, url, 0, results)
+    await process_article(session, morph, charged_words, url, 0, results, **options)
 
     if not results:
-        return {"status": "PARSING_ERROR", "url": url, "score": None, "words_count": None}
+        return empty_result(url, "PARSING_ERROR")
 
     rec = results[0]
     return {
@@ -38,33 +111,175 @@ async def call_process(url: str, session: aiohttp.ClientSession, morph, charged_
         "url": url,
         "score": rec.get("score"),
         "words_count": rec.get("words_count"),
+        "hits": rec.get("hits"),
+        "scores": rec.get("scores"),
+        "duplicate_of": rec.get("duplicate_of"),
+        "approximate": rec.get("approximate", False),
+        "score_ci": rec.get("score_ci"),
+        "cached": rec.get("cached", False),
     }
 
 
-async def _run_one(url, session, morph, charged_words, results):
-    rec = await call_process(url, session, morph, charged_words)
+async def schedule_process(request: web.Request, url: str, morph, charged_words, options,
+                           deadline: float | None, bulk: bool = False):
+    """call_process со слотом планировщика вокруг скачивания; не успевшая к дедлайну статья — TIMEOUT.
+
+    Слот (лимиты хоста) держится только на время запроса в сеть: ответы из кэша и хранилища
+    и запросы, присоединившиеся к уже идущей обработке, его не ждут.
+    deadline — общий дедлайн запроса, в него входит и ожидание в очереди.
+    Пакетные (bulk) статьи ждут слота после интерактивных, а BULK_ARTICLE_DEADLINE
+    отсчитывается с момента, когда статья получила слот.
+    """
+    session = request.app[HTTP_SESSION]
+    scheduler = request.app[SCHEDULER]
+    if bulk:
+        fetch_slot, budget = scheduler.bulk_slot, BULK_ARTICLE_DEADLINE
+    else:
+        fetch_slot, budget = scheduler.slot, None
+    try:
+        async with asyncio.timeout_at(deadline):
+            return await call_process(
+                url, session, morph, charged_words,
+                deadline=deadline, budget=budget, fetch_slot=fetch_slot, **options,
+            )
+    except TimeoutError:
+        return empty_result(url, "TIMEOUT")
+
+
+def pick_stream_format(request: web.Request) -> str | None:
+    """Формат потокового ответа из ?format= или заголовка Accept; None — обычный JSON-массив."""
+    fmt = request.query.get("format")
+    if fmt:
+        if fmt not in STREAM_FORMATS and fmt != "json":
+            raise web.HTTPBadRequest(
+                text=json.dumps({"error": f"unknown format, expected one of: json, {', '.join(STREAM_FORMATS)}"}),
+                content_type="application/json",
+            )
+        return None if fmt == "json" else fmt
+
+    accept = request.headers.get("Accept", "")
+    for fmt, content_type in STREAM_FORMATS.items():
+        if content_type in accept:
+            return fmt
+    return None
+
+
+def encode_stream_record(rec: dict, fmt: str) -> bytes:
+    data = json.dumps(rec)
+    if fmt == "sse":
+        return f"event: result\ndata: {data}\n\n".encode()
+    return f"{data}\n".encode()
+
+
+async def stream_results(request: web.Request, urls, morph, charged_words, options,
+                         deadline: float | None, bulk: bool, fmt: str):
+    """Отдаёт каждый результат, как только он готов; заголовки уходят сразу."""
+    response = web.StreamResponse(headers={
+        "Content-Type": STREAM_FORMATS[fmt],
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+
+    tasks = [
+        asyncio.ensure_future(schedule_process(request, url, morph, charged_words, options, deadline, bulk))
+        for url in urls
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            await response.write(encode_stream_record(await next_done, fmt))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if fmt == "sse":
+        await response.write(b"event: done\ndata: {}\n\n")
+    await response.write_eof()
+    return response
+
+
+async def _run_one(request, url, morph, charged_words, options, deadline, bulk, results):
+    rec = await schedule_process(request, url, morph, charged_words, options, deadline, bulk)
     results.append(rec)
 
 
-async def analyze_handler(request: web.Request, morph, charged_words):
+async def respond_with_results(request: web.Request, urls, morph, charged_words, options,
+                               stream_format: str | None, bulk: bool = False):
+    """Принимает запрос, если в очереди планировщика есть место под все его ссылки, иначе 503.
+
+    Место для пакетных (bulk) запросов отдельное, поэтому выгрузка архива не отнимает его у обычных.
+
+    Обычный запрос укладывается в REQUEST_DEADLINE целиком; у пакетного (bulk)
+    каждая статья получает BULK_ARTICLE_DEADLINE с момента, когда дошла её очередь.
+
+    Если клиент отключится, aiohttp отменит обработчик (handler_cancellation),
+    а вместе с ним и все незавершённые статьи запроса.
+    """
+    try:
+        with request.app[SCHEDULER].admission(len(urls), bulk):
+            deadline = None if bulk else asyncio.get_running_loop().time() + REQUEST_DEADLINE
+            if stream_format:
+                return await stream_results(
+                    request, urls, morph, charged_words, options, deadline, bulk, stream_format,
+                )
+
+            results: list[dict] = []
+            async with create_task_group() as tg:
+                for url in urls:
+                    tg.start_soon(_run_one, request, url, morph, charged_words, options, deadline, bulk, results)
+
+            return web.json_response(results)
+    except QueueFull:
+        return web.json_response(
+            {"error": "server is overloaded, retry later"},
+            status=503,
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+
+
+async def analyze_handler(request: web.Request, morph, options):
 
     urls = parse_urls_param(request)
     if not urls:
         return web.json_response({"error": "query parameter 'urls' is required"}, status=400)
 
-    if len(urls) > MAX_URLS:
+    stream_format = pick_stream_format(request)
+    max_urls = MAX_STREAM_URLS if stream_format else MAX_URLS
+    if len(urls) > max_urls:
         return web.json_response(
-            {"error": f"too many urls in request, should be {MAX_URLS} or less"},
+            {"error": f"too many urls in request, should be {max_urls} or less"},
             status=400,
         )
 
-    results: list[dict] = []
-    async with aiohttp.ClientSession() as session:
-        async with create_task_group() as tg:
-            for url in urls:
-                tg.start_soon(_run_one, url, session, morph, charged_words, results)
+    charged_words, forms = request.app[DICTIONARY].snapshot()
+    return await respond_with_results(request, urls, morph, charged_words, {**options, "forms": forms}, stream_format)
+
+
+async def bulk_analyze_handler(request: web.Request, morph, options):
+    """POST /analyze: тело — JSON-список ссылок или {"urls": [...]}."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.json_response({"error": "request body must be JSON"}, status=400)
 
-    return web.json_response(results)
+    urls = payload.get("urls") if isinstance(payload, dict) else payload
+    if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+        return web.json_response({"error": "expected a JSON list of urls"}, status=400)
+
+    urls = [u.strip() for u in urls if u.strip()]
+    if not urls:
+        return web.json_response({"error": "urls list is empty"}, status=400)
+
+    if len(urls) > MAX_BULK_URLS:
+        return web.json_response(
+            {"error": f"too many urls in request, should be {MAX_BULK_URLS} or less"},
+            status=400,
+        )
+
+    stream_format = pick_stream_format(request)
+    charged_words, forms = request.app[DICTIONARY].snapshot()
+    return await respond_with_results(
+        request, urls, morph, charged_words, {**options, "forms": forms}, stream_format, bulk=True,
+    )
 
 
 async def root_handler(_request: web.Request):
@@ -79,22 +294,256 @@ async def healthz(_request: web.Request):
     return web.json_response({"ok": True})
 
 
-def create_app() -> web.Application:
+async def stats_handler(request: web.Request, options):
+    connector = request.app[HTTP_SESSION].connector
+    pool, cache, store = options["pool"], options["cache"], options["store"]
+    return web.json_response({
+        "pid": os.getpid(),
+        "lemma_cache": LEMMA_CACHE.stats() if pool is None else None,
+        "analysis_workers": pool.workers if pool else 0,
+        "scoring_mode": "fast" if request.app[DICTIONARY].forms is not None else "full",
+        "dictionary": request.app[DICTIONARY].stats(),
+        "result_cache": cache.stats() if cache else None,
+        "store": await asyncio.to_thread(store.stats) if store else None,
+        "flights": options["flights"].stats(),
+        "dedup": options["dedup"].stats() if options["dedup"] is not None else None,
+        "scheduler": request.app[SCHEDULER].stats(),
+        "fetch": FETCH_POLICY.stats(),
+        "http": {
+            "limit": connector.limit,
+            "limit_per_host": connector.limit_per_host,
+            "dns_cache_ttl": DNS_CACHE_TTL,
+            "keepalive_timeout": KEEPALIVE_TIMEOUT,
+        },
+    })
+
+
+def _cache_samples(prefix: str, stats: dict, counters=("hits", "misses", "evictions")):
+    return [
+        render_samples(f"{prefix}_{name}_total", "counter", f"{prefix} {name}.", [({}, stats[name])])
+        for name in counters if name in stats
+    ] + [render_samples(f"{prefix}_size", "gauge", f"{prefix} entries.", [({}, stats["size"])])]
+
+
+async def metrics_handler(request: web.Request, options):
+    """Метрики в формате Prometheus: стадии, статусы, хосты, очередь и кэши."""
+    cache, store = options["cache"], options["store"]
+    scheduler = request.app[SCHEDULER].stats()
+    connector = request.app[HTTP_SESSION].connector
+
+    parts = [REGISTRY.render()]
+    parts.append(render_samples(
+        "jaundice_queue_depth", "gauge", "Articles waiting for a scheduler slot.",
+        [({}, scheduler["queued"])],
+    ))
+    parts.append(render_samples(
+        "jaundice_scheduler_in_flight", "gauge", "Articles holding a scheduler slot.",
+        [({}, scheduler["in_flight"])],
+    ))
+    parts.append(render_samples(
+        "jaundice_host_queue_depth", "gauge", "Articles waiting per host.",
+        [({"host": host}, counts["queued"]) for host, counts in scheduler["hosts"].items()],
+    ))
+    parts.append(render_samples(
+        "jaundice_admitted_articles", "gauge", "Articles of accepted requests not finished yet.",
+        [({"kind": "interactive"}, scheduler["admitted"]), ({"kind": "bulk"}, scheduler["admitted_bulk"])],
+    ))
+    parts.append(render_samples(
+        "jaundice_rejected_requests_total", "counter", "Requests rejected with 503 because the queue was full.",
+        [({}, scheduler["rejected"])],
+    ))
+    parts.append(render_samples(
+        "jaundice_http_connection_limit", "gauge", "Connection pool limits.",
+        [({"scope": "total"}, connector.limit), ({"scope": "per_host"}, connector.limit_per_host)],
+    ))
+    if options["pool"] is None:
+        # с пулом леммы считаются в процессах-воркерах, а кэш этого процесса почти не используется
+        parts.extend(_cache_samples("jaundice_lemma_cache", LEMMA_CACHE.stats()))
+    if cache is not None:
+        parts.extend(_cache_samples(
+            "jaundice_result_cache", cache.stats(), ("hits", "revalidated", "misses", "evictions"),
+        ))
+    if options["dedup"] is not None:
+        parts.extend(_cache_samples(
+            "jaundice_dedup", options["dedup"].stats(), ("exact_hits", "near_hits", "misses", "evictions"),
+        ))
+    dictionary = request.app[DICTIONARY].stats()
+    parts.append(render_samples(
+        "jaundice_dictionary_reloads_total", "counter", "Charged dictionary hot reloads.",
+        [({}, dictionary["reloads"])],
+    ))
+    parts.append(render_samples(
+        "jaundice_dictionary_entries", "gauge", "Entries in each charged dictionary.",
+        [({"dictionary": name}, count) for name, count in sorted(dictionary["dictionaries"].items())],
+    ))
+    parts.append(render_samples(
+        "jaundice_fetch_retry_budget_exhausted_total", "counter",
+        "Retries and hedges skipped because the host retry budget was spent.",
+        [({}, FETCH_POLICY.stats()["budget_exhausted"])],
+    ))
+    flights = options["flights"].stats()
+    parts.append(render_samples(
+        "jaundice_coalesced_requests_total", "counter", "Requests that joined an in-flight analysis.",
+        [({}, flights["joined"])],
+    ))
+    if store is not None:
+        store_stats = await asyncio.to_thread(store.stats)
+        parts.append(render_samples(
+            "jaundice_store_bytes", "gauge", "Persistent store payload size.", [({}, store_stats["bytes"])],
+        ))
+
+    # в content_type= нельзя передать параметр version, поэтому заголовок задаётся целиком
+    return web.Response(text="".join(parts), headers={
+        "Content-Type": PROMETHEUS_CONTENT_TYPE, "X-Content-Type-Options": "nosniff",
+    })
+
+
+async def reload_dictionary(app: web.Application, options) -> bool:
+    """Собирает словарь из файлов в executor и атомарно подменяет его; True, если версия сменилась.
+
+    Запросы, начатые до подмены, доделываются со старым словарём. Записи кэша результатов
+    пересчитываются по частотам лемм при обращении к ним; индекс перепечаток очищается,
+    а пул анализа перезапускается с новым словарём (статьи со старым снимком считаются в event loop).
+    """
+    dictionary = app[DICTIONARY]
+    async with app[DICTIONARY_LOCK]:
+        charged_words, forms, signature = await asyncio.get_running_loop().run_in_executor(None, dictionary.build)
+        if not dictionary.swap(charged_words, forms, signature):
+            return False
+        if options["pool"] is not None:
+            options["pool"].reload(charged_words)
+        if options["dedup"] is not None:
+            options["dedup"].clear()
+    logger.info("Словарь перезагружен: %s записей, версия %s", len(charged_words), charged_words.version)
+    return True
+
+
+async def reload_dictionary_handler(request: web.Request, options):
+    """POST /admin/reload-dictionary: перечитать charged_dict/*.txt без перезапуска."""
+    reloaded = await reload_dictionary(request.app, options)
+    return web.json_response({"reloaded": reloaded, **request.app[DICTIONARY].stats()})
+
+
+async def _watch_dictionary(app: web.Application, options, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        if not app[DICTIONARY].changed():
+            continue
+        try:
+            await reload_dictionary(app, options)
+        except Exception:
+            logger.exception("Не удалось перезагрузить словарь")
+
+
+def create_app(dictionary: DictionaryHolder | None = None) -> web.Application:
+    """dictionary — словарь, загруженный заранее (в pre-fork — мастером до fork, см. preload)."""
     app = web.Application()
+    app.cleanup_ctx.append(http_session_ctx)
+    app[SCHEDULER] = Scheduler()
 
-    morph = pymorphy3.MorphAnalyzer()
-    dict_dir = Path(__file__).resolve().parent / "charged_dict"
-    charged_words = load_charged_words(dict_dir, morph)
+    # словарь берётся из скомпилированного кэша, а MorphAnalyzer грузится
+    # в фоне после старта: /healthz готов сразу, морфология — к первым статьям
+    if dictionary is None:
+        dictionary = DictionaryHolder(DICT_DIR, fast=SCORING_MODE == "fast")
+    app[DICTIONARY] = dictionary
+    app[DICTIONARY_LOCK] = asyncio.Lock()
+    charged_words = dictionary.charged_words
+    morph = None
 
-    handler = partial(analyze_handler, morph=morph, charged_words=charged_words)
+    async def preload_morph(_app):
+        asyncio.get_running_loop().run_in_executor(None, get_morph)
+
+    app.on_startup.append(preload_morph)
+
+    pool = AnalysisPool(charged_words, ANALYSIS_WORKERS) if ANALYSIS_WORKERS > 0 else None
+
+    async def shutdown_pool(_app):
+        pool.shutdown()
+
+    if pool is not None:
+        app.on_cleanup.append(shutdown_pool)
+
+    cache = ResultCache()
+    dedup = NearDuplicateIndex() if DEDUP_SIZE > 0 else None
+
+    store = AnalysisStore(STORE_PATH) if STORE_PATH else None
+    if store is not None:
+        if STORE_WARM:
+            warm_cache(cache, store, charged_words, STORE_WARM_LIMIT, dedup)
+
+        async def compact_store(_app):
+            # старые записи сверх STORE_MAX_BYTES удаляются в фоне, не задерживая старт
+            asyncio.get_running_loop().run_in_executor(None, store.compact)
+
+        async def close_store(_app):
+            store.close()
+
+        app.on_startup.append(compact_store)
+        app.on_cleanup.append(close_store)
+
+    # forms (быстрый режим) берутся из словаря на каждый запрос, см. DictionaryHolder.snapshot
+    options = {"pool": pool, "cache": cache, "store": store, "flights": SingleFlight(), "dedup": dedup}
+
+    async def expand_charged_forms(_app):
+        dictionary.swap(*await asyncio.get_running_loop().run_in_executor(None, dictionary.build))
+
+    if SCORING_MODE == "fast" and dictionary.forms is None:
+        app.on_startup.append(expand_charged_forms)
+
+    async def dictionary_watch_ctx(_app):
+        task = None
+        if DICT_RELOAD_INTERVAL > 0:
+            task = asyncio.create_task(_watch_dictionary(app, options, DICT_RELOAD_INTERVAL))
+        yield
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    app.cleanup_ctx.append(dictionary_watch_ctx)
+
+    handler = partial(analyze_handler, morph=morph, options=options)
+    bulk_handler = partial(bulk_analyze_handler, morph=morph, options=options)
 
     app.add_routes([
         web.get("/", root_handler),
         web.get("/analyze", handler),
+        web.post("/analyze", bulk_handler),
         web.get("/healthz", healthz),
+        web.get("/stats", partial(stats_handler, options=options)),
+        web.get("/metrics", partial(metrics_handler, options=options)),
+        web.post("/admin/reload-dictionary", partial(reload_dictionary_handler, options=options)),
     ])
     return app
 
 
+def preload() -> DictionaryHolder:
+    """Тяжёлые общие данные для pre-fork: грузятся в мастере один раз до запуска воркеров.
+
+    MorphAnalyzer остаётся в get_morph(), а словарь (с автоматом и, в быстром режиме,
+    словоформами) возвращается и передаётся в create_app каждого воркера.
+    """
+    get_morph()
+    dictionary = DictionaryHolder(DICT_DIR, fast=SCORING_MODE == "fast")
+    if dictionary.fast:
+        dictionary.swap(*dictionary.build())
+    return dictionary
+
+
 if __name__ == "__main__":
-    web.run_app(create_app(), host="127.0.0.1", port=8080)
+    parser = argparse.ArgumentParser(description="Сервис оценки «желтушности» статей")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                        help="число процессов-воркеров на одном порту (pre-fork)")
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="у каждого воркера свой сокет с SO_REUSEPORT вместо общего")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.workers > 1:
+        from prefork import Master
+
+        Master(create_app, args.host, args.port, args.workers, args.reuse_port).run(preload=preload)
+    else:
+        web.run_app(create_app(), host=args.host, port=args.port, handler_cancellation=True)
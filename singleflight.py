@@ -0,0 +1,93 @@
+"""Склейка одновременных вызовов с одинаковым ключом в одну задачу (single flight)."""
+import asyncio
+from collections.abc import Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Пока задача по ключу выполняется, новые вызовы ждут её результат, а не запускают свою.
+
+    Отмена одного ожидающего не трогает общую задачу; она отменяется,
+    только когда её перестали ждать все.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def run(self, key: Hashable, coro_factory):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(coro_factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.joined += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "started": self.started, "joined": self.joined}
+
+
+def test_single_flight_coalesces_and_survives_cancel():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(flights.run("k", work))
+        second = asyncio.ensure_future(flights.run("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+        return flights
+
+    flights = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "started": 1, "joined": 1}
+
+
+def test_single_flight_cancels_abandoned_work():
+    async def work():
+        await asyncio.sleep(10)
+
+    async def scenario():
+        flights = SingleFlight()
+        caller = asyncio.ensure_future(flights.run("k", work))
+        await asyncio.sleep(0)
+        task = flights._flights["k"].task
+        caller.cancel()
+        await asyncio.sleep(0)
+        assert task.cancelled() or task.cancelling()
+        assert len(flights) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,270 @@
+"""Постоянное хранилище результатов анализа в SQLite.
+
+Очищенный текст, частоты лемм и вхождения фраз словарей хранятся по хэшу содержимого, а ссылки
+на них — по нормализованному URL. Так после перезапуска статью не нужно
+ни скачивать, ни лемматизировать заново, а одинаковый текст под разными
+URL анализируется один раз.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from result_cache import normalize_url
+
+
+STORE_PATH = os.getenv("STORE_PATH", "")
+STORE_TTL = float(os.getenv("STORE_TTL", "86400"))
+STORE_MAX_BYTES = int(os.getenv("STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+STORE_WARM = os.getenv("STORE_WARM", "0") == "1"
+STORE_WARM_LIMIT = int(os.getenv("STORE_WARM_LIMIT", "1000"))
+
+# компактизация запускается раз в столько сохранений
+COMPACT_EVERY = 500
+
+# auto_vacuum действует только на новые файлы: место удалённых записей возвращается
+# PRAGMA incremental_vacuum за время, пропорциональное числу освобождённых страниц, без полного VACUUM
+SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    lemma_counts TEXT NOT NULL,
+    phrase_counts TEXT NOT NULL DEFAULT '{}',
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    title TEXT,
+    validators TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_hash ON urls (hash);
+CREATE INDEX IF NOT EXISTS contents_accessed ON contents (accessed_at);
+"""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AnalysisStore:
+    """Хранилище поверх одного sqlite-соединения.
+
+    Методы синхронные и потокобезопасные: из event loop их вызывают через asyncio.to_thread.
+    Конструктор не компактизирует файл: на старте сервера compact запускается в фоне.
+    """
+
+    def __init__(self, path: str, ttl: float = STORE_TTL, max_bytes: int = STORE_MAX_BYTES,
+                 clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Добавляет колонки, которых нет в файлах, созданных старыми версиями."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(contents)")}
+        if "phrase_counts" not in columns:
+            self._conn.execute("ALTER TABLE contents ADD COLUMN phrase_counts TEXT NOT NULL DEFAULT '{}'")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_fresh(self, entry: dict) -> bool:
+        return self._clock() - entry["fetched_at"] < self.ttl
+
+    def get(self, url: str) -> dict | None:
+        """Запись по URL: hash, title, text, lemma_counts, phrase_counts, validators, fetched_at."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT u.url, u.hash, u.title, u.validators, u.fetched_at, c.text, c.lemma_counts, c.phrase_counts "
+                "FROM urls u JOIN contents c ON c.hash = u.hash WHERE u.url = ?",
+                (normalize_url(url),),
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(row[0], row[1])
+            self._conn.commit()
+        return self._entry_from_row(row)
+
+    def get_content(self, hash_: str) -> tuple[Counter, Counter] | None:
+        """(lemma_counts, phrase_counts) для уже проанализированного текста."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lemma_counts, phrase_counts FROM contents WHERE hash = ?", (hash_,),
+            ).fetchone()
+        return (Counter(json.loads(row[0])), Counter(json.loads(row[1]))) if row else None
+
+    def save(self, url: str, title: str, text: str, lemma_counts, validators: dict | None = None,
+             phrase_counts=None):
+        now = self._clock()
+        hash_ = content_hash(text)
+        counts_json = json.dumps(dict(lemma_counts), ensure_ascii=False)
+        phrases_json = json.dumps(dict(phrase_counts or {}), ensure_ascii=False)
+        size = len(text.encode("utf-8")) + len(counts_json.encode("utf-8")) + len(phrases_json.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO contents (hash, text, lemma_counts, phrase_counts, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (hash_, text, counts_json, phrases_json, size, now),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, hash, title, validators, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), hash_, title, json.dumps(validators or {}), now, now),
+            )
+            self._conn.commit()
+            self._saves += 1
+            need_compact = self._saves % COMPACT_EVERY == 0
+        if need_compact:
+            self.compact()
+
+    def refresh(self, url: str):
+        """Статья не изменилась (304): продлеваем запись."""
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE urls SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, normalize_url(url)),
+            )
+            self._conn.commit()
+
+    def recent(self, limit: int = STORE_WARM_LIMIT) -> list[dict]:
+        """Последние использованные записи — для прогрева кэшей на старте."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT u.url, u.hash, u.title, u.validators, u.fetched_at, c.text, c.lemma_counts, c.phrase_counts "
+                "FROM urls u JOIN contents c ON c.hash = u.hash "
+                "ORDER BY u.accessed_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [self._entry_from_row(row) for row in rows]
+
+    def compact(self) -> int:
+        """Удаляет давно не использованные тексты сверх max_bytes и осиротевшие URL; возвращает число удалённых строк.
+
+        Освобождённые страницы отдаются файлу (incremental_vacuum), только если что-то удалено.
+        """
+        with self._lock:
+            deleted = 0
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM contents").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute("SELECT hash, size FROM contents ORDER BY accessed_at").fetchall()
+                doomed = []
+                for hash_, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((hash_,))
+                    total -= size
+                deleted += self._conn.executemany("DELETE FROM contents WHERE hash = ?", doomed).rowcount
+            deleted += self._conn.execute(
+                "DELETE FROM urls WHERE hash NOT IN (SELECT hash FROM contents)"
+            ).rowcount
+            self._conn.commit()
+            if deleted:
+                # execute освобождает по странице за шаг, а executescript доводит прагму до конца
+                self._conn.executescript("PRAGMA incremental_vacuum;")
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            urls = self._conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            contents, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM contents"
+            ).fetchone()
+        return {"urls": urls, "contents": contents, "bytes": size, "max_bytes": self.max_bytes}
+
+    def _touch(self, url, hash_):
+        now = self._clock()
+        self._conn.execute("UPDATE urls SET accessed_at = ? WHERE url = ?", (now, url))
+        self._conn.execute("UPDATE contents SET accessed_at = ? WHERE hash = ?", (now, hash_))
+
+    @staticmethod
+    def _entry_from_row(row) -> dict:
+        url, hash_, title, validators, fetched_at, text, lemma_counts, phrase_counts = row
+        return {
+            "url": url,
+            "hash": hash_,
+            "title": title,
+            "validators": json.loads(validators),
+            "fetched_at": fetched_at,
+            "text": text,
+            "lemma_counts": Counter(json.loads(lemma_counts)),
+            "phrase_counts": Counter(json.loads(phrase_counts)),
+        }
+
+
+def test_store_roundtrip_and_compaction(tmp_path):
+    now = [1000.0]
+    store = AnalysisStore(str(tmp_path / "store.sqlite3"), ttl=60, max_bytes=10_000, clock=lambda: now[0])
+    store.save("https://inosmi.ru/a.html", "А", "текст статьи", Counter({"текст": 1, "статья": 1}), {"ETag": '"1"'},
+               phrase_counts=Counter({"текст статья": 1}))
+
+    entry = store.get("https://INOSMI.ru/a.html#x")
+    assert entry["title"] == "А"
+    assert entry["lemma_counts"] == {"текст": 1, "статья": 1}
+    assert entry["phrase_counts"] == {"текст статья": 1}
+    assert entry["validators"] == {"ETag": '"1"'}
+    assert store.is_fresh(entry)
+    assert store.get_content(content_hash("текст статьи")) == ({"текст": 1, "статья": 1}, {"текст статья": 1})
+
+    now[0] += 61
+    assert not store.is_fresh(store.get("https://inosmi.ru/a.html"))
+
+    now[0] += 1
+    store.save("https://inosmi.ru/b.html", "Б", "б" * 3000, Counter({"б": 1}))
+    now[0] += 1
+    store.save("https://inosmi.ru/c.html", "В", "в" * 3000, Counter({"в": 1}))
+    assert store.compact() > 0
+    # удалять больше нечего — файл не трогается
+    assert store.compact() == 0
+    assert store.get("https://inosmi.ru/b.html") is None
+    assert store.get("https://inosmi.ru/c.html") is not None
+    assert store.stats()["bytes"] <= 10_000
+    store.close()
+
+
+def test_store_compaction_off_startup_and_returns_pages(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    store = AnalysisStore(path)
+    for i in range(20):
+        store.save(f"https://inosmi.ru/{i}.html", "", f"{i}" + "т" * 20_000, Counter())
+    store.close()
+
+    # открытие файла сверх лимита ничего не удаляет, это делает только compact
+    store = AnalysisStore(path, max_bytes=100_000)
+    assert store.stats()["contents"] == 20
+    pages = store._conn.execute("PRAGMA page_count").fetchone()[0]
+    assert store.compact() > 0
+    assert store.stats()["contents"] < 20
+    assert store._conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert store._conn.execute("PRAGMA page_count").fetchone()[0] < pages
+    store.close()
+
+
+def test_store_migrates_old_schema(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA.replace("    phrase_counts TEXT NOT NULL DEFAULT '{}',\n", ""))
+    conn.execute("INSERT INTO contents (hash, text, lemma_counts, size, accessed_at) VALUES ('h', 'т', '{}', 1, 0)")
+    conn.commit()
+    conn.close()
+
+    store = AnalysisStore(path)
+    assert store.get_content("h") == (Counter(), Counter())
+    store.close()
@@ -1,14 +1,20 @@
 import asyncio
+import json
 import types
+from collections import Counter
+from contextlib import asynccontextmanager
 import pytest
 import aiohttp
 
+import main
+
 from main import (
     process_article,
     ProcessingStatus,
     ANALYSIS_TIMEOUT,
 )
 from server import create_app, MAX_URLS
+from text_tools import ChargedWords, get_morph
 from aiohttp.test_utils import TestServer, TestClient
 
 
@@ -18,16 +24,29 @@ class DummySession:
         self._text = text
         self._raise = raise_on_get
 
+    class _Content:
+        def __init__(self, body: bytes):
+            self._body = body
+
+        async def iter_chunked(self, size):
+            for start in range(0, len(self._body), size):
+                yield self._body[start:start + size]
+
     class _Resp:
-        def __init__(self, text: str):
-            self._text = text
+        def __init__(self, text: str | bytes, status: int = 200, headers: dict | None = None,
+                     charset: str | None = None):
+            body = text.encode("utf-8") if isinstance(text, str) else text
+            self.status = status
+            self.headers = headers or {}
+            self.charset = charset
+            self.content_length = len(body)
+            self.content = DummySession._Content(body)
 
         async def __aenter__(self): return self
         async def __aexit__(self, exc_type, exc, tb): pass
-        async def text(self): return self._text
         def raise_for_status(self): return None
 
-    def get(self, url, timeout=None):
+    def get(self, url, timeout=None, headers=None):
         if self._raise:
             raise self._raise
         return self._Resp(self._text)
@@ -41,13 +60,13 @@ def run_process_article_with_patches(monkeypatch, *, fetch_impl=None,
     if sanitize_impl:
         monkeypatch.setattr("main.pick_sanitizer", lambda _url: lambda html, plaintext=True: sanitize_impl(html))
     if split_impl:
-        monkeypatch.setattr("main.split_by_words", split_impl)
+        monkeypatch.setattr("main.count_lemmas", split_impl)
 
     results: list[dict] = []
 
     import pymorphy3
     morph = pymorphy3.MorphAnalyzer()
-    charged_words = ["скандал", "шок"]
+    charged_words = ChargedWords(["скандал", "шок"])
 
     session = DummySession()
 
@@ -82,9 +101,9 @@ def test_process_article_parsing_error_article_not_found(monkeypatch):
 
 #  тест 4: таймаут анализа (TIMEOUT) 
 def test_process_article_timeout(monkeypatch):
-    async def slow_split(_morph, _text, yield_every: int = 500):
+    async def slow_split(_morph, _text, yield_every: int = 500, **_kwargs):
         await asyncio.sleep(ANALYSIS_TIMEOUT + 0.5)
-        return []
+        return Counter()
 
     def fake_sanitize(_html):
         return "это тестовый текст " * 1_000_000
@@ -129,4 +148,1234 @@ def test_analyze_missing_param():
     app = create_app()
     status, data = asyncio.run(_request(app, "/analyze"))
     assert status == 400
-    assert "query parameter 'urls' is required" in data["error"]
\ No newline at end of file
+    assert "query parameter 'urls' is required" in data["error"]
+
+
+def test_stats_lemma_cache():
+    app = create_app()
+    status, data = asyncio.run(_request(app, "/stats"))
+    assert status == 200
+    assert {"hits", "misses", "evictions", "size", "maxsize"} <= set(data["lemma_cache"])
+    assert data["http"]["limit"] > 0 and data["http"]["limit_per_host"] > 0
+
+
+def test_analyze_reuses_app_session(monkeypatch):
+    import server
+
+    sessions = []
+
+    async def fake_call_process(url, session, morph, charged_words, **options):
+        sessions.append(session)
+        return {"status": "OK", "url": url, "score": 0.0, "words_count": 0, "hits": {}}
+
+    monkeypatch.setattr(server, "call_process", fake_call_process)
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            for _ in range(2):
+                resp = await client.get("/analyze?urls=https://inosmi.ru/a.html,https://inosmi.ru/b.html")
+                assert resp.status == 200
+        finally:
+            await client.close()
+
+    asyncio.run(scenario())
+    assert len(sessions) == 4
+    assert len({id(s) for s in sessions}) == 1
+    assert sessions[0].closed
+
+
+def _run_with_pool(monkeypatch, pool, text):
+    monkeypatch.setattr("main.pick_sanitizer", lambda _url: lambda html, plaintext=True: text)
+
+    import pymorphy3
+    morph = pymorphy3.MorphAnalyzer()
+    results: list[dict] = []
+    asyncio.run(process_article(
+        DummySession(), morph, ChargedWords(["скандал", "шок"]), "https://inosmi.ru/x.html", 0, results,
+        pool=pool,
+    ))
+    return results[0]
+
+
+def test_process_article_in_pool(monkeypatch):
+    from analysis_pool import AnalysisPool
+    pool = AnalysisPool(ChargedWords(["скандал", "шок"]), workers=1)
+    try:
+        rec = _run_with_pool(monkeypatch, pool, "Громкий скандал и шок")
+        # после перезагрузки словаря воркеры пула считают по новому
+        pool.reload(ChargedWords(["громкий"]))
+        reloaded = _run_with_pool(monkeypatch, pool, "Громкий скандал и шок")
+    finally:
+        pool.shutdown()
+    assert rec["status"] == ProcessingStatus.OK.value
+    assert rec["words_count"] == 3
+    assert rec["score"] == 66.67
+    assert rec["hits"] == {"скандал": 1, "шок": 1}
+    assert reloaded["hits"] == {"громкий": 1}
+
+
+def test_process_article_pool_keeps_request_dictionary(monkeypatch):
+    from analysis_pool import AnalysisPool
+
+    old = ChargedWords(["скандал"], version="old")
+    pool = AnalysisPool(old, workers=1)
+    try:
+        pool.reload(ChargedWords(["шок"], version="new"))
+        monkeypatch.setattr("main.pick_sanitizer", lambda _url: lambda html, plaintext=True: "Громкий скандал и шок")
+        results: list[dict] = []
+        # запрос взял снимок словаря до перезагрузки: воркеры с новым словарём его не считают
+        asyncio.run(process_article(
+            DummySession(), get_morph(), old, "https://inosmi.ru/x.html", 0, results, pool=pool,
+        ))
+    finally:
+        pool.shutdown()
+    assert results[0]["hits"] == {"скандал": 1}
+    assert results[0]["scores"] == {"charged": 33.33}
+
+
+def test_process_article_pool_timeout(monkeypatch):
+    from analysis_pool import AnalysisPool
+    monkeypatch.setattr("main.ANALYSIS_TIMEOUT", 0.2)
+    # без выборки: длинный текст целиком не укладывается в таймаут
+    monkeypatch.setattr("main.APPROX_WORDS", 0)
+    pool = AnalysisPool(ChargedWords(["скандал"]), workers=1)
+    try:
+        rec = _run_with_pool(monkeypatch, pool, "это тестовый текст " * 200_000)
+    finally:
+        pool.shutdown()
+    assert rec["status"] == ProcessingStatus.TIMEOUT.value
+
+
+def test_process_article_broken_pool_fallback(monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class BrokenPool:
+        async def analyze(self, _text, _timeout, version=None):
+            raise BrokenProcessPool()
+
+    rec = _run_with_pool(monkeypatch, BrokenPool(), "Громкий скандал")
+    assert rec["status"] == ProcessingStatus.OK.value
+    assert rec["words_count"] == 2
+
+
+def test_analysis_pool_recovers_after_worker_crash(monkeypatch):
+    import os
+    import signal
+    from analysis_pool import AnalysisPool
+
+    pool = AnalysisPool(ChargedWords(["скандал", "шок"]), workers=1)
+    try:
+        assert _run_with_pool(monkeypatch, pool, "Громкий скандал")["hits"] == {"скандал": 1}
+        for pid in list(pool._executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        # статья, попавшая на сломанный пул, считается в event loop
+        rec = _run_with_pool(monkeypatch, pool, "Громкий скандал")
+        assert rec["status"] == ProcessingStatus.OK.value and rec["words_count"] == 2
+        assert pool.restarts == 1
+        # следующие снова уходят в пересозданный пул, а не в event loop
+        async def no_event_loop(*_args, **_kwargs):
+            raise AssertionError("анализ в event loop")
+
+        monkeypatch.setattr("main.count_lemmas", no_event_loop)
+        assert _run_with_pool(monkeypatch, pool, "Громкий скандал и шок")["hits"] == {"скандал": 1, "шок": 1}
+    finally:
+        pool.shutdown()
+
+
+def test_process_article_parses_html_once(monkeypatch):
+    import adapters.html_tools
+    from bs4 import BeautifulSoup
+
+    parsed = []
+
+    class CountingSoup(BeautifulSoup):
+        def __init__(self, *args, **kwargs):
+            parsed.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(adapters.html_tools, "BeautifulSoup", CountingSoup)
+    html = (
+        "<html><head><title>Шок</title></head><body><article class='article'>"
+        "<h1>Громкий скандал</h1><p>Громкий скандал и шок</p></article></body></html>"
+    )
+
+    import pymorphy3
+    results: list[dict] = []
+    asyncio.run(process_article(
+        DummySession(html), pymorphy3.MorphAnalyzer(), ChargedWords(["скандал", "шок"]),
+        "https://inosmi.ru/x.html", 0, results,
+    ))
+    rec = results[0]
+    assert rec["status"] == ProcessingStatus.OK.value
+    assert rec["title"] == "Громкий скандал"
+    assert len(parsed) == 1
+
+
+
+ARTICLE_HTML = (
+    "<html><head><title>Шок</title></head><body><article class='article'>"
+    "<h1>Громкий скандал</h1><p>Громкий скандал и шок</p></article></body></html>"
+)
+
+
+class RevalidatingSession(DummySession):
+    """Отдаёт статью с ETag, а на If-None-Match с тем же ETag — 304."""
+    def __init__(self):
+        super().__init__(ARTICLE_HTML)
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return self._Resp("", status=304)
+        return self._Resp(self._text, headers={"ETag": '"v1"'})
+
+
+def test_process_article_result_cache(monkeypatch):
+    import pymorphy3
+    from result_cache import ResultCache
+
+    now = [0.0]
+    cache = ResultCache(ttl=60, maxsize=10, clock=lambda: now[0])
+    session = RevalidatingSession()
+    morph = pymorphy3.MorphAnalyzer()
+    charged_words = ChargedWords(["скандал", "шок"])
+
+    analyses = []
+    real_analyze_text = main.analyze_text
+
+    async def counting_analyze_text(*args):
+        analyses.append(1)
+        return await real_analyze_text(*args)
+
+    monkeypatch.setattr("main.analyze_text", counting_analyze_text)
+
+    def run(url):
+        results: list[dict] = []
+        asyncio.run(process_article(session, morph, charged_words, url, 0, results, cache=cache))
+        return results[0]
+
+    first = run("https://inosmi.ru/x.html")
+    assert first["status"] == ProcessingStatus.OK.value and first["cached"] is False
+
+    second = run("https://INOSMI.ru/x.html#comments")
+    assert second["cached"] is True and second["score"] == first["score"]
+    assert len(session.requests) == 1
+
+    now[0] = 61.0
+    third = run("https://inosmi.ru/x.html")
+    assert third["cached"] is True
+    assert session.requests[-1] == {"If-None-Match": '"v1"'}
+    assert len(analyses) == 1
+    assert cache.stats()["revalidated"] == 1
+
+
+
+def test_process_article_persistent_store(monkeypatch, tmp_path):
+    import pymorphy3
+    from result_cache import ResultCache
+    from dedup import NearDuplicateIndex
+    from store import AnalysisStore
+
+    store = AnalysisStore(str(tmp_path / "store.sqlite3"))
+    morph = pymorphy3.MorphAnalyzer()
+    charged_words = ChargedWords(["скандал", "шок"])
+
+    analyses = []
+    real_analyze_text = main.analyze_text
+
+    async def counting_analyze_text(*args):
+        analyses.append(1)
+        return await real_analyze_text(*args)
+
+    monkeypatch.setattr("main.analyze_text", counting_analyze_text)
+
+    def run(session, url, cache=None):
+        results: list[dict] = []
+        asyncio.run(process_article(session, morph, charged_words, url, 0, results,
+                                    store=store, cache=cache))
+        return results[0]
+
+    session = RevalidatingSession()
+    first = run(session, "https://inosmi.ru/x.html")
+    assert first["status"] == ProcessingStatus.OK.value and first["cached"] is False
+
+    # «перезапуск»: новый пустой кэш, но запись в хранилище свежая — ни сети, ни анализа
+    second = run(session, "https://inosmi.ru/x.html", cache=ResultCache())
+    assert second["cached"] is True and second["score"] == first["score"]
+    assert len(session.requests) == 1
+
+    # тот же текст под другим URL скачивается, но не анализируется
+    third = run(session, "https://inosmi.ru/copy.html")
+    assert third["score"] == first["score"]
+    assert len(analyses) == 1
+
+    cache = ResultCache()
+    dedup = NearDuplicateIndex()
+    assert main.warm_cache(cache, store, charged_words, limit=10, dedup=dedup) == 2
+    assert cache.is_fresh(cache.get("https://inosmi.ru/copy.html"))
+    # после перезапуска перепечатка узнаётся по отпечаткам из хранилища
+    assert len(dedup) == 1
+    assert dedup.find("other", dedup.sketch(store.get("https://inosmi.ru/x.html")["text"]))[1] == 1.0
+    store.close()
+
+
+
+def test_process_article_coalesces_concurrent_requests(monkeypatch):
+    import pymorphy3
+    from singleflight import SingleFlight
+
+    fetches = []
+
+    async def slow_fetch(_session, _url):
+        fetches.append(1)
+        await asyncio.sleep(0.05)
+        return ARTICLE_HTML
+
+    monkeypatch.setattr("main.fetch", slow_fetch)
+    morph = pymorphy3.MorphAnalyzer()
+    charged_words = ChargedWords(["скандал", "шок"])
+
+    async def scenario():
+        flights = SingleFlight()
+        results: list[dict] = []
+        await asyncio.gather(*(
+            process_article(None, morph, charged_words, "https://inosmi.ru/x.html", idx, results,
+                            flights=flights)
+            for idx in range(5)
+        ))
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(fetches) == 1
+    assert sorted(rec["idx"] for rec in results) == [0, 1, 2, 3, 4]
+    assert {rec["score"] for rec in results} == {60.0}
+
+
+
+def test_process_article_flight_joiners_keep_own_deadline(monkeypatch):
+    from singleflight import SingleFlight
+
+    fetches = []
+
+    async def slow_fetch(_session, _url):
+        fetches.append(1)
+        await asyncio.sleep(0.1)
+        return ARTICLE_HTML
+
+    monkeypatch.setattr("main.fetch", slow_fetch)
+    get_morph()
+    charged_words = ChargedWords(["скандал", "шок"])
+
+    async def scenario():
+        flights = SingleFlight()
+        loop = asyncio.get_running_loop()
+        results: list[dict] = []
+        url = "https://inosmi.ru/x.html"
+        await asyncio.gather(
+            process_article(None, None, charged_words, url, 0, results, flights=flights,
+                            deadline=loop.time() + 0.05),
+            process_article(None, None, charged_words, url, 1, results, flights=flights,
+                            deadline=loop.time() + 2),
+        )
+        return sorted(results, key=lambda rec: rec["idx"])
+
+    first, second = asyncio.run(scenario())
+    assert len(fetches) == 1
+    # короткий дедлайн первого не обрывает общую обработку для второго
+    assert first["status"] == ProcessingStatus.TIMEOUT.value
+    assert second["status"] == ProcessingStatus.OK.value and second["score"] == 60.0
+
+
+def test_process_article_flights_split_by_dictionary_and_mode(monkeypatch):
+    from singleflight import SingleFlight
+    from text_tools import ChargedForms
+
+    fetches = []
+
+    async def slow_fetch(_session, _url):
+        fetches.append(1)
+        await asyncio.sleep(0.05)
+        return ARTICLE_HTML
+
+    monkeypatch.setattr("main.fetch", slow_fetch)
+    morph = get_morph()
+    old = ChargedWords(["скандал"], version="old")
+    new = ChargedWords(["шок"], version="new")
+    forms = ChargedForms.expand(morph, old)
+
+    async def scenario():
+        flights = SingleFlight()
+        results: list[dict] = []
+        url = "https://inosmi.ru/x.html"
+        await asyncio.gather(
+            process_article(None, morph, old, url, 0, results, flights=flights),
+            process_article(None, morph, old, url, 1, results, flights=flights),
+            process_article(None, morph, new, url, 2, results, flights=flights),
+            process_article(None, morph, old, url, 3, results, flights=flights, forms=forms),
+        )
+        return sorted(results, key=lambda rec: rec["idx"])
+
+    results = asyncio.run(scenario())
+    # одинаковые запросы склеены, а другой словарь и быстрый режим считаются отдельно
+    assert len(fetches) == 3
+    assert [rec["hits"] for rec in results] == [{"скандал": 2}, {"скандал": 2}, {"шок": 1}, {"скандал": 2}]
+
+
+def _patch_call_process_with_delays(monkeypatch, delays):
+    import server
+
+    async def fake_call_process(url, session, morph, charged_words, **options):
+        # задержка изображает скачивание, поэтому идёт в слоте планировщика
+        async with options["fetch_slot"](url):
+            await asyncio.sleep(delays[url])
+        return {"status": "OK", "url": url, "score": 0.0, "words_count": 0, "hits": {}, "cached": False}
+
+    monkeypatch.setattr(server, "call_process", fake_call_process)
+
+
+async def _request_text(app, path: str, headers=None):
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    try:
+        resp = await client.get(path, headers=headers)
+        return resp.status, resp.headers.get("Content-Type"), await resp.text()
+    finally:
+        await client.close()
+
+
+def test_analyze_stream_ndjson(monkeypatch):
+    import json
+    slow, fast = "https://slow.example.com/a.html", "https://fast.example.com/b.html"
+    _patch_call_process_with_delays(monkeypatch, {slow: 0.2, fast: 0.0})
+
+    status, content_type, body = asyncio.run(
+        _request_text(create_app(), f"/analyze?urls={slow},{fast}&format=ndjson")
+    )
+    assert status == 200
+    assert content_type.startswith("application/x-ndjson")
+    assert [json.loads(line)["url"] for line in body.splitlines()] == [fast, slow]
+
+
+def test_analyze_stream_sse_via_accept(monkeypatch):
+    url = "https://inosmi.ru/a.html"
+    _patch_call_process_with_delays(monkeypatch, {url: 0.0})
+
+    status, content_type, body = asyncio.run(
+        _request_text(create_app(), f"/analyze?urls={url}", headers={"Accept": "text/event-stream"})
+    )
+    assert status == 200
+    assert content_type.startswith("text/event-stream")
+    assert body.startswith("event: result\ndata: {")
+    assert body.endswith("event: done\ndata: {}\n\n")
+
+
+def test_analyze_stream_limit():
+    from server import MAX_STREAM_URLS
+    many = ",".join(f"https://inosmi.ru/a{i}.html" for i in range(MAX_STREAM_URLS + 1))
+    status, data = asyncio.run(_request(create_app(), f"/analyze?urls={many}&format=ndjson"))
+    assert status == 400
+    assert "too many urls" in data["error"]
+
+
+
+def test_bulk_analyze_goes_through_scheduler(monkeypatch):
+    import server
+    from scheduler import Scheduler
+
+    delays = {f"https://inosmi.ru/a{i}.html": 0.01 for i in range(20)}
+    _patch_call_process_with_delays(monkeypatch, delays)
+    peak = []
+
+    class RecordingScheduler(Scheduler):
+        @asynccontextmanager
+        async def slot(self, url, bulk=False):
+            async with super().slot(url, bulk):
+                peak.append(self.in_flight)
+                yield
+
+    monkeypatch.setattr(server, "Scheduler", lambda: RecordingScheduler(concurrency=5, host_concurrency=3, host_rate=0))
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            resp = await client.post("/analyze", json=list(delays))
+            return resp.status, await resp.json()
+        finally:
+            await client.close()
+
+    status, data = asyncio.run(scenario())
+    assert status == 200
+    assert sorted(rec["url"] for rec in data) == sorted(delays)
+    assert max(peak) == 3
+
+
+def test_bulk_analyze_deadline_starts_at_scheduler_slot(monkeypatch):
+    import server
+    from scheduler import Scheduler
+
+    urls = [f"https://inosmi.ru/q{i}.html" for i in range(8)]
+
+    async def slow_fetch(_session, _url, validators=None):
+        await asyncio.sleep(0.1)
+        return ARTICLE_HTML, {}
+
+    monkeypatch.setattr("main.fetch_conditional", slow_fetch)
+    get_morph()
+    monkeypatch.setattr(server, "Scheduler", lambda: Scheduler(concurrency=5, host_concurrency=1, host_rate=0))
+    monkeypatch.setattr(server, "REQUEST_DEADLINE", 0.35)
+    monkeypatch.setattr(server, "BULK_ARTICLE_DEADLINE", 0.35)
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            bulk = await (await client.post("/analyze", json=urls)).json()
+            # другие ссылки: эти уже в кэше результатов и слота не ждут
+            fresh = [url.replace("/q", "/r") for url in urls]
+            get = await (await client.get(f"/analyze?urls={','.join(fresh)}")).json()
+            return bulk, get
+        finally:
+            await client.close()
+
+    bulk, get = asyncio.run(scenario())
+    # ссылки одного хоста идут по одной: 0.8 с очереди больше дедлайна, но пачка успевает целиком
+    assert [rec["status"] for rec in bulk] == ["OK"] * len(urls)
+    assert "TIMEOUT" in {rec["status"] for rec in get}
+
+
+def test_interactive_get_overtakes_bulk_queue(monkeypatch):
+    import time
+    import server
+    from scheduler import Scheduler
+
+    bulk_urls = [f"https://inosmi.ru/bulk{i}.html" for i in range(40)]
+    get_url = "https://inosmi.ru/get.html"
+    _patch_call_process_with_delays(monkeypatch, dict.fromkeys([*bulk_urls, get_url], 0.05))
+    monkeypatch.setattr(server, "Scheduler", lambda: Scheduler(host_concurrency=1, host_rate=0))
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            bulk = asyncio.ensure_future(client.post("/analyze", json=bulk_urls))
+            await asyncio.sleep(0.1)
+            start = time.monotonic()
+            get = await client.get(f"/analyze?urls={get_url}")
+            get_elapsed = time.monotonic() - start
+            records = await get.json()
+            await (await bulk).release()
+            return records, get_elapsed
+        finally:
+            await client.close()
+
+    records, get_elapsed = asyncio.run(scenario())
+    assert records[0]["status"] == "OK"
+    # за ~38 пакетными ссылками в очереди хоста GET ждал бы около 2 секунд
+    assert get_elapsed < 0.5
+
+
+def test_cached_articles_skip_host_rate_limit(monkeypatch):
+    import time
+
+    fetches = []
+
+    async def fake_fetch(_session, _url, validators=None):
+        fetches.append(1)
+        return ARTICLE_HTML, {}
+
+    monkeypatch.setattr("main.fetch_conditional", fake_fetch)
+    get_morph()
+    url = "https://inosmi.ru/cached.html"
+
+    async def scenario():
+        # лимиты планировщика по умолчанию: HOST_RATE запросов в секунду к inosmi.ru
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            assert (await client.get(f"/analyze?urls={url}")).status == 200
+            start = time.monotonic()
+            responses = await asyncio.gather(*(client.get(f"/analyze?urls={url}") for _ in range(20)))
+            elapsed = time.monotonic() - start
+            return [(await resp.json())[0] for resp in responses], elapsed
+        finally:
+            await client.close()
+
+    records, elapsed = asyncio.run(scenario())
+    assert len(fetches) == 1
+    assert all(rec["status"] == "OK" and rec["cached"] for rec in records)
+    # в слоте планировщика это заняло бы около 20 / HOST_RATE секунд
+    assert elapsed < 1
+
+
+def test_bulk_analyze_validation():
+    async def scenario(body):
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            resp = await client.post("/analyze", data=body, headers={"Content-Type": "application/json"})
+            return resp.status, await resp.json()
+        finally:
+            await client.close()
+
+    status, data = asyncio.run(scenario("not json"))
+    assert status == 400 and "JSON" in data["error"]
+    status, data = asyncio.run(scenario('{"urls": [1, 2]}'))
+    assert status == 400 and "list of urls" in data["error"]
+
+
+def test_load_charged_words_compiled_cache(tmp_path):
+    import pymorphy3
+    from main import load_charged_words
+
+    dict_dir = tmp_path / "dict"
+    dict_dir.mkdir()
+    (dict_dir / "words.txt").write_text("скандалы\nшоке\n", encoding="utf-8")
+    cache_path = tmp_path / "cache" / "charged_words.json"
+
+    class NoMorph:
+        def parse(self, _word):
+            raise AssertionError("словарь должен браться из кэша")
+
+    words = load_charged_words(dict_dir, pymorphy3.MorphAnalyzer(), cache_path=cache_path)
+    assert list(words) == ["скандал", "шок"]
+    assert cache_path.exists()
+
+    assert list(load_charged_words(dict_dir, NoMorph(), cache_path=cache_path)) == ["скандал", "шок"]
+
+    (dict_dir / "words.txt").write_text("скандалы\n", encoding="utf-8")
+    assert list(load_charged_words(dict_dir, pymorphy3.MorphAnalyzer(), cache_path=cache_path)) == ["скандал"]
+
+
+def test_import_has_no_side_effects():
+    import subprocess
+    import sys
+
+    code = "import main, server; print(len(main.TEST_ARTICLES))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0
+    assert out.stdout.strip() == str(len(main.TEST_ARTICLES))
+
+
+
+def test_read_html_limits_and_decoding():
+    from main import FetchRejected, read_html
+
+    def read(body, headers=None, charset=None, content_length=..., max_size=1000):
+        resp = DummySession._Resp(body, headers=headers, charset=charset)
+        if content_length is not ...:
+            resp.content_length = content_length
+        return asyncio.run(read_html(resp, max_size=max_size))
+
+    html = "<html><head><meta charset='windows-1251'></head><body>Скандал</body></html>"
+    assert "Скандал" in read(html.encode("cp1251"), headers={"Content-Type": "text/html"})
+    assert "Скандал" in read("Скандал".encode("koi8-r"), charset="koi8-r")
+    assert read("Скандал") == "Скандал"
+
+    with pytest.raises(FetchRejected):
+        read(b"%PDF-1.4", headers={"Content-Type": "application/pdf"})
+    with pytest.raises(FetchRejected):
+        read(b"<html></html>", content_length=10_000)
+    with pytest.raises(FetchRejected):
+        read(b"x" * 1001, max_size=1000, content_length=None)
+
+
+def test_process_article_rejects_non_html():
+    import pymorphy3
+
+    class PdfSession(DummySession):
+        def get(self, url, timeout=None, headers=None):
+            return self._Resp(b"%PDF-1.4", headers={"Content-Type": "application/pdf"})
+
+    results: list[dict] = []
+    asyncio.run(process_article(
+        PdfSession(), pymorphy3.MorphAnalyzer(), ChargedWords(["шок"]),
+        "https://inosmi.ru/file.pdf", 0, results,
+    ))
+    assert results[0]["status"] == ProcessingStatus.FETCH_ERROR.value
+
+
+def test_process_article_retries_transient_fetch_errors(monkeypatch):
+    import pymorphy3
+    from fetch_policy import FetchPolicy
+
+    class FlakySession(DummySession):
+        def __init__(self, statuses):
+            super().__init__(ARTICLE_HTML)
+            self.statuses = list(statuses)
+            self.calls = 0
+
+        def get(self, url, timeout=None, headers=None):
+            self.calls += 1
+            status = self.statuses.pop(0) if self.statuses else 200
+            response = self._Resp(self._text, status=status)
+            if status >= 400:
+                def raise_for_status():
+                    raise aiohttp.ClientResponseError(None, (), status=status)
+                response.raise_for_status = raise_for_status
+            return response
+
+    policy = FetchPolicy(retries=2, backoff_base=0.001)
+    monkeypatch.setattr("main.FETCH_POLICY", policy)
+    morph, charged_words = pymorphy3.MorphAnalyzer(), ChargedWords(["шок"])
+
+    session, results = FlakySession([503, 502]), []
+    asyncio.run(process_article(session, morph, charged_words, "https://inosmi.ru/flaky.html", 0, results))
+    assert results[0]["status"] == ProcessingStatus.OK.value
+    assert session.calls == 3 and policy.stats()["retried"] == 2
+
+    # 404 не временная ошибка: второй попытки нет
+    session, results = FlakySession([404]), []
+    asyncio.run(process_article(session, morph, charged_words, "https://inosmi.ru/gone.html", 0, results))
+    assert results[0]["status"] == ProcessingStatus.FETCH_ERROR.value
+    assert session.calls == 1
+
+    status, body = asyncio.run(_request(create_app(), "/stats"))
+    assert status == 200 and "fetch" in body
+
+
+def test_metrics_endpoint(monkeypatch):
+    import pymorphy3
+    from metrics import ARTICLES, STAGE_SECONDS
+
+    ok_before = ARTICLES.value(status="OK")
+    fetches_before = STAGE_SECONDS.count(stage="fetch")
+    results: list[dict] = []
+    asyncio.run(process_article(
+        DummySession(ARTICLE_HTML), pymorphy3.MorphAnalyzer(), ChargedWords(["шок"]),
+        "https://inosmi.ru/metrics.html", 0, results,
+    ))
+    assert ARTICLES.value(status="OK") == ok_before + 1
+    assert STAGE_SECONDS.count(stage="fetch") == fetches_before + 1
+
+    status, content_type, body = asyncio.run(_request_text(create_app(), "/metrics"))
+    assert status == 200
+    assert content_type == "text/plain; version=0.0.4; charset=utf-8"
+    for stage in ("fetch", "sanitize", "lemmatize", "score"):
+        assert f'jaundice_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'jaundice_host_articles_total{host="inosmi.ru",status="OK"}' in body
+    assert "jaundice_articles_in_flight 0" in body
+    assert "jaundice_queue_depth 0" in body
+    assert "jaundice_lemma_cache_hits_total" in body
+
+
+def test_metrics_skip_lemma_cache_with_pool(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "ANALYSIS_WORKERS", 1)
+    status, _content_type, body = asyncio.run(_request_text(create_app(), "/metrics"))
+    assert status == 200
+    # кэш лемм главного процесса при пуле не отражает работу воркеров
+    assert "jaundice_lemma_cache" not in body
+    status, stats = asyncio.run(_request(create_app(), "/stats"))
+    assert stats["analysis_workers"] == 1 and stats["lemma_cache"] is None
+
+
+def test_prefork_restarts_crashed_worker():
+    import json as json_lib
+    import os
+    import signal
+    import socket
+    import subprocess
+    import sys
+    import time
+    import urllib.request
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    def get_pid():
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as resp:
+            return json_lib.load(resp)["pid"]
+
+    def wait_for(predicate, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                value = predicate()
+                if value:
+                    return value
+            except OSError:
+                pass
+            time.sleep(0.1)
+        raise AssertionError("сервер не ответил вовремя")
+
+    master = subprocess.Popen([sys.executable, "server.py", "--port", str(port), "--workers", "2"])
+    try:
+        first_pid = wait_for(get_pid)
+        started_at = time.time()
+        assert first_pid != master.pid
+
+        os.kill(first_pid, signal.SIGKILL)
+        # мастер поднимает замену; соединения тем временем принимает второй воркер
+        wait_for(lambda: get_pid() != first_pid)
+        seen = {get_pid() for _ in range(20)}
+        assert first_pid not in seen
+
+        # словарь загружен мастером до fork, а не каждым воркером заново — и в заменённом воркере тоже
+        loaded_at = {}
+
+        def both_workers_seen():
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as resp:
+                stats = json_lib.load(resp)
+            loaded_at[stats["pid"]] = stats["dictionary"]["loaded_at"]
+            return len(loaded_at) == 2
+
+        wait_for(both_workers_seen)
+        assert len(set(loaded_at.values())) == 1 and max(loaded_at.values()) < started_at
+
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=30) == 0
+    finally:
+        if master.poll() is None:
+            master.kill()
+
+
+def test_prefork_sighup_replaces_workers_without_gap():
+    import json as json_lib
+    import os
+    import signal
+    import socket
+    import subprocess
+    import sys
+    import time
+    import urllib.request
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    def get_stats():
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as resp:
+            return json_lib.load(resp)
+
+    def wait_for(predicate, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                value = predicate()
+                if value:
+                    return value
+            except OSError:
+                pass
+            time.sleep(0.1)
+        raise AssertionError("сервер не ответил вовремя")
+
+    master = subprocess.Popen([sys.executable, "server.py", "--port", str(port), "--workers", "2"])
+    try:
+        old = wait_for(get_stats)
+        old_pids = {get_stats()["pid"] for _ in range(20)}
+        reloaded_after = time.time()
+        os.kill(master.pid, signal.SIGHUP)
+
+        # пока воркеры меняются, каждый запрос получает ответ: старый уходит только после готовности нового
+        new_stats = {}
+        deadline = time.monotonic() + 60
+        while len(new_stats) < 2 and time.monotonic() < deadline:
+            stats = get_stats()
+            if stats["pid"] not in old_pids:
+                new_stats[stats["pid"]] = stats
+        assert len(new_stats) == 2
+        # preload выполнен заново: новые воркеры получили словарь, загруженный мастером после SIGHUP
+        loaded_at = {stats["dictionary"]["loaded_at"] for stats in new_stats.values()}
+        assert len(loaded_at) == 1 and old["dictionary"]["loaded_at"] < reloaded_after < loaded_at.pop()
+
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=30) == 0
+    finally:
+        if master.poll() is None:
+            master.kill()
+
+
+def test_analyze_rejects_when_queue_is_full(monkeypatch):
+    import server
+    from scheduler import Scheduler
+
+    urls = [f"https://inosmi.ru/q{i}.html" for i in range(3)]
+    _patch_call_process_with_delays(monkeypatch, {url: 0.2 for url in urls})
+    monkeypatch.setattr(server, "Scheduler", lambda: Scheduler(concurrency=1, max_queue=1, host_rate=0))
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            busy = asyncio.ensure_future(client.get(f"/analyze?urls={urls[0]},{urls[1]}"))
+            await asyncio.sleep(0.05)
+            rejected = await client.get(f"/analyze?urls={urls[2]}")
+            body = await rejected.json()
+            first = await busy
+            return rejected.status, rejected.headers.get("Retry-After"), body, first.status
+        finally:
+            await client.close()
+
+    status, retry_after, body, first_status = asyncio.run(scenario())
+    assert status == 503
+    assert retry_after == str(server.RETRY_AFTER)
+    assert "overloaded" in body["error"]
+    assert first_status == 200
+
+
+def test_bulk_admission_does_not_starve_get(monkeypatch):
+    import server
+    from scheduler import Scheduler
+
+    bulk_urls = [f"https://inosmi.ru/bulk{i}.html" for i in range(20)]
+    get_url = "https://inosmi.ru/get.html"
+    _patch_call_process_with_delays(monkeypatch, dict.fromkeys([*bulk_urls, get_url], 0.05))
+    monkeypatch.setattr(server, "Scheduler", lambda: Scheduler(
+        concurrency=1, max_queue=1, max_bulk_queue=len(bulk_urls), host_rate=0,
+    ))
+
+    async def scenario():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            bulk = asyncio.ensure_future(client.post("/analyze", json=bulk_urls))
+            await asyncio.sleep(0.05)
+            get = await client.get(f"/analyze?urls={get_url}")
+            second_bulk = await client.post("/analyze", json=bulk_urls[:1])
+            first_bulk = await bulk
+            return get.status, second_bulk.status, first_bulk.status
+        finally:
+            await client.close()
+
+    # пачка заняла всё место пакетных запросов, но не место обычных
+    assert asyncio.run(scenario()) == (200, 503, 200)
+
+
+def test_analyze_cancels_work_when_client_disconnects(monkeypatch):
+    import server
+    from metrics import ARTICLES, ARTICLES_IN_FLIGHT
+
+    cancelled = []
+
+    async def endless_fetch(_session, url):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+
+    monkeypatch.setattr("main.fetch", endless_fetch)
+    fetch_errors_before = ARTICLES.value(status="FETCH_ERROR")
+
+    async def scenario():
+        app = create_app()
+        # отмену обработчика при разрыве соединения TestServer включает сам, как run_app в server.py
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.get("/analyze?urls=https://inosmi.ru/gone.html",
+                                 timeout=aiohttp.ClientTimeout(total=0.2))
+            for _ in range(50):
+                if cancelled:
+                    break
+                await asyncio.sleep(0.02)
+            return app[server.SCHEDULER].stats()
+        finally:
+            await client.close()
+
+    monkeypatch.setattr(server, "ResultCache", lambda: None)
+    stats = asyncio.run(scenario())
+    assert cancelled == ["https://inosmi.ru/gone.html"]
+    assert stats["admitted"] == 0 and stats["in_flight"] == 0
+    assert ARTICLES_IN_FLIGHT.value() == 0
+    assert ARTICLES.value(status="FETCH_ERROR") == fetch_errors_before
+
+
+def test_process_article_deadline_covers_fetch(monkeypatch):
+    import time
+    import pymorphy3
+
+    async def slow_fetch(_session, _url):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr("main.fetch", slow_fetch)
+
+    async def scenario():
+        results: list[dict] = []
+        deadline = asyncio.get_running_loop().time() + 0.2
+        await process_article(DummySession(), pymorphy3.MorphAnalyzer(), ChargedWords(["шок"]),
+                              "https://inosmi.ru/slow.html", 0, results, deadline=deadline)
+        return results[0]
+
+    start = time.monotonic()
+    rec = asyncio.run(scenario())
+    assert rec["status"] == ProcessingStatus.TIMEOUT.value
+    assert time.monotonic() - start < 1
+
+
+def test_process_article_fast_scoring_matches_full(monkeypatch, tmp_path):
+    import pymorphy3
+    from store import AnalysisStore
+    from text_tools import ChargedForms
+
+    morph = pymorphy3.MorphAnalyzer()
+    charged_words = ChargedWords(["скандал", "шок"])
+    forms = ChargedForms.expand(morph, charged_words)
+    store = AnalysisStore(tmp_path / "fast.sqlite3")
+
+    def analyze_text_forbidden(*_args):
+        raise AssertionError("в быстром режиме статья не лемматизируется")
+
+    full: list[dict] = []
+    asyncio.run(process_article(DummySession(ARTICLE_HTML), morph, charged_words,
+                                "https://inosmi.ru/full.html", 0, full))
+    monkeypatch.setattr("main.analyze_text", analyze_text_forbidden)
+    fast: list[dict] = []
+    asyncio.run(process_article(DummySession(ARTICLE_HTML), morph, charged_words,
+                                "https://inosmi.ru/fast.html", 0, fast, forms=forms, store=store))
+
+    assert fast[0]["status"] == ProcessingStatus.OK.value
+    for key in ("score", "words_count", "hits"):
+        assert fast[0][key] == full[0][key]
+    assert store.get("https://inosmi.ru/fast.html") is None
+    store.close()
+
+
+def test_load_charged_words_phrases_and_dictionaries(tmp_path):
+    import pymorphy3
+    from main import load_charged_words
+
+    dict_dir = tmp_path / "dict"
+    dict_dir.mkdir()
+    (dict_dir / "negative.txt").write_text("скандалы\nсобачий холод\nизмена (супруга)\n", encoding="utf-8")
+    (dict_dir / "positive.txt").write_text("медовый месяц, подарки\n", encoding="utf-8")
+
+    words = load_charged_words(dict_dir, pymorphy3.MorphAnalyzer(), cache_path=tmp_path / "cache.json")
+    assert words.dictionaries == {
+        "negative": {"скандал", "собачий холод", "измена"},
+        "positive": {"медовый месяц", "подарок"},
+    }
+    assert "холод" not in words and "супруга" not in words
+    cached = load_charged_words(dict_dir, None, cache_path=tmp_path / "cache.json")
+    assert cached.dictionaries == words.dictionaries
+
+
+def test_process_article_scores_phrases_through_store(monkeypatch, tmp_path):
+    import pymorphy3
+    from store import AnalysisStore
+
+    html = ARTICLE_HTML.replace("и шок", "и медовый месяц в собачий холод")
+    charged_words = ChargedWords(dictionaries={
+        "negative": ["скандал", "собачий холод"],
+        "positive": ["медовый месяц"],
+    })
+    store = AnalysisStore(str(tmp_path / "store.sqlite3"))
+    morph = pymorphy3.MorphAnalyzer()
+
+    def run(url):
+        results: list[dict] = []
+        asyncio.run(process_article(DummySession(html), morph, charged_words, url, 0, results, store=store))
+        return results[0]
+
+    first = run("https://inosmi.ru/phrases.html")
+    assert first["hits"] == {"скандал": 2, "собачий холод": 1, "медовый месяц": 1}
+    assert first["words_count"] == 8
+    assert first["score"] == 50.0
+    assert first["scores"] == {"negative": 37.5, "positive": 12.5}
+
+    # тот же текст берётся из хранилища: фразы не теряются без повторной лемматизации
+    monkeypatch.setattr("main.analyze_text", None)
+    second = run("https://inosmi.ru/phrases-copy.html")
+    for key in ("hits", "score", "scores", "words_count"):
+        assert second[key] == first[key]
+    store.close()
+
+
+def test_bulk_scores_saved_pages_and_resumes(tmp_path):
+    import shutil
+    import bulk
+
+    pages = tmp_path / "archive"
+    pages.mkdir()
+    corpus = main.Path(__file__).resolve().parent / "benchmarks" / "corpus"
+    for name in ("short-0.html", "short-1.html"):
+        shutil.copy(corpus / name, pages / name)
+    (pages / "canonical.html").write_text(
+        ARTICLE_HTML.replace("<head>", '<head><link rel="canonical" href="https://inosmi.ru/c.html">'),
+        encoding="utf-8",
+    )
+    sources = [f"{pages}\n", f"{tmp_path / 'missing.html'}\n"]
+    charged_words = ChargedWords(["скандал", "шок", "россия"])
+    output = tmp_path / "out.jsonl"
+
+    with output.open("w", encoding="utf-8") as out:
+        summary = bulk.run_bulk(bulk.iter_sources(sources), out, charged_words,
+                                workers=2, batch_size=2, site="inosmi.ru")
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+
+    assert summary["processed"] == 4 and summary["skipped"] == 0
+    assert summary["statuses"] == {"OK": 3, "FETCH_ERROR": 1}
+    assert summary["words"] == sum(rec["words_count"] or 0 for rec in records) > 0
+    by_source = {rec["source"]: rec for rec in records}
+    assert by_source[str(pages / "canonical.html")]["url"] == "https://inosmi.ru/c.html"
+    assert by_source[str(pages / "canonical.html")]["hits"] == {"скандал": 2, "шок": 1}
+    assert by_source[str(pages / "short-0.html")]["url"].startswith("file://")
+    assert by_source[str(tmp_path / "missing.html")]["status"] == "FETCH_ERROR"
+
+    # повторный прогон с контрольной точкой ничего не пересчитывает
+    with output.open("a", encoding="utf-8") as out:
+        resumed = bulk.run_bulk(bulk.iter_sources(sources), out, charged_words, workers=1,
+                                site="inosmi.ru", done=bulk.load_done(output))
+    assert resumed["processed"] == 0 and resumed["skipped"] == 4
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 4
+
+
+def test_bulk_records_failed_batches_and_continues(monkeypatch, tmp_path):
+    import bulk
+
+    async def broken_process_article(_session, _morph, _charged_words, url, *_args, **_kwargs):
+        if url.endswith("bad.html"):
+            raise KeyError("b")
+
+    # воркеры пула — fork текущего процесса, поэтому подмена действует и в них
+    monkeypatch.setattr(bulk, "process_article", broken_process_article)
+    sources = [str(tmp_path / "bad.html"), str(tmp_path / "good.html")]
+    output = tmp_path / "out.jsonl"
+
+    with output.open("w", encoding="utf-8") as out:
+        summary = bulk.run_bulk(sources, out, ChargedWords(["шок"]), workers=1, batch_size=1)
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+
+    assert summary["statuses"] == {"ERROR": 1}
+    assert records[0]["source"] == sources[0] and "KeyError" in records[0]["error"]
+    assert bulk.load_done(output) == set()
+
+
+def test_process_article_reuses_scores_of_near_duplicate(monkeypatch):
+    import pymorphy3
+    from dedup import NearDuplicateIndex
+
+    body = " ".join(f"Громкий скандал номер {i} и шок в городе {i}." for i in range(40))
+    original = f"<html><body><article class='article'><h1>Скандал</h1><p>{body}</p></article></body></html>"
+    copy = original.replace("<p>", "<p>Перепечатано с inosmi.ru. ")
+    morph = pymorphy3.MorphAnalyzer()
+    charged_words = ChargedWords(["скандал", "шок"])
+    dedup = NearDuplicateIndex(similarity=0.8)
+
+    def run(html, url):
+        results: list[dict] = []
+        asyncio.run(process_article(DummySession(html), morph, charged_words, url, 0, results, dedup=dedup))
+        return results[0]
+
+    first = run(original, "https://inosmi.ru/original.html")
+    assert first["duplicate_of"] is None
+
+    monkeypatch.setattr("main.analyze_text", None)
+    second = run(copy, "https://inosmi.ru/copy.html")
+    assert second["status"] == ProcessingStatus.OK.value
+    assert second["duplicate_of"]["url"] == "https://inosmi.ru/original.html"
+    assert second["duplicate_of"]["similarity"] >= 0.8
+    for key in ("score", "words_count", "hits", "scores"):
+        assert second[key] == first[key]
+
+    third = run(original, "https://inosmi.ru/original-2.html")
+    assert third["duplicate_of"] == {"url": "https://inosmi.ru/original.html", "similarity": 1.0}
+    assert dedup.stats()["exact_hits"] == 1 and dedup.stats()["near_hits"] == 1
+    # записи, которых больше нет в словаре, из результатов исходного текста не берутся
+    charged_words = ChargedWords(["шок"])
+    fourth = run(copy.replace("inosmi.ru.", "inosmi.ru!"), "https://inosmi.ru/copy-3.html")
+    assert fourth["hits"] == {"шок": 40} and fourth["words_count"] == first["words_count"]
+
+
+def test_dictionary_hot_reload_rescores_cached_results(monkeypatch, tmp_path):
+    import server
+    from main import DictionaryHolder
+
+    dict_dir = tmp_path / "dict"
+    dict_dir.mkdir()
+    (dict_dir / "negative.txt").write_text("скандал\n", encoding="utf-8")
+    fetches, analyses = [], []
+    real_analyze_text = main.analyze_text
+
+    async def fake_fetch_conditional(_session, url, validators=None):
+        fetches.append(url)
+        return ARTICLE_HTML, {}
+
+    async def counting_analyze_text(*args):
+        analyses.append(1)
+        return await real_analyze_text(*args)
+
+    monkeypatch.setattr("main.fetch_conditional", fake_fetch_conditional)
+    monkeypatch.setattr("main.analyze_text", counting_analyze_text)
+    monkeypatch.setattr(server, "DICT_RELOAD_INTERVAL", 0.05)
+
+    async def scenario():
+        app = create_app()
+        app[server.DICTIONARY] = DictionaryHolder(dict_dir, cache_path=tmp_path / "cache.json")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            url = "/analyze?urls=https://inosmi.ru/x.html"
+            first = (await (await client.get(url)).json())[0]
+
+            (dict_dir / "positive.txt").write_text("шок\n", encoding="utf-8")
+            reload = await (await client.post("/admin/reload-dictionary")).json()
+            second = (await (await client.get(url)).json())[0]
+            again = await (await client.post("/admin/reload-dictionary")).json()
+
+            # изменение файла подхватывается и без эндпоинта
+            (dict_dir / "positive.txt").write_text("шок\nгромкий\n", encoding="utf-8")
+            await asyncio.sleep(0.5)
+            third = (await (await client.get(url)).json())[0]
+            stats = await (await client.get("/stats")).json()
+            return first, reload, second, again, third, stats
+        finally:
+            await client.close()
+
+    first, reload, second, again, third, stats = asyncio.run(scenario())
+
+    assert first["hits"] == {"скандал": 2} and first["cached"] is False
+    assert reload["reloaded"] is True and reload["dictionaries"] == {"negative": 1, "positive": 1}
+    assert second["cached"] is True
+    assert second["hits"] == {"скандал": 2, "шок": 1}
+    assert second["scores"] == {"negative": first["score"], "positive": round(first["score"] / 2, 2)}
+    assert again["reloaded"] is False
+    assert third["hits"] == {"скандал": 2, "шок": 1, "громкий": 2}
+    assert stats["dictionary"]["reloads"] == 2
+    # пересчёт без сети и морфологии
+    assert len(fetches) == 1 and len(analyses) == 1
+
+
+def test_process_article_approximates_long_text(monkeypatch):
+    import random
+    import pymorphy3
+    from result_cache import ResultCache
+
+    monkeypatch.setattr("main.APPROX_WORDS", 5000)
+    monkeypatch.setattr("main.APPROX_BACKGROUND", True)
+    rng = random.Random(0)
+    sentences = ["Громкий скандал потряс город.", "Жители спокойно обсуждают новости весь день."]
+    text = " ".join(rng.choice(sentences) for _ in range(10_000))
+    monkeypatch.setattr("main.pick_sanitizer", lambda _url: lambda html, plaintext=True: text)
+
+    cache = ResultCache()
+    url = "https://inosmi.ru/book.html"
+
+    async def scenario():
+        record = await main.analyze_article(
+            DummySession(), pymorphy3.MorphAnalyzer(), ChargedWords(["скандал"]), url, 0, cache=cache,
+        )
+        await asyncio.gather(*main._BACKGROUND_TASKS)
+        return record
+
+    record = asyncio.run(scenario())
+    assert record["status"] == ProcessingStatus.OK.value
+    assert record["approximate"] is True
+    low, high = record["score_ci"]
+    assert low <= record["score"] <= high
+
+    # фоновый полный анализ заменил оценку в кэше точным результатом
+    exact = cache.get(url).record
+    assert exact["approximate"] is False and exact["score_ci"] is None
+    assert low <= exact["score"] <= high
+    assert abs(record["words_count"] - exact["words_count"]) / exact["words_count"] < 0.05
+    # hits приблизительного результата — оценка для всего текста, а не вхождения выборки
+    assert abs(record["hits"]["скандал"] - exact["hits"]["скандал"]) / exact["hits"]["скандал"] < 0.2
@@ -5,7 +5,40 @@ except ImportError:
 
 '''AttributeError: module 'inspect' has no attribute 'getargspec'. Did you mean: 'getargs'?'''
 import asyncio
+import re
 import string
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
+
+LEMMA_CACHE_SIZE = 100_000
+
+
+_morph = None
+_morph_lock = threading.Lock()
+
+
+def get_morph():
+    """Общий MorphAnalyzer процесса; создаётся при первом обращении.
+
+    Строится под блокировкой: предзагрузка в executor и первый запрос, пришедший
+    раньше её окончания, получают один и тот же объект, а не строят каждый свой.
+    """
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                _morph = pymorphy2.MorphAnalyzer()
+    return _morph
+
+
+# Слово — непрерывный кусок без пробелов, с которого срезана пунктуация по краям
+# (внутренняя остаётся: «во-первых», «т.е»). Кавычки-ёлочки и многоточие
+# выкидываются из всего текста заранее. Это то же, что split() + _clean_word,
+# но без промежуточного списка и нескольких строк на каждый токен.
+_PUNCT = re.escape(string.punctuation)
+WORD_RE = re.compile(rf'[^\s{_PUNCT}]+(?:[{_PUNCT}]+[^\s{_PUNCT}]+)*')
 
 
 def _clean_word(word):
@@ -15,6 +48,56 @@ def _clean_word(word):
     return word
 
 
+class LemmaCache:
+    """Ограниченный LRU-кэш нормальных форм, ключ — очищенное слово."""
+
+    def __init__(self, maxsize: int = LEMMA_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def lemmatize(self, morph, word: str) -> str:
+        try:
+            normal_form = self._data[word]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._data.move_to_end(word)
+            return normal_form
+
+        self.misses += 1
+        normal_form = morph.parse(word)[0].normal_form
+        if self.maxsize > 0:
+            self._data[word] = normal_form
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return normal_form
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Общий кэш: переиспользуется между статьями и запросами к серверу.
+LEMMA_CACHE = LemmaCache()
+
+
 # def split_by_words(morph, text):
 #     """Учитывает знаки пунктуации, регистр и словоформы, выкидывает предлоги."""
 #     words = []
@@ -24,18 +107,77 @@ def _clean_word(word):
 #         if len(normalized_word) > 2 or normalized_word == 'не':
 #             words.append(normalized_word)
 #     return words
-async def split_by_words(morph, text, yield_every: int = 500):
-    """Асинхронно разбивает текст на леммы.
+def iter_words(text):
+    """Потоково отдаёт очищенные от пунктуации слова текста."""
+    text = text.replace('«', '').replace('»', '').replace('…', '')
+    for match in WORD_RE.finditer(text):
+        yield match.group()
+
+
+def _iter_lemma_batches(morph, text, cache=None, batch_words: int = 500, deadline=None):
+    """Значимые леммы текста по порядку, пачками по batch_words слов (0 — весь текст одной пачкой).
+
+    Между пачками асинхронный разбор уступает цикл событий, а синхронный проверяет
+    deadline (момент по time.time()), после которого разбор прерывается TimeoutError.
+    Нормальные формы берутся из cache (по умолчанию общий LEMMA_CACHE).
+    """
+    if cache is None:
+        cache = LEMMA_CACHE
+    words = iter_words(text)
+    while True:
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError('analysis deadline exceeded')
+        batch = [cache.lemmatize(morph, word) for word in islice(words, batch_words or None)]
+        if not batch:
+            return
+        yield [normalized_word for normalized_word in batch if _is_significant(normalized_word)]
+
+
+def _is_significant(normalized_word):
+    return len(normalized_word) > 2 or normalized_word == 'не'
+
+
+def _count_batch(lemma_counts, batch, scan):
+    lemma_counts.update(batch)
+    if scan is not None:
+        for normalized_word in batch:
+            scan.feed(normalized_word)
+
+
+async def count_lemmas(morph, text, yield_every: int = 500, cache=None, scan=None):
+    """Асинхронно считает частоты значимых лемм текста, не собирая список слов.
+
+    Нормальные формы берутся из cache (по умолчанию общий LEMMA_CACHE).
+    scan (ChargedWords.scan()) получает те же леммы по порядку — в том же проходе
+    ищутся записи словарей, включая фразы.
+    """
+    lemma_counts = Counter()
+    for batch in _iter_lemma_batches(morph, text, cache, yield_every):
+        _count_batch(lemma_counts, batch, scan)
+        await asyncio.sleep(0)
+    return lemma_counts
+
+
+def count_lemmas_sync(morph, text, cache=None, deadline=None, check_every: int = 500, scan=None):
+    """Синхронный вариант count_lemmas для воркеров пула процессов.
+
+    deadline — момент по time.time(), после которого разбор прерывается TimeoutError.
+    """
+    lemma_counts = Counter()
+    for batch in _iter_lemma_batches(morph, text, cache, check_every, deadline):
+        _count_batch(lemma_counts, batch, scan)
+    return lemma_counts
+
+
+async def split_by_words(morph, text, yield_every: int = 500, cache=None):
+    """Асинхронно разбивает текст на леммы; список нужен, только если важен порядок слов.
+
+    Нормальные формы берутся из cache (по умолчанию общий LEMMA_CACHE).
     """
     words = []
-    for i, word in enumerate(text.split()):
-        cleaned_word = _clean_word(word)
-        normalized_word = morph.parse(cleaned_word)[0].normal_form
-        if len(normalized_word) > 2 or normalized_word == 'не':
-            words.append(normalized_word)
-
-        if yield_every and i % yield_every == 0:
-            await asyncio.sleep(0)
+    for batch in _iter_lemma_batches(morph, text, cache, yield_every):
+        words.extend(batch)
+        await asyncio.sleep(0)
     return words
 
 
@@ -45,19 +187,409 @@ def test_split_by_words():
     assert asyncio.run(split_by_words(morph, '«Удивительно, но это стало началом!»')) == ['удивительно', 'это', 'стать', 'начало']
 
 
-def calculate_jaundice_rate(article_words, charged_words):
-    """Расчитывает желтушность текста, принимает список "заряженных" слов и ищет их внутри article_words."""
+def test_iter_words_matches_clean_word():
+    text = '«Удивительно, но — это...» стало (началом)! Во-первых, т.е. … "a,b" ?! -'
+    expected = [word for word in map(_clean_word, text.split()) if word]
+    assert list(iter_words(text)) == expected
+
+
+def test_count_lemmas():
+    import pytest
+
+    morph = pymorphy2.MorphAnalyzer()
+    text = 'Хочет, хочет «стало» началом и'
+    expected = Counter(asyncio.run(split_by_words(morph, text)))
+    assert asyncio.run(count_lemmas(morph, text)) == expected == {'хотеть': 2, 'стать': 1, 'начало': 1}
+    assert count_lemmas_sync(morph, text) == expected
+    # границы пачек не меняют результат, просроченный deadline прерывает разбор
+    assert count_lemmas_sync(morph, text, check_every=1) == count_lemmas_sync(morph, text, check_every=0) == expected
+    with pytest.raises(TimeoutError):
+        count_lemmas_sync(morph, text, deadline=time.time() - 1)
+
+
+def test_get_morph_builds_once_under_concurrency(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    built = []
+
+    def slow_analyzer():
+        time.sleep(0.05)
+        built.append(object())
+        return built[-1]
+
+    monkeypatch.setattr(pymorphy2, "MorphAnalyzer", slow_analyzer)
+    monkeypatch.setattr(f"{__name__}._morph", None)
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: get_morph(), range(8)))
+    assert len(built) == 1
+    assert all(result is built[0] for result in results)
+
+def test_lemma_cache():
+    morph = pymorphy2.MorphAnalyzer()
+    cache = LemmaCache(maxsize=2)
+    words = asyncio.run(split_by_words(morph, 'хочет хочет стало началом', cache=cache))
+    assert words == ['хотеть', 'хотеть', 'стать', 'начало']
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 3, 'evictions': 1}
+
+
+DEFAULT_DICTIONARY = 'charged'
+
+
+class DictionaryScan:
+    """Состояние прохода словарей ChargedWords по потоку лемм одной статьи.
+
+    Записи не пересекаются: из вхождений, начинающихся раньше, берётся самое левое,
+    из начинающихся в одном месте — самое длинное («медовый месяц» целиком, а не ещё
+    и «месяц» внутри него). Каждая лемма статьи попадает не больше чем в одну запись,
+    поэтому рейтинг не превышает 100. Пока начатая фраза может продолжиться,
+    её леммы ждут в _pending; hits досчитывает этот хвост, поэтому читать его нужно
+    после того, как скормлены все леммы.
+    """
+
+    __slots__ = ('_ids', '_goto', '_entries', '_state', '_pending', '_longest', '_hits')
+
+    def __init__(self, charged_words):
+        self._ids = charged_words._ids
+        self._goto = charged_words._goto
+        self._entries = charged_words._entries
+        self._state = 0
+        self._pending = []
+        self._longest = None
+        self._hits = Counter()
+
+    def feed(self, lemma):
+        lemma_id = self._ids.get(lemma)
+        if lemma_id is None:
+            # леммы нет ни в одной записи: никакая фраза не может её пересечь
+            self._flush()
+            return
+        self._push(lemma_id)
+
+    def _push(self, lemma_id):
+        pending = self._pending
+        while True:
+            state = self._goto[self._state].get(lemma_id)
+            if state is not None:
+                pending.append(lemma_id)
+                self._state = state
+                entry = self._entries[state]
+                if entry is not None:
+                    self._longest = (len(pending), entry)
+                    if not self._goto[state]:
+                        # длиннее записи с этого места нет
+                        self._resolve()
+                return
+            if not pending:
+                # с этой леммы начинается только середина фраз
+                return
+            self._resolve()
+
+    def _resolve(self):
+        """Засчитывает самую длинную запись с начала _pending и заново проходит остаток."""
+        pending = self._pending
+        length, entry = self._longest or (1, None)
+        if entry is not None:
+            self._hits[entry] += 1
+        rest = pending[length:]
+        pending.clear()
+        self._state = 0
+        self._longest = None
+        for lemma_id in rest:
+            self._push(lemma_id)
+
+    def _flush(self):
+        while self._pending:
+            self._resolve()
+
+    @property
+    def hits(self):
+        """Counter найденных записей, включая фразу, которой закончился поток."""
+        self._flush()
+        return self._hits
 
-    if not article_words:
+
+class ChargedWords:
+    """Скомпилированные словари «заряженных» слов и фраз.
+
+    Запись словаря — лемма или фраза из нескольких лемм через пробел. Все записи
+    всех словарей собраны в один префиксный граф над номерами лемм, поэтому
+    статья проверяется за один проход по её леммам (см. scan) независимо
+    от размера словарей, а найденные записи потом раскладываются по словарям.
+
+    version — метка исходных файлов (load_charged_words ставит хэш их содержимого):
+    результаты, посчитанные с другой версией, пересчитываются по частотам лемм.
+    """
+
+    __slots__ = (
+        'dictionaries', 'version', '_entry_dictionaries', '_words', '_phrases', '_ids', '_goto', '_entries',
+    )
+
+    def __init__(self, words=(), dictionaries=None, version=None):
+        self.version = version
+        if dictionaries is None:
+            dictionaries = {DEFAULT_DICTIONARY: words}
+        self.dictionaries = {name: frozenset(entries) for name, entries in dictionaries.items()}
+        entry_dictionaries = {}
+        for name, entries in self.dictionaries.items():
+            for entry in entries:
+                entry_dictionaries.setdefault(entry, []).append(name)
+        self._entry_dictionaries = {entry: tuple(names) for entry, names in entry_dictionaries.items()}
+        self._words = frozenset(entry for entry in self._entry_dictionaries if ' ' not in entry)
+        self._phrases = frozenset(self._entry_dictionaries) - self._words
+        self._build(sorted(self._entry_dictionaries))
+
+    def _build(self, entries):
+        ids = {}
+        goto = [{}]
+        terminal = [None]
+        for entry in entries:
+            state = 0
+            for lemma in entry.split(' '):
+                lemma_id = ids.setdefault(lemma, len(ids))
+                next_state = goto[state].get(lemma_id)
+                if next_state is None:
+                    next_state = goto[state][lemma_id] = len(goto)
+                    goto.append({})
+                    terminal.append(None)
+                state = next_state
+            terminal[state] = entry
+
+        self._ids = ids
+        self._goto = goto
+        self._entries = terminal
+
+    @classmethod
+    def compile(cls, words):
+        return words if isinstance(words, cls) else cls(words)
+
+    def scan(self):
+        return DictionaryScan(self)
+
+    def match(self, lemmas):
+        """Counter записей словарей, найденных в последовательности лемм."""
+        scan = self.scan()
+        for lemma in lemmas:
+            scan.feed(lemma)
+        return scan.hits
+
+    @property
+    def words(self):
+        """Записи из одной леммы."""
+        return self._words
+
+    @property
+    def phrases(self):
+        """Записи из нескольких лемм."""
+        return self._phrases
+
+    def dictionary_scores(self, hits, words_count):
+        """Рейтинг по каждому словарю отдельно."""
+        totals = dict.fromkeys(self.dictionaries, 0)
+        for entry, count in hits.items():
+            for name in self._entry_dictionaries.get(entry, ()):
+                totals[name] += count
+        return {name: round(total / words_count * 100, 2) if words_count else 0.0
+                for name, total in totals.items()}
+
+    def __contains__(self, word):
+        return word in self._words
+
+    def __len__(self):
+        return len(self._entry_dictionaries)
+
+    def __iter__(self):
+        return iter(sorted(self._entry_dictionaries))
+
+    def __repr__(self):
+        return f'<ChargedWords: {len(self)} entries in {len(self.dictionaries)} dictionaries>'
+
+
+def score_hits(hits, words_count):
+    """Рейтинг по найденным записям: каждое вхождение записи — одно попадание."""
+    if not words_count:
         return 0.0
+    return round(sum(hits.values()) / words_count * 100, 2)
+
+
+def phrase_hits(hits):
+    """Вхождения фраз из hits: их нельзя восстановить по частотам лемм, поэтому они хранятся отдельно."""
+    return Counter({entry: count for entry, count in hits.items() if ' ' in entry})
+
+
+def score_words(article_words, charged_words):
+    """Считает желтушность за один проход по article_words.
+
+    Возвращает (score, hits), где hits — Counter найденных записей словарей.
+    """
+    charged_words = ChargedWords.compile(charged_words)
+    hits = charged_words.match(article_words)
+    return score_hits(hits, len(article_words)), hits
+
+
+def score_lemma_counts(lemma_counts, charged_words, phrase_counts=None):
+    """Как score_words, но по частотам лемм: (score, hits) без исходного списка слов.
+
+    Фразы по частотам не найти, их вхождения берутся из phrase_counts
+    (phrase_hits сохранённого анализа) — только те, что есть в словарях сейчас.
+    Леммы внутри этих фраз, как и при проходе scan, отдельными словами не считаются.
+    """
+    charged_words = ChargedWords.compile(charged_words)
+    hits = Counter({word: count for word, count in lemma_counts.items() if word in charged_words})
+    if phrase_counts:
+        phrases = charged_words.phrases
+        found = {entry: count for entry, count in phrase_counts.items() if entry in phrases}
+        covered = Counter()
+        for entry, count in found.items():
+            for lemma in entry.split(' '):
+                covered[lemma] += count
+        hits -= covered
+        hits.update(found)
+    return score_hits(hits, sum(lemma_counts.values())), hits
+
+
+class ChargedForms:
+    """Все словоформы «заряженных» лемм: форма -> лемма.
+
+    Строится один раз при загрузке словаря, после чего статью можно оценить
+    по поверхностным формам слов, без морфологического разбора каждого токена.
+    """
+
+    __slots__ = ('_lemmas',)
+
+    def __init__(self, forms):
+        self._lemmas = dict(forms)
+
+    @classmethod
+    def expand(cls, morph, charged_words):
+        """Фразы в быстром режиме не ищутся: раскрываются только записи из одной леммы."""
+        forms = {}
+        for lemma in sorted(ChargedWords.compile(charged_words).words):
+            for parsed in morph.parse(lemma):
+                if parsed.normal_form != lemma:
+                    continue
+                for form in parsed.lexeme:
+                    word = form.word
+                    forms.setdefault(word, lemma)
+                    forms.setdefault(word.replace('ё', 'е'), lemma)
+        return cls(forms)
+
+    def lemma_of(self, word):
+        return self._lemmas.get(word)
+
+    def __len__(self):
+        return len(self._lemmas)
+
+    def __repr__(self):
+        return f'<ChargedForms: {len(self._lemmas)} forms>'
 
-    found_charged_words = [word for word in article_words if word in set(charged_words)]
 
-    score = len(found_charged_words) / len(article_words) * 100
+def score_text_fast(text, charged_forms):
+    """Быстрая оценка без лемматизации: (words_count, score, hits).
+
+    «Заряженные» слова ищутся по словоформам, а значимость слова для общего
+    счёта определяется по длине самой словоформы, а не леммы, поэтому
+    words_count и score немного расходятся с полным анализом.
+    """
+    hits = Counter()
+    words_count = 0
+    lemma_of = charged_forms.lemma_of
+    text = text.lower().replace('«', '').replace('»', '').replace('…', '')
+    # без морфологии узким местом становится токенизация, а split() + strip() здесь
+    # заметно быстрее WORD_RE и даёт те же слова (см. test_iter_words_matches_clean_word)
+    for word in text.split():
+        word = word.strip(string.punctuation)
+        if len(word) > 2 or word == 'не':
+            words_count += 1
+        lemma = lemma_of(word)
+        if lemma is not None:
+            hits[lemma] += 1
+
+    if not words_count:
+        return 0, 0.0, hits
+
+    score = sum(hits.values()) / words_count * 100
+    return words_count, round(score, 2), hits
 
-    return round(score, 2)
+
+def calculate_jaundice_rate(article_words, charged_words):
+    """Расчитывает желтушность текста, принимает список "заряженных" слов и ищет их внутри article_words."""
+    score, _hits = score_words(article_words, charged_words)
+    return score
 
 
 def test_calculate_jaundice_rate():
     assert -0.01 < calculate_jaundice_rate([], []) < 0.01
     assert 33.0 < calculate_jaundice_rate(['все', 'аутсайдер', 'побег'], ['аутсайдер', 'банкротство']) < 34.0
+
+
+def test_score_words_hits():
+    charged_words = ChargedWords(['аутсайдер', 'банкротство'])
+    assert 'аутсайдер' in charged_words and 'побег' not in charged_words
+    score, hits = score_words(['аутсайдер', 'побег', 'аутсайдер', 'банкротство'], charged_words)
+    assert score == 75.0
+    assert hits == {'аутсайдер': 2, 'банкротство': 1}
+
+
+def test_score_lemma_counts():
+    lemma_counts = Counter(['аутсайдер', 'побег', 'аутсайдер', 'банкротство'])
+    assert score_lemma_counts(lemma_counts, ['аутсайдер', 'банкротство']) == (75.0, {'аутсайдер': 2, 'банкротство': 1})
+    assert score_lemma_counts(Counter(), ['аутсайдер']) == (0.0, {})
+
+
+def test_score_text_fast():
+    morph = pymorphy2.MorphAnalyzer()
+    charged_forms = ChargedForms.expand(morph, ['скандал', 'шок'])
+    assert charged_forms.lemma_of('скандалами') == 'скандал'
+    assert charged_forms.lemma_of('побег') is None
+
+    text = 'Очередной «скандал»: шоком стали скандалы, о них пишут'
+    words_count, score, hits = score_text_fast(text, charged_forms)
+    lemma_counts = count_lemmas_sync(morph, text, cache=LemmaCache())
+    assert hits == score_lemma_counts(lemma_counts, ['скандал', 'шок'])[1] == {'скандал': 2, 'шок': 1}
+    assert words_count == sum(lemma_counts.values()) == 7
+    assert score == 42.86
+
+
+def test_charged_words_phrase_automaton():
+    charged_words = ChargedWords(dictionaries={
+        'negative': ['скандал', 'собачий холод', 'холод'],
+        'positive': ['медовый месяц', 'месяц', 'новый год'],
+    })
+    assert 'скандал' in charged_words and 'медовый месяц' not in charged_words
+    assert charged_words.phrases == {'собачий холод', 'медовый месяц', 'новый год'}
+
+    lemmas = ['медовый', 'медовый', 'месяц', 'стоять', 'собачий', 'холод', 'новый', 'скандал', 'год', 'месяц']
+    hits = charged_words.match(lemmas)
+    # «месяц» и «холод» внутри найденных фраз отдельно не считаются
+    assert hits == {'медовый месяц': 1, 'месяц': 1, 'собачий холод': 1, 'скандал': 1}
+    assert charged_words.dictionary_scores(hits, len(lemmas)) == {'negative': 20.0, 'positive': 20.0}
+    assert score_words(lemmas, charged_words) == (40.0, hits)
+
+
+def test_phrases_leftmost_longest():
+    charged_words = ChargedWords(['а б в', 'б в г', 'б', 'в г д е'])
+    # самое левое вхождение побеждает, даже если справа начинается более длинное
+    assert charged_words.match(['а', 'б', 'в', 'г', 'д', 'е']) == {'а б в': 1}
+    assert charged_words.match(['а', 'б', 'а', 'б', 'в']) == {'б': 1, 'а б в': 1}
+    # незаконченная фраза в конце потока и перед чужой леммой распадается на слова
+    assert charged_words.match(['а', 'б']) == charged_words.match(['а', 'б', 'х']) == {'б': 1}
+    assert charged_words.match(['б', 'в', 'г', 'д']) == {'б в г': 1}
+
+    # каждая лемма — не больше чем в одной записи, рейтинг не выше 100
+    nested = ChargedWords(['медовый месяц', 'медовый', 'месяц'])
+    assert score_words(['медовый', 'месяц'], nested) == (50.0, {'медовый месяц': 1})
+    lemma_counts = Counter(['медовый', 'месяц', 'месяц'])
+    assert score_lemma_counts(lemma_counts, nested, {'медовый месяц': 1}) == (
+        66.67, {'медовый месяц': 1, 'месяц': 1},
+    )
+
+
+def test_count_lemmas_scans_phrases():
+    morph = pymorphy2.MorphAnalyzer()
+    charged_words = ChargedWords(['медовый месяц', 'скандал'])
+    scan = charged_words.scan()
+    lemma_counts = count_lemmas_sync(morph, 'Скандал в медовый месяц: медовые месяцы и скандалы', scan=scan)
+    assert scan.hits == {'медовый месяц': 2, 'скандал': 2}
+    assert score_lemma_counts(lemma_counts, charged_words, phrase_hits(scan.hits)) == (
+        score_hits(scan.hits, sum(lemma_counts.values())), scan.hits,
+    )